@@ -2,10 +2,21 @@ import os
 import json
 import re
 import csv
+import sqlite3
+import threading
 from datetime import datetime
 from models import AIEvaluation, AIRating
+from shared_state import VersionWatch, set_config
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to unlocked appends
+    fcntl = None
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+#Where a key set through the admin endpoint is kept; outside the database, so backups never contain it
+GEMINI_API_KEY_FILE = os.getenv("GEMINI_API_KEY_FILE", os.path.join(os.path.dirname(__file__), ".gemini_api_key"))
+GEMINI_MODEL = "gemini-3-flash-preview"
 CSV_FILE = "gemini_responses.csv"
 
 EVALUATION_PROMPT = """You are an AI judge evaluating peer responses in a programming help forum.
@@ -43,13 +54,29 @@ Respond in JSON format:
 class GeminiJudge:
     def __init__(self, api_key: str = None):
         self.api_key = api_key or GEMINI_API_KEY
-        self.client = None
-        self._initialize()
-        self._init_csv()
+        #The SDK import, client and CSV log are set up on first use, not at construction
+        self._client = None
+        self._initialized = False
+        self._csv_ready = False
+        self._init_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._initialize()
+                    self._initialized = True
+        return self._client
     
     def _init_csv(self):
         if not os.path.exists(CSV_FILE):
-            with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
+            try:
+                #'x' fails if another worker created the file first, so the header is written once
+                f = open(CSV_FILE, 'x', newline='', encoding='utf-8')
+            except FileExistsError:
+                return
+            with f:
                 writer = csv.writer(f)
                 writer.writerow([
                     'timestamp',
@@ -77,8 +104,14 @@ class GeminiJudge:
         raw_response: str,
         evaluation: AIEvaluation
     ):
+        if not self._csv_ready:
+            self._init_csv()
+            self._csv_ready = True
         try:
             with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
+                #Workers share the log file, so hold an exclusive lock while appending
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
                 writer = csv.writer(f)
                 writer.writerow([
                     datetime.now().isoformat(),
@@ -100,9 +133,9 @@ class GeminiJudge:
         try:
             from google import genai
             if self.api_key and self.api_key != "YOUR_GEMINI_API_KEY_HERE":
-                self.client = genai.Client(api_key=self.api_key)
+                self._client = genai.Client(api_key=self.api_key)
             else:
-                self.client = genai.Client()
+                self._client = genai.Client()
             print("Gemini AI Judge initialized successfully")
         except ImportError:
             print("google-genai not installed. Run: pip install google-genai")
@@ -129,17 +162,13 @@ class GeminiJudge:
             raw_response = "MOCK_EVALUATION"
         else:
             try:
-                prompt = EVALUATION_PROMPT.format(
-                    question_title=question_title,
-                    question_description=question_description,
-                    code_snippet=code_snippet or "No code provided",
-                    concept_involved=concept_involved,
-                    hint_guidance=hint_guidance,
-                    what_to_try_next=what_to_try_next or "Not provided"
+                prompt = self._build_prompt(
+                    question_title, question_description, code_snippet,
+                    concept_involved, hint_guidance, what_to_try_next
                 )
                 
                 response = self.client.models.generate_content(
-                    model="gemini-3-flash-preview",
+                    model=GEMINI_MODEL,
                     contents=prompt
                 )
                 raw_response = response.text
@@ -162,6 +191,50 @@ class GeminiJudge:
         
         return evaluation
     
+    async def evaluate_response_async(
+        self,
+        question_title: str,
+        question_description: str,
+        code_snippet: str,
+        concept_involved: str,
+        hint_guidance: str,
+        what_to_try_next: str
+    ) -> AIEvaluation:
+        #Unlike evaluate_response, API errors are raised so batch callers can back off and retry
+        prompt = self._build_prompt(
+            question_title, question_description, code_snippet,
+            concept_involved, hint_guidance, what_to_try_next
+        )
+        response = await self.client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt
+        )
+        evaluation = self._parse_response(response.text)
+        self._log_to_csv(
+            question_title, question_description, code_snippet,
+            concept_involved, hint_guidance, what_to_try_next,
+            response.text, evaluation
+        )
+        return evaluation
+    
+    def _build_prompt(
+        self,
+        question_title: str,
+        question_description: str,
+        code_snippet: str,
+        concept_involved: str,
+        hint_guidance: str,
+        what_to_try_next: str
+    ) -> str:
+        return EVALUATION_PROMPT.format(
+            question_title=question_title,
+            question_description=question_description,
+            code_snippet=code_snippet or "No code provided",
+            concept_involved=concept_involved,
+            hint_guidance=hint_guidance,
+            what_to_try_next=what_to_try_next or "Not provided"
+        )
+    
     def _parse_response(self, response_text: str) -> AIEvaluation:
         try:
             json_match = re.search(r'\{[^{}]*\}', response_text, re.DOTALL)
@@ -183,8 +256,8 @@ class GeminiJudge:
             karma_change=1
         )
     
+    @staticmethod
     def _mock_evaluate(
-        self,
         question_title: str,
         question_description: str,
         code_snippet: str,
@@ -273,13 +346,52 @@ class GeminiJudge:
             )
 
 
-ai_judge = GeminiJudge()
+#Built on first use so importing this module stays cheap
+ai_judge = None
+
+#The judge's provider and version live in shared_config so every worker process uses the same judge;
+#the key itself is only ever in the environment or GEMINI_API_KEY_FILE
+_judge_watch = VersionWatch("ai_judge")
+_judge_lock = threading.Lock()
+
+
+def _read_key_file():
+    try:
+        with open(GEMINI_API_KEY_FILE, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_key_file(api_key: str):
+    #Readable by the server's user only; replaced atomically so workers never read half a key
+    temp_path = f"{GEMINI_API_KEY_FILE}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(api_key)
+    os.replace(temp_path, GEMINI_API_KEY_FILE)
 
 
 def get_ai_judge() -> GeminiJudge:
+    global ai_judge
+    try:
+        changed = _judge_watch.changed()
+    except sqlite3.Error:
+        #Schema not created yet (e.g. CLI tools), keep the env-configured judge
+        changed = False
+    if ai_judge is None or changed:
+        with _judge_lock:
+            if ai_judge is None or changed:
+                #A key set through the admin endpoint (version > 0) wins over GEMINI_API_KEY
+                api_key = _read_key_file() if _judge_watch.seen else None
+                ai_judge = GeminiJudge(api_key=api_key)
     return ai_judge
 
 
 def configure_ai_judge(api_key: str, provider: str = "gemini"):
     global ai_judge
-    ai_judge = GeminiJudge(api_key=api_key)
\ No newline at end of file
+    with _judge_lock:
+        _write_key_file(api_key)
+        ai_judge = GeminiJudge(api_key=api_key)
+        version = set_config({"ai_judge.provider": provider}, version_name="ai_judge")
+        _judge_watch.mark(version)
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""Archival of closed questions into a cold-storage database.
+
+Closed questions (with their responses and instructor answers) are moved in
+chunked transactions into `<shard>_archive.db`, which is ATTACHed to the live
+connection as `archive`. Their contribution to the dashboard and leaderboard
+is folded into the `archive_*` aggregate tables of the live database first,
+so analytics stay the same while the hot tables stay small. (Misconception
+clusters already hold their share, see misconceptions.py.)
+
+Usage:
+    python archive.py --before 2025-01-01 [--course cs101] [--chunk-size 500]
+    python archive.py --restore 42 [--course cs101]
+"""
+import argparse
+import os
+from typing import Optional
+
+import rollups
+from database import get_connection
+
+ARCHIVE_ALIAS = "archive"
+ARCHIVED_TABLES = ["questions", "responses", "instructor_answers"]
+DEFAULT_CHUNK_SIZE = 500
+
+
+def attach_archive(conn, create: bool = True) -> bool:
+    #Attach the course's archive to `conn`; returns False if there is nothing to attach
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if ARCHIVE_ALIAS in attached:
+        return True
+    main_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    root, ext = os.path.splitext(main_path)
+    path = f"{root}_archive{ext or '.db'}"
+    if not create and not os.path.exists(path):
+        return False
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (path,))
+    _sync_archive_schema(conn)
+    return True
+
+
+def _columns(conn, schema: str, table: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _sync_archive_schema(conn):
+    #Mirror the live tables' columns, so schema changes to the hot tables carry over
+    for table in ARCHIVED_TABLES:
+        live = conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+        existing = _columns(conn, ARCHIVE_ALIAS, table)
+        if not existing:
+            columns = ", ".join(
+                f"{row[1]} {row[2]}" + (" PRIMARY KEY" if row[1] == "id" else "") for row in live
+            )
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_ALIAS}.{table} ({columns})")
+            continue
+        for row in live:
+            if row[1] not in existing:
+                conn.execute(f"ALTER TABLE {ARCHIVE_ALIAS}.{table} ADD COLUMN {row[1]} {row[2]}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.idx_archive_responses_question ON responses(question_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.idx_archive_answers_question ON instructor_answers(question_id)")
+    conn.commit()
+
+
+def _copy(conn, table: str, source: str, target: str, where: str, ids: list):
+    columns = ", ".join(_columns(conn, "main", table))
+    marks = ", ".join("?" * len(ids))
+    conn.execute(
+        f"INSERT OR REPLACE INTO {target}.{table} ({columns}) "
+        f"SELECT {columns} FROM {source}.{table} WHERE {where} IN ({marks})",
+        ids
+    )
+    conn.execute(f"DELETE FROM {source}.{table} WHERE {where} IN ({marks})", ids)
+
+
+def _apply_contribution(conn, schema: str, ids: list, sign: int):
+    """Add (sign=1) or remove (sign=-1) these questions' share of the aggregates.
+
+    `schema` is where the questions currently live.
+    """
+    marks = ", ".join("?" * len(ids))
+    conn.execute(f"""
+        INSERT INTO archive_totals
+            (category_id, question_count, response_count, helpful_count, unhelpful_count,
+             resolved_count, resolution_hours_total)
+        SELECT
+            q.category_id,
+            ? * COUNT(*),
+            ? * SUM((SELECT COUNT(*) FROM {schema}.responses r WHERE r.question_id = q.id)),
+            ? * SUM((SELECT COUNT(*) FROM {schema}.responses r WHERE r.question_id = q.id AND r.ai_rating = 'helpful')),
+            ? * SUM((SELECT COUNT(*) FROM {schema}.responses r WHERE r.question_id = q.id AND r.ai_rating = 'unhelpful')),
+            ? * SUM((SELECT COUNT(*) FROM {schema}.instructor_answers ia WHERE ia.question_id = q.id)),
+            ? * SUM((
+                SELECT COALESCE(SUM((julianday(ia.created_at) - julianday(q.created_at)) * 24), 0)
+                FROM {schema}.instructor_answers ia WHERE ia.question_id = q.id
+            ))
+        FROM {schema}.questions q
+        WHERE q.id IN ({marks})
+        GROUP BY q.category_id
+        ON CONFLICT(category_id) DO UPDATE SET
+            question_count = question_count + excluded.question_count,
+            response_count = response_count + excluded.response_count,
+            helpful_count = helpful_count + excluded.helpful_count,
+            unhelpful_count = unhelpful_count + excluded.unhelpful_count,
+            resolved_count = resolved_count + excluded.resolved_count,
+            resolution_hours_total = resolution_hours_total + excluded.resolution_hours_total
+    """, [sign] * 6 + ids)
+
+    conn.execute(f"""
+        INSERT INTO archive_user_totals (user_id, helpful_responses, unhelpful_responses)
+        SELECT
+            r.responder_id,
+            ? * SUM(r.ai_rating = 'helpful'),
+            ? * SUM(r.ai_rating = 'unhelpful')
+        FROM {schema}.responses r
+        WHERE r.question_id IN ({marks})
+        GROUP BY r.responder_id
+        ON CONFLICT(user_id) DO UPDATE SET
+            helpful_responses = helpful_responses + excluded.helpful_responses,
+            unhelpful_responses = unhelpful_responses + excluded.unhelpful_responses
+    """, [sign, sign] + ids)
+
+
+def archive_closed_questions(before, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                             course_id: Optional[str] = None) -> dict:
+    """Move questions closed before `before` into the archive, chunk by chunk.
+
+    A question counts as closed at the time of its instructor answer, or at
+    its creation time if it was closed without one.
+    """
+    #Stored timestamps are "YYYY-MM-DD HH:MM:SS" and compared as text, so "2025-01-01T00:00" must not go in as is
+    before = rollups.to_utc_naive(rollups.parse_timestamp(before)).strftime(rollups.TIMESTAMP_FORMAT)
+    conn = get_connection(course_id)
+    attach_archive(conn)
+    totals = {"questions": 0, "responses": 0, "instructor_answers": 0}
+    try:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [row["id"] for row in conn.execute("""
+                SELECT q.id FROM main.questions q
+                WHERE q.status = 'closed'
+                AND COALESCE(
+                    (SELECT MAX(ia.created_at) FROM main.instructor_answers ia WHERE ia.question_id = q.id),
+                    q.created_at
+                ) < ?
+                ORDER BY q.id
+                LIMIT ?
+            """, (before, chunk_size))]
+            if not ids:
+                conn.rollback()
+                break
+
+            _apply_contribution(conn, "main", ids, 1)
+            marks = ", ".join("?" * len(ids))
+            totals["responses"] += conn.execute(
+                f"SELECT COUNT(*) FROM main.responses WHERE question_id IN ({marks})", ids
+            ).fetchone()[0]
+            totals["instructor_answers"] += conn.execute(
+                f"SELECT COUNT(*) FROM main.instructor_answers WHERE question_id IN ({marks})", ids
+            ).fetchone()[0]
+            _copy(conn, "responses", "main", ARCHIVE_ALIAS, "question_id", ids)
+            _copy(conn, "instructor_answers", "main", ARCHIVE_ALIAS, "question_id", ids)
+            _copy(conn, "questions", "main", ARCHIVE_ALIAS, "id", ids)
+            conn.commit()
+            totals["questions"] += len(ids)
+    finally:
+        conn.close()
+    return totals
+
+
+def restore_question(question_id: int, course_id: Optional[str] = None) -> bool:
+    #Move one archived question (and its answers) back into the live tables
+    conn = get_connection(course_id)
+    try:
+        if not attach_archive(conn, create=False):
+            return False
+        conn.execute("BEGIN IMMEDIATE")
+        found = conn.execute(
+            f"SELECT 1 FROM {ARCHIVE_ALIAS}.questions WHERE id = ?", (question_id,)
+        ).fetchone()
+        if not found:
+            conn.rollback()
+            return False
+        _apply_contribution(conn, ARCHIVE_ALIAS, [question_id], -1)
+        _copy(conn, "questions", ARCHIVE_ALIAS, "main", "id", [question_id])
+        _copy(conn, "responses", ARCHIVE_ALIAS, "main", "question_id", [question_id])
+        _copy(conn, "instructor_answers", ARCHIVE_ALIAS, "main", "question_id", [question_id])
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive closed questions or restore one.")
+    parser.add_argument("--before", help="Archive questions closed before this timestamp (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("--restore", type=int, help="Restore the archived question with this ID")
+    parser.add_argument("--course", default=None, help="Course ID (default course if omitted)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.restore:
+        restored = restore_question(args.restore, course_id=args.course)
+        print(f"Question {args.restore} restored" if restored else f"Question {args.restore} is not archived")
+    elif args.before:
+        try:
+            rollups.parse_timestamp(args.before)
+        except ValueError:
+            parser.error("--before must be an ISO date or timestamp, e.g. 2025-01-01 or 2025-01-01T12:00")
+        print(f"Archived: {archive_closed_questions(args.before, args.chunk_size, course_id=args.course)}")
+    else:
+        parser.error("pass --before or --restore")
@@ -0,0 +1,331 @@
+"""Online snapshots of the course databases.
+
+Snapshots are taken with SQLite's online backup API while the API keeps
+serving: the copy advances PAGES_PER_STEP pages at a time and pauses between
+steps, so it only ever holds the source's lock for one short step. Every step
+is timed and the snapshot's manifest records the longest and total lock hold.
+
+If another connection writes to the database mid-copy, SQLite restarts the
+copy from the first page. After MAX_RESTARTS restarts (a busy database) the
+copy is redone in a single step instead; in WAL mode that step only holds a
+read snapshot, which doesn't block writers either.
+
+Each snapshot is a directory `<BACKUP_DIR>/<course>/<timestamp>/` with the
+course database, its archive database if it has one, and `manifest.json`.
+Copies are integrity-checked before the snapshot is published, optionally
+gzipped, and the newest BACKUP_KEEP snapshots per course are kept.
+
+Usage:
+    python backup.py [--course cs101] [--compress]
+    python backup.py --list [--course cs101]
+    python backup.py --verify 20250101-120000 [--course cs101]
+    python backup.py --restore 20250101-120000 [--course cs101]
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+from archive import ARCHIVED_TABLES
+from database import get_course_path, get_current_course, list_course_ids, open_connection
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(os.path.dirname(__file__), "backups"))
+#Snapshots kept per course; older ones are deleted after each new snapshot
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+#Minimum age of a course's newest snapshot before the background job takes another; 0 disables it
+BACKUP_INTERVAL_SECONDS = float(os.getenv("BACKUP_INTERVAL_SECONDS", str(6 * 3600)))
+BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "0") == "1"
+
+#Pages copied per step (4 KiB each) and the pause between steps that lets writers in
+PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+STEP_PAUSE_SECONDS = float(os.getenv("BACKUP_STEP_PAUSE_MS", "5")) / 1000
+MAX_RESTARTS = 3
+
+#How often the background job looks for courses whose newest snapshot is too old
+CHECK_INTERVAL_SECONDS = 600
+
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+MANIFEST = "manifest.json"
+
+
+class BackupError(Exception):
+    pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _archive_path(path: str) -> str:
+    #Same naming as archive.attach_archive
+    root, ext = os.path.splitext(path)
+    return f"{root}_archive{ext or '.db'}"
+
+
+def _course_dir(course_id: str) -> str:
+    return os.path.join(BACKUP_DIR, course_id)
+
+
+def _copy_database(source_path: str, target_path: str, pages: int, pause: float) -> dict:
+    """Copy a live database with the backup API, timing how long each step holds the lock."""
+    stats = {"steps": 0, "restarts": 0, "max_lock_ms": 0.0, "total_lock_ms": 0.0, "single_step": False}
+    last_remaining = None
+    step_start = 0.0
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining, step_start
+        held = (time.perf_counter() - step_start) * 1000
+        stats["steps"] += 1
+        stats["max_lock_ms"] = max(stats["max_lock_ms"], held)
+        stats["total_lock_ms"] += held
+        #The page count going back up means a write elsewhere made SQLite start over
+        if last_remaining is not None and remaining > last_remaining:
+            stats["restarts"] += 1
+            if stats["restarts"] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        if remaining and pause:
+            time.sleep(pause)
+        step_start = time.perf_counter()
+
+    source = open_connection(source_path)
+    target = sqlite3.connect(target_path)
+    started = time.perf_counter()
+    try:
+        try:
+            step_start = time.perf_counter()
+            source.backup(target, pages=pages, progress=progress)
+        except _TooManyRestarts:
+            stats["single_step"] = True
+            step_start = time.perf_counter()
+            source.backup(target, pages=-1, progress=progress)
+        #A snapshot is a single self-contained file, not a WAL database
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+    stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    stats["max_lock_ms"] = round(stats["max_lock_ms"], 2)
+    stats["total_lock_ms"] = round(stats["total_lock_ms"], 2)
+    return stats
+
+
+def _integrity_check(path: str) -> str:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    return "; ".join(row[0] for row in rows)
+
+
+def _gzip(path: str) -> str:
+    with open(path, "rb") as source, gzip.open(f"{path}.gz", "wb", compresslevel=6) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.remove(path)
+    return f"{path}.gz"
+
+
+def _new_snapshot_name(course_id: str) -> str:
+    name = datetime.now().strftime(TIMESTAMP_FORMAT)
+    candidate, n = name, 1
+    while os.path.exists(os.path.join(_course_dir(course_id), candidate)):
+        n += 1
+        candidate = f"{name}-{n}"
+    return candidate
+
+
+def take_snapshot(course_id: Optional[str] = None, compress: Optional[bool] = None,
+                  pages: int = PAGES_PER_STEP, pause: float = STEP_PAUSE_SECONDS) -> dict:
+    """Snapshot a course's database (and archive), verify it and apply retention.
+
+    Returns the snapshot's manifest.
+    """
+    course_id = course_id or get_current_course()
+    compress = BACKUP_COMPRESS if compress is None else compress
+    live_path = get_course_path(course_id)
+    sources = [("database", live_path)]
+    if os.path.exists(_archive_path(live_path)):
+        sources.append(("archive", _archive_path(live_path)))
+
+    name = _new_snapshot_name(course_id)
+    snapshot_dir = os.path.join(_course_dir(course_id), name)
+    #Built under a temporary name and renamed once complete, so a half-written snapshot is never listed
+    partial_dir = f"{snapshot_dir}.partial"
+    os.makedirs(partial_dir)
+    manifest = {
+        "name": name, "course_id": course_id, "created_at": datetime.now().isoformat(),
+        "compressed": compress, "files": [],
+    }
+    try:
+        for role, source_path in sources:
+            target_path = os.path.join(partial_dir, os.path.basename(source_path))
+            stats = _copy_database(source_path, target_path, pages, pause)
+            integrity = _integrity_check(target_path)
+            if integrity != "ok":
+                raise BackupError(f"Snapshot of {source_path} failed the integrity check: {integrity}")
+            if compress:
+                target_path = _gzip(target_path)
+            manifest["files"].append(dict(
+                stats, role=role, file=os.path.basename(target_path),
+                size_bytes=os.path.getsize(target_path), integrity=integrity,
+            ))
+        with open(os.path.join(partial_dir, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(partial_dir, snapshot_dir)
+    except BaseException:
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        raise
+    manifest["pruned"] = prune(course_id)
+    return manifest
+
+
+def prune(course_id: str, keep: int = BACKUP_KEEP) -> list:
+    #Delete all but the newest `keep` snapshots; returns the deleted names
+    names = [m["name"] for m in list_snapshots(course_id)]
+    stale = names[keep:] if keep > 0 else []
+    for name in stale:
+        shutil.rmtree(os.path.join(_course_dir(course_id), name), ignore_errors=True)
+    return stale
+
+
+def list_snapshots(course_id: Optional[str] = None) -> list:
+    """Manifests of a course's snapshots, newest first."""
+    course_dir = _course_dir(course_id or get_current_course())
+    if not os.path.isdir(course_dir):
+        return []
+    manifests = []
+    for name in os.listdir(course_dir):
+        path = os.path.join(course_dir, name, MANIFEST)
+        if name.endswith(".partial") or not os.path.exists(path):
+            continue
+        with open(path) as f:
+            manifests.append(json.load(f))
+    return sorted(manifests, key=lambda m: m["created_at"], reverse=True)
+
+
+def _load_manifest(course_id: str, name: str) -> Optional[dict]:
+    if os.path.basename(name) != name or name.endswith(".partial"):
+        return None
+    path = os.path.join(_course_dir(course_id), name, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _extract(course_id: str, name: str, entry: dict, work_dir: str) -> str:
+    #Plain, integrity-checked copy of one snapshot file inside work_dir
+    stored = os.path.join(_course_dir(course_id), name, entry["file"])
+    path = os.path.join(work_dir, entry["file"].removesuffix(".gz"))
+    if entry["file"].endswith(".gz"):
+        with gzip.open(stored, "rb") as source, open(path, "wb") as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    else:
+        shutil.copyfile(stored, path)
+    integrity = _integrity_check(path)
+    if integrity != "ok":
+        raise BackupError(f"{name}/{entry['file']} failed the integrity check: {integrity}")
+    return path
+
+
+def verify(name: str, course_id: Optional[str] = None) -> Optional[dict]:
+    """Re-check every file of a stored snapshot; None if there is no such snapshot."""
+    course_id = course_id or get_current_course()
+    manifest = _load_manifest(course_id, name)
+    if manifest is None:
+        return None
+    with tempfile.TemporaryDirectory() as work_dir:
+        for entry in manifest["files"]:
+            _extract(course_id, name, entry, work_dir)
+    return manifest
+
+
+def restore(name: str, course_id: Optional[str] = None) -> Optional[dict]:
+    """Replace a course's live data with a snapshot; None if there is no such snapshot.
+
+    The current data is snapshotted first. The copy goes through the backup
+    API into the live file, so connections other workers hold open see the
+    restored data on their next query.
+    """
+    course_id = course_id or get_current_course()
+    manifest = _load_manifest(course_id, name)
+    if manifest is None:
+        return None
+    live_path = get_course_path(course_id)
+    targets = {"database": live_path, "archive": _archive_path(live_path)}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        #Check everything before touching the live data
+        extracted = [(entry["role"], _extract(course_id, name, entry, work_dir)) for entry in manifest["files"]]
+        before = take_snapshot(course_id)
+        for role, path in extracted:
+            source = sqlite3.connect(path)
+            target = open_connection(targets[role])
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+
+    if "archive" not in {role for role, _ in extracted} and os.path.exists(targets["archive"]):
+        #Questions archived after the snapshot are live again in the restored database
+        conn = open_connection(targets["archive"])
+        for table in ARCHIVED_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+        conn.close()
+    return {"restored": name, "course_id": course_id, "previous_state": before["name"]}
+
+
+def snapshot_due_courses():
+    #Background job: snapshot every course whose newest snapshot is older than BACKUP_INTERVAL_SECONDS
+    for course_id in list_course_ids():
+        snapshots = list_snapshots(course_id)
+        if snapshots:
+            age = datetime.now() - datetime.fromisoformat(snapshots[0]["created_at"])
+            if age.total_seconds() < BACKUP_INTERVAL_SECONDS:
+                continue
+        manifest = take_snapshot(course_id)
+        lock = max(f["max_lock_ms"] for f in manifest["files"])
+        print(f"Snapshot {course_id}/{manifest['name']} taken (longest lock hold {lock:.1f} ms)")
+
+
+def _describe(manifest: dict) -> str:
+    lines = [f"{manifest['name']}  {manifest['created_at']}  compressed={manifest['compressed']}"]
+    for f in manifest["files"]:
+        lines.append(
+            f"  {f['file']:24} {f['size_bytes'] / 1024:10.1f} KiB  {f['steps']} steps, "
+            f"{f['restarts']} restarts, lock max {f['max_lock_ms']:.2f} ms / total {f['total_lock_ms']:.2f} ms, "
+            f"copy {f['duration_ms']:.0f} ms, integrity {f['integrity']}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot, verify or restore a course database.")
+    parser.add_argument("--course", default=None, help="Course ID (default course if omitted)")
+    parser.add_argument("--compress", action="store_true", help="gzip the snapshot files")
+    parser.add_argument("--list", action="store_true", help="List the course's snapshots")
+    parser.add_argument("--verify", metavar="NAME", help="Integrity-check a stored snapshot")
+    parser.add_argument("--restore", metavar="NAME", help="Restore the course from a snapshot")
+    args = parser.parse_args()
+
+    if args.list:
+        for snapshot in list_snapshots(args.course):
+            print(_describe(snapshot))
+    elif args.verify:
+        verified = verify(args.verify, args.course)
+        print(f"{args.verify} is intact" if verified else f"No snapshot named {args.verify}")
+    elif args.restore:
+        result = restore(args.restore, args.course)
+        print(f"Restored {args.restore}; previous data saved as {result['previous_state']}" if result
+              else f"No snapshot named {args.restore}")
+    else:
+        print(_describe(take_snapshot(args.course, compress=args.compress or None)))
@@ -0,0 +1,77 @@
+"""Write latency while an online snapshot is running, vs. without one.
+
+A writer thread keeps inserting rows while the main thread takes snapshots
+back to back; the same writer runs alone first as the baseline. Also prints
+the lock hold times each snapshot recorded.
+
+Usage: python benchmarks/bench_backup.py [--questions 20000] [--seconds 5] [--pages 256]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import seed_bulk, summarize, use_temp_database
+
+import backup
+import database
+
+
+def write_latencies(stop: threading.Event):
+    timings = []
+
+    def writer():
+        while not stop.is_set():
+            conn = database.get_connection()
+            start = time.perf_counter()
+            conn.execute("UPDATE questions SET status = status WHERE id = ?", (len(timings) % 1000 + 1,))
+            conn.commit()
+            timings.append((time.perf_counter() - start) * 1000)
+            conn.close()
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    return timings, thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=20000)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--pages", type=int, default=backup.PAGES_PER_STEP)
+    args = parser.parse_args()
+
+    use_temp_database()
+    seed_bulk(args.questions, 3, code_lines=20)
+    backup.BACKUP_DIR = tempfile.mkdtemp(prefix="forum-bench-backups-")
+    size = os.path.getsize(database.DATABASE_PATH) / 1024 / 1024
+    print(f"{args.questions} questions, {size:.1f} MiB database, {args.pages} pages per step")
+
+    stop = threading.Event()
+    timings, thread = write_latencies(stop)
+    time.sleep(args.seconds)
+    stop.set()
+    thread.join()
+    print(f"writes, no snapshot     {summarize(timings)}  max {max(timings):8.2f} ms  ({len(timings)} writes)")
+
+    stop = threading.Event()
+    timings, thread = write_latencies(stop)
+    snapshots = []
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        snapshots.append(backup.take_snapshot(compress=False, pages=args.pages))
+    stop.set()
+    thread.join()
+    print(f"writes, during snapshot {summarize(timings)}  max {max(timings):8.2f} ms  ({len(timings)} writes)")
+
+    files = [s["files"][0] for s in snapshots]
+    print(f"{len(snapshots)} snapshots: copy {max(f['duration_ms'] for f in files):.0f} ms max, "
+          f"lock hold max {max(f['max_lock_ms'] for f in files):.2f} ms per step, "
+          f"{sum(f['restarts'] for f in files)} restarts, "
+          f"{sum(f['single_step'] for f in files)} fell back to a single step")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Burst of concurrent response submissions with and without group commit.
+
+Simulates the end of a lab session: `--students` clients each submit
+`--per-student` responses as fast as they can. Reports writes/second,
+per-request latency and, for group commit, the average batch size.
+
+Usage: python benchmarks/bench_group_commit.py [--students 100] [--per-student 5] [--window-ms 2]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import seed_bulk, summarize, use_temp_database
+
+os.environ.setdefault("BACKGROUND_JOBS", "0")
+
+from fastapi.testclient import TestClient
+
+import database
+import group_commit
+from main import app
+
+HINT = "Think about what happens to the loop variable after the last iteration and print it."
+
+
+def burst(client, question_ids, responders, students: int, per_student: int):
+    def submit(n):
+        timings = []
+        for i in range(per_student):
+            question_id = question_ids[(n + i) % len(question_ids)]
+            start = time.perf_counter()
+            result = client.post(
+                f"/api/responses?responder_id={responders[n % len(responders)]}",
+                json={"question_id": question_id, "concept_involved": "Loops", "hint_guidance": HINT}
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+            assert result.status_code == 200, result.text
+        return timings
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=students) as pool:
+        timings = [t for per_client in pool.map(submit, range(students)) for t in per_client]
+    return time.perf_counter() - start, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--per-student", type=int, default=5)
+    parser.add_argument("--window-ms", type=float, default=2)
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    #The judge's CSV log goes next to the throwaway database
+    os.chdir(os.path.dirname(db_path))
+    seed_bulk(50, 0)
+    conn = database.get_connection()
+    #Questions asked by the instructor so that no student answers their own question
+    conn.execute("UPDATE questions SET student_id = (SELECT id FROM users WHERE role = 'instructor' LIMIT 1)")
+    conn.commit()
+    question_ids = [r["id"] for r in conn.execute("SELECT id FROM questions")]
+    responders = [r["id"] for r in conn.execute("SELECT id FROM users WHERE role = 'student'")]
+    conn.close()
+
+    group_commit.WINDOW_SECONDS = args.window_ms / 1000
+    total = args.students * args.per_student
+    print(f"{args.students} concurrent clients x {args.per_student} responses = {total} writes")
+    with TestClient(app) as client:
+        for label, enabled in (("per-request", False), ("group", True)):
+            group_commit.GROUP_COMMIT_ENABLED = enabled
+            elapsed, timings = burst(client, question_ids, responders, args.students, args.per_student)
+            line = f"{label:12} {total / elapsed:8.0f} writes/s   {summarize(timings)}"
+            if enabled:
+                writer = group_commit.get_writer()
+                line += f"   avg batch {writer.operations / max(writer.batches, 1):.1f}"
+            print(line)
+        group_commit.stop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Bytes on the wire and latency of GET /api/questions: full vs projected, plain vs compressed.
+
+Usage: python benchmarks/bench_payload.py [--questions 2000] [--code-lines 60] [--repeat 10]
+"""
+import argparse
+import os
+
+from common import seed_bulk, summarize, timed, use_temp_database
+
+os.environ.setdefault("BACKGROUND_JOBS", "0")
+
+from fastapi.testclient import TestClient
+
+import compression
+from main import app
+
+VARIANTS = [
+    ("full", {}),
+    ("summary", {"view": "summary"}),
+    ("fields", {"fields": "id,title,status,category_name,response_count"}),
+]
+ENCODINGS = ["identity", "gzip", "br"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--responses", type=int, default=3)
+    parser.add_argument("--code-lines", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    use_temp_database()
+    seed_bulk(args.questions, args.responses, code_lines=args.code_lines)
+    if not compression.BROTLI_AVAILABLE:
+        print("brotli not installed, skipping br")
+        ENCODINGS.remove("br")
+
+    print(f"{args.questions} questions with {args.code_lines * 2}-line code snippets, {args.repeat} runs each")
+    with TestClient(app) as client:
+        baseline = None
+        for label, params in VARIANTS:
+            for encoding in ENCODINGS:
+                headers = {"Accept-Encoding": encoding}
+                result = client.get("/api/questions", params=params, headers=headers)
+                #httpx transparently decodes; num_bytes_downloaded is what crossed the wire
+                wire = result.num_bytes_downloaded
+                baseline = baseline or wire
+                timings = timed(lambda: client.get("/api/questions", params=params, headers=headers), args.repeat)
+                print(f"{label:8} {encoding:9} {wire / 1024:10.1f} KiB  ({wire / baseline:6.1%})  {summarize(timings)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compare Pydantic re-validation against the fast row encoder on list endpoints.
+
+Usage: python benchmarks/bench_serialization.py [--questions 2000] [--responses 3] [--repeat 20]
+"""
+import argparse
+from typing import List
+
+from common import seed_bulk, summarize, timed, use_temp_database
+
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+import database
+import serialization
+from main import app
+from models import Question, Response
+
+ENDPOINTS = ["/api/questions", "/api/analytics/all-responses"]
+
+#Queries the two endpoints run, used to time encoding on its own
+QUERIES = {
+    "/api/questions": (Question, """
+        SELECT q.*, u.name as student_name, c.name as category_name, 0 as response_count
+        FROM questions q
+        JOIN users u ON q.student_id = u.id
+        JOIN categories c ON q.category_id = c.id
+        ORDER BY q.created_at DESC
+    """),
+    "/api/analytics/all-responses": (Response, """
+        SELECT r.*, u.name as responder_name
+        FROM responses r
+        JOIN users u ON r.responder_id = u.id
+        ORDER BY r.created_at DESC
+    """),
+}
+
+
+def bench_encoding_only(repeat: int):
+    #What FastAPI does with a response_model versus the fast encoder, same rows
+    conn = database.get_connection()
+    for endpoint, (model, query) in QUERIES.items():
+        rows = conn.execute(query).fetchall()
+        adapter = TypeAdapter(List[model])
+        convert = serialization.get_encoder(model).convert
+        pydantic_path = lambda: adapter.dump_json(adapter.validate_python([dict(r) for r in rows]))
+        fast_path = lambda: serialization.dumps([convert(r) for r in rows])
+        print(f"{endpoint:32} {'pydantic':9} {summarize(timed(pydantic_path, repeat))}  (encode only)")
+        print(f"{endpoint:32} {'fast':9} {summarize(timed(fast_path, repeat))}  (encode only)")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--responses", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    use_temp_database()
+    seed_bulk(args.questions, args.responses)
+    client = TestClient(app)
+
+    print(f"{args.questions} questions, {args.questions * args.responses} responses, {args.repeat} runs each (end to end)")
+    for endpoint in ENDPOINTS:
+        results = {}
+        for label, fast in (("pydantic", False), ("fast", True)):
+            serialization.FAST_SERIALIZATION = fast
+            results[label] = client.get(endpoint).json()
+            timings = timed(lambda: client.get(endpoint), args.repeat)
+            print(f"{endpoint:32} {label:9} {summarize(timings)}")
+        if results["pydantic"] != results["fast"]:
+            print(f"{endpoint:32} WARNING: payloads differ between paths")
+    bench_encoding_only(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Cold-start cost of a worker: imports, app startup and the first judge call.
+
+Every measurement runs in a fresh interpreter against a database that is
+already set up, which is what a restarted or newly forked worker sees.
+Exits non-zero if the median import + startup time is over --budget-ms.
+
+Usage: python benchmarks/bench_startup.py [--repeat 5] [--budget-ms 1500] [--importtime]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import use_temp_database
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Runs in the child process; prints one JSON object with cumulative timings in ms
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {backend!r})
+start = time.perf_counter()
+timings = {{}}
+def mark(label):
+    timings[label] = (time.perf_counter() - start) * 1000
+import database
+mark("import database")
+import ai_judge
+mark("import ai_judge")
+import main
+mark("import main")
+main.startup_event()
+mark("startup")
+ai_judge.get_ai_judge().evaluate_response("t", "d", "", "Loops", "Think about what happens when the loop ends.", "")
+mark("first judge call")
+print(json.dumps(timings))
+"""
+
+
+def probe(env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(backend=BACKEND_DIR)],
+        env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def importtime(env: dict, top: int = 15):
+    #Slowest imports by cumulative time, as reported by `python -X importtime`
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import main"],
+        env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), module.rstrip()))
+    print(f"\nSlowest imports (cumulative):")
+    for cumulative, module in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:8.1f} ms  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=db_path,
+        COURSE_DATA_DIR=os.path.join(os.path.dirname(db_path), "courses"),
+        BACKGROUND_JOBS="0",
+    )
+    #The judge's CSV log goes next to the throwaway database
+    os.chdir(os.path.dirname(db_path))
+
+    runs = [probe(env) for _ in range(args.repeat)]
+    print(f"Cold start, median of {args.repeat} fresh interpreters (cumulative):")
+    previous = 0.0
+    for label in runs[0]:
+        total = statistics.median(run[label] for run in runs)
+        print(f"{label:18} {total:8.1f} ms   (+{total - previous:.1f} ms)")
+        previous = total
+    if args.importtime:
+        importtime(env)
+
+    startup = statistics.median(run["startup"] for run in runs)
+    verdict = "within" if startup <= args.budget_ms else "OVER"
+    print(f"\nImport + startup {startup:.1f} ms, {verdict} the {args.budget_ms:.0f} ms budget")
+    if startup > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite file so they never touch forum.db.
+Run them from the backend directory, e.g. `python benchmarks/bench_serialization.py`.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+HINTS = [
+    "Think about what happens to the loop variable after the last iteration.",
+    "Consider the difference between a list and a tuple when you try to modify it.",
+    "Look at the scope of the variable inside the function body.",
+    "just google it",
+    "def fix(x):\n    return x + 1",
+]
+
+
+def use_temp_database():
+    #Point the app at a fresh database in a temp dir and create the schema
+    tmp_dir = tempfile.mkdtemp(prefix="forum-bench-")
+    database.DATABASE_PATH = os.path.join(tmp_dir, "forum.db")
+    database.init_database()
+    database.seed_data()
+    return database.DATABASE_PATH
+
+
+def seed_bulk(question_count: int, responses_per_question: int, code_lines: int = 10, seed: int = 42):
+    #Fill the current database with synthetic questions and responses
+    rng = random.Random(seed)
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    students = [r["id"] for r in cursor.execute("SELECT id FROM users WHERE role = 'student'")]
+    categories = [r["id"] for r in cursor.execute("SELECT id FROM categories")]
+    code = "\n".join(f"for i in range({n}):\n    total += i * {n}" for n in range(code_lines))
+
+    questions = []
+    for n in range(question_count):
+        questions.append((
+            rng.choice(students), rng.choice(categories),
+            f"Question {n}: why does my loop not stop?",
+            code,
+            "I expected the loop to terminate but it keeps running. " * 4,
+            rng.choice(["open", "open", "escalated", "closed"]),
+        ))
+    cursor.executemany("""
+        INSERT INTO questions (student_id, category_id, title, code_snippet, description, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, questions)
+
+    question_ids = [r["id"] for r in cursor.execute("SELECT id FROM questions")]
+    responses = []
+    for question_id in question_ids:
+        for _ in range(responses_per_question):
+            helpful = rng.random() < 0.7
+            responses.append((
+                question_id, rng.choice(students), "Loop termination",
+                rng.choice(HINTS), "Add a print inside the loop",
+                "helpful" if helpful else "unhelpful",
+                "Response provides constructive guidance." if helpful else "Response is too brief to be helpful.",
+                1 if helpful else 0, 1 if helpful else 0,
+            ))
+    cursor.executemany("""
+        INSERT INTO responses
+        (question_id, responder_id, concept_involved, hint_guidance, what_to_try_next,
+         ai_rating, ai_reason, is_visible, karma_awarded)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, responses)
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat: int):
+    #Run fn `repeat` times and return the per-call timings in milliseconds
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"median {statistics.median(ordered):8.2f} ms   p95 {p95:8.2f} ms"
@@ -0,0 +1,141 @@
+"""Negotiated response compression (brotli or gzip).
+
+Responses smaller than COMPRESSION_MIN_BYTES are sent as they are: below
+about a kilobyte the CPU and header overhead outweighs the saved bytes.
+Brotli is used when the client accepts it and the `brotli` package is
+installed, otherwise gzip.
+"""
+import gzip
+import importlib.util
+import os
+import zlib
+
+#brotli itself is imported by the first response that uses it, not when the app starts
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+#Brotli quality 4-5 compresses better than gzip -6 at a similar speed; 11 is far too slow per request
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def _accepted(headers) -> set:
+    for name, value in headers:
+        if name == b"accept-encoding":
+            encodings = set()
+            for part in value.decode("latin-1").split(","):
+                coding, _, params = part.partition(";")
+                params = params.replace(" ", "")
+                try:
+                    quality = float(params[2:]) if params.startswith("q=") else 1.0
+                except ValueError:
+                    quality = 1.0
+                #q=0 means "not acceptable"
+                if quality > 0:
+                    encodings.add(coding.strip().lower())
+            return encodings
+    return set()
+
+
+def choose_encoding(headers) -> str:
+    accepted = _accepted(headers)
+    if BROTLI_AVAILABLE and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return ""
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            import brotli
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            #wbits 31 = gzip container
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        self.encoding = encoding
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        import brotli
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses response bodies above a size threshold."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(scope.get("headers", []))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                #Hold the headers back until we know how big the body is
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = start["headers"]
+                already_encoded = any(name == b"content-encoding" for name, _ in headers)
+                if already_encoded or (not more_body and len(body) < self.minimum_size):
+                    await send(start)
+                    await send(message)
+                    start = None
+                    compressor = False
+                    return
+                headers = [(n, v) for n, v in headers if n != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    #Whole body in one message: compress it in one go and keep a content-length
+                    body = compress(body, encoding)
+                    headers.append((b"content-length", str(len(body)).encode()))
+                    await send(dict(start, headers=headers))
+                    await send({"type": "http.response.body", "body": body})
+                    start = None
+                    compressor = False
+                    return
+                await send(dict(start, headers=headers))
+                start = None
+                compressor = _Compressor(encoding)
+
+            if not compressor:
+                await send(message)
+                return
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
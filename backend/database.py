@@ -1,19 +1,218 @@
 import sqlite3
 from datetime import datetime
 from typing import Optional
+import contextvars
+import json
 import os
+import queue
+import re
+import threading
 
-DATABASE_PATH = os.path.join(os.path.dirname(__file__), "forum.db")
+DATABASE_PATH = os.getenv("DATABASE_PATH", os.path.join(os.path.dirname(__file__), "forum.db"))
 
-def get_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
+#Per-course shards live here, one SQLite file per course
+COURSE_DATA_DIR = os.getenv("COURSE_DATA_DIR", os.path.join(os.path.dirname(__file__), "courses"))
+
+#The course that uses DATABASE_PATH itself; it also holds the course registry
+DEFAULT_COURSE = "default"
+COURSE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+#How long a connection waits on another process' write lock before giving up
+BUSY_TIMEOUT_SECONDS = float(os.getenv("DATABASE_BUSY_TIMEOUT", "10"))
+
+#Idle connections kept open per shard
+POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "8"))
+
+#Stored in PRAGMA user_version once init_database has run; bump it whenever the schema below changes
+SCHEMA_VERSION = 3
+
+DEFAULT_USERS = [
+    ("Riya", "instructor"),
+    ("Amit", "instructor"),
+    ("Pooja", "student"),
+    ("Rahul", "student"),
+    ("Sneha", "student"),
+    ("Vikram", "student"),
+    ("Priya", "student"),
+    ("Arjun", "student"),
+]
+
+DEFAULT_CATEGORIES = [
+    "Variables",
+    "Loops",
+    "Functions",
+    "Data Structures",
+    "Conditionals",
+    "File Handling",
+    "Error Handling",
+    "Object-Oriented Programming",
+]
+
+class CourseNotFoundError(LookupError):
+    pass
+
+#Course the current request is routed to (set by tenancy.CourseRoutingMiddleware)
+_current_course = contextvars.ContextVar("current_course", default=DEFAULT_COURSE)
+
+def get_current_course() -> str:
+    return _current_course.get()
+
+def set_current_course(course_id: str):
+    return _current_course.set(course_id)
+
+def reset_current_course(token):
+    _current_course.reset(token)
+
+class PooledConnection(sqlite3.Connection):
+    #close() hands the connection back to its shard pool instead of closing it
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            return super().close()
+        self.pool.release(self)
+
+class ShardPool:
+    """Lazily opened, reusable connections to one shard file."""
+
+    #Swapped for profiler.ProfiledConnection when request profiling is on
+    connection_factory = PooledConnection
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = open_connection(self.path, factory=self.connection_factory, check_same_thread=False)
+            conn.pool = self
+            return conn
+
+    def release(self, conn: sqlite3.Connection):
+        #Never hand out a connection with someone else's transaction still open
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            sqlite3.Connection.close(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                sqlite3.Connection.close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+_pools = {}
+_pools_lock = threading.Lock()
+_course_files = {}
+
+def open_connection(path: str, **kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, **kwargs)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_database():
-    conn = get_connection()
+def get_connection(course_id: Optional[str] = None):
+    #Connection to the given course's shard, or to the course of the current request
+    course_id = course_id or _current_course.get()
+    path = get_course_path(course_id)
+    pool = _pools.get(path)
+    if pool is None:
+        pool = _open_shard(course_id, path)
+    return pool.acquire()
+
+def get_course_path(course_id: str) -> str:
+    if course_id == DEFAULT_COURSE:
+        return DATABASE_PATH
+    db_file = _course_files.get(course_id)
+    if db_file is None:
+        course = get_course(course_id)
+        if not course:
+            raise CourseNotFoundError(course_id)
+        db_file = _course_files[course_id] = course["db_file"]
+    return os.path.join(COURSE_DATA_DIR, db_file)
+
+def _open_shard(course_id: str, path: str) -> ShardPool:
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            if course_id != DEFAULT_COURSE:
+                #First use of this course's shard in this process: make sure it is set up
+                course = get_course(course_id)
+                os.makedirs(COURSE_DATA_DIR, exist_ok=True)
+                init_database(path)
+                seed_data(path, users=course["seed_users"], categories=course["seed_categories"])
+            pool = _pools[path] = ShardPool(path)
+        return pool
+
+def get_course(course_id: str) -> Optional[dict]:
+    conn = get_connection(DEFAULT_COURSE)
+    row = conn.execute("SELECT * FROM courses WHERE id = ?", (course_id,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    course = dict(row)
+    course["seed_users"] = json.loads(course["seed_users"]) if course["seed_users"] else None
+    course["seed_categories"] = json.loads(course["seed_categories"]) if course["seed_categories"] else None
+    return course
+
+def list_course_ids() -> list:
+    conn = get_connection(DEFAULT_COURSE)
+    rows = conn.execute("SELECT id FROM courses ORDER BY id").fetchall()
+    conn.close()
+    return [DEFAULT_COURSE] + [r["id"] for r in rows]
+
+def register_course(course_id: str, name: str, users: Optional[list] = None,
+                    categories: Optional[list] = None) -> dict:
+    #Add a course to the registry and create its shard with its own seed data
+    if not COURSE_ID_PATTERN.match(course_id) or course_id == DEFAULT_COURSE:
+        raise ValueError("Course ID must be 1-64 letters, digits, '-' or '_' and not 'default'")
+    conn = get_connection(DEFAULT_COURSE)
+    conn.execute("""
+        INSERT INTO courses (id, name, db_file, seed_users, seed_categories)
+        VALUES (?, ?, ?, ?, ?)
+    """, (
+        course_id, name, f"{course_id}.db",
+        json.dumps(users) if users else None,
+        json.dumps(categories) if categories else None
+    ))
+    conn.commit()
+    conn.close()
+    get_connection(course_id).close()
+    return get_course(course_id)
+
+def _add_column_if_missing(cursor, table: str, column: str, definition: str) -> bool:
+    #Bring tables created by older versions up to date; True if the column was added
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column in columns:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+def _schema_is_current(cursor) -> bool:
+    return cursor.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+def init_database(path: Optional[str] = None):
+    conn = open_connection(path or DATABASE_PATH)
     cursor = conn.cursor()
     
+    #Already set up by this version of the code: skip the DDL and migration checks
+    if _schema_is_current(cursor):
+        conn.close()
+        return
+    
+    #WAL lets readers in other worker processes proceed during writes
+    cursor.execute("PRAGMA journal_mode=WAL")
+    
+    #Serialize schema setup across workers that start at the same time
+    cursor.execute("BEGIN IMMEDIATE")
+    if _schema_is_current(cursor):
+        conn.close()
+        return
+    
     #Create Users table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -21,17 +220,21 @@ def init_database():
             name TEXT NOT NULL UNIQUE,
             role TEXT NOT NULL CHECK(role IN ('student', 'instructor')),
             karma INTEGER DEFAULT 0,
+            karma_event_id INTEGER NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    karma_ledger_added = _add_column_if_missing(cursor, "users", "karma_event_id", "INTEGER NOT NULL DEFAULT 0")
     
     #Create Categories table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS categories (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE
+            name TEXT NOT NULL UNIQUE,
+            auto_escalate_hours REAL
         )
     """)
+    _add_column_if_missing(cursor, "categories", "auto_escalate_hours", "REAL")
     
     #Create Questions table
     cursor.execute("""
@@ -44,10 +247,25 @@ def init_database():
             description TEXT NOT NULL,
             status TEXT DEFAULT 'open' CHECK(status IN ('open', 'escalated', 'closed')),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            escalate_at TIMESTAMP,
             FOREIGN KEY (student_id) REFERENCES users(id),
             FOREIGN KEY (category_id) REFERENCES categories(id)
         )
     """)
+    if _add_column_if_missing(cursor, "questions", "escalate_at", "TIMESTAMP"):
+        #Give open questions from before auto-escalation a deadline too
+        cursor.execute("""
+            UPDATE questions SET escalate_at = datetime(created_at, ?)
+            WHERE status = 'open' AND NOT EXISTS (
+                SELECT 1 FROM responses r WHERE r.question_id = questions.id AND r.ai_rating = 'helpful'
+            )
+        """, (f"+{float(os.getenv('AUTO_ESCALATE_HOURS', '24')) * 60:.0f} minutes",))
+    
+    #Due-date index for the auto-escalation scheduler (see escalation.py)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_questions_escalate_at
+        ON questions(escalate_at) WHERE escalate_at IS NOT NULL
+    """)
     
     #Create Responses table(peer responses)
     cursor.execute("""
@@ -81,13 +299,230 @@ def init_database():
         )
     """)
     
+    #Shared settings, visible to every worker process
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS shared_config (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    
+    #Change-notification counters, bumped whenever shared state changes
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS state_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    
+    #Aggregates carried forward from questions moved to the archive (see archive.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archive_totals (
+            category_id INTEGER PRIMARY KEY,
+            question_count INTEGER NOT NULL DEFAULT 0,
+            response_count INTEGER NOT NULL DEFAULT 0,
+            helpful_count INTEGER NOT NULL DEFAULT 0,
+            unhelpful_count INTEGER NOT NULL DEFAULT 0,
+            resolved_count INTEGER NOT NULL DEFAULT 0,
+            resolution_hours_total REAL NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archive_user_totals (
+            user_id INTEGER PRIMARY KEY,
+            helpful_responses INTEGER NOT NULL DEFAULT 0,
+            unhelpful_responses INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    
+    #Per-category analytics buckets (see rollups.py); sketches are JSON quantile sketches
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_rollups (
+            granularity TEXT NOT NULL CHECK(granularity IN ('hour', 'day', 'total')),
+            bucket_start TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            questions_created INTEGER NOT NULL DEFAULT 0,
+            questions_escalated INTEGER NOT NULL DEFAULT 0,
+            questions_answered INTEGER NOT NULL DEFAULT 0,
+            responses_created INTEGER NOT NULL DEFAULT 0,
+            helpful_responses INTEGER NOT NULL DEFAULT 0,
+            first_helpful_sketch TEXT,
+            instructor_answer_sketch TEXT,
+            PRIMARY KEY (granularity, category_id, bucket_start)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rollups_bucket
+        ON analytics_rollups(granularity, bucket_start)
+    """)
+    
+    #Misconception clusters built by misconceptions.py from unhelpful responses
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS misconception_clusters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            centroid BLOB NOT NULL,
+            occurrence_count INTEGER NOT NULL DEFAULT 0,
+            examples TEXT NOT NULL,
+            top_terms TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (category_id) REFERENCES categories(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_misconception_clusters_count
+        ON misconception_clusters(occurrence_count DESC)
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS misconception_state (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            last_response_id INTEGER NOT NULL,
+            doc_count INTEGER NOT NULL,
+            doc_freq BLOB NOT NULL
+        )
+    """)
+    
+    #Karma ledger and snapshot history (see karma.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS karma_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            response_id INTEGER,
+            delta INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (response_id) REFERENCES responses(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_karma_events_user ON karma_events(user_id, id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS karma_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            last_event_id INTEGER NOT NULL,
+            karma INTEGER NOT NULL,
+            taken_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_karma_snapshots_user ON karma_snapshots(user_id, taken_at)")
+    if karma_ledger_added:
+        #Open the ledger with each user's existing karma so it can be replayed from scratch.
+        #It was earned before the ledger existed, so date it to the account's creation, not to now
+        cursor.execute("""
+            INSERT INTO karma_events (user_id, delta, reason, created_at)
+            SELECT id, karma, 'opening balance', COALESCE(created_at, '1970-01-01 00:00:00')
+            FROM users WHERE karma != 0
+        """)
+        cursor.execute("""
+            UPDATE users SET karma_event_id = COALESCE(
+                (SELECT MAX(e.id) FROM karma_events e WHERE e.user_id = users.id), 0
+            )
+        """)
+    
+    #Instructor triage queue for escalated questions (see triage.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS triage_queue (
+            question_id INTEGER PRIMARY KEY,
+            category_id INTEGER NOT NULL,
+            rank_key REAL NOT NULL,
+            unhelpful_attempts INTEGER NOT NULL DEFAULT 0,
+            category_backlog INTEGER NOT NULL DEFAULT 0,
+            claimed_by INTEGER,
+            lease_expires_at REAL,
+            enqueued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (question_id) REFERENCES questions(id),
+            FOREIGN KEY (claimed_by) REFERENCES users(id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_triage_rank ON triage_queue(rank_key)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_triage_claimed
+        ON triage_queue(claimed_by) WHERE claimed_by IS NOT NULL
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_triage_category ON triage_queue(category_id)")
+    
+    #Progress of re-evaluation runs, so an interrupted run can resume (see reevaluate.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reevaluation_runs (
+            name TEXT PRIMARY KEY,
+            last_response_id INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            changed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    
+    #Results of write requests sent with an Idempotency-Key header (see idempotency.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT NOT NULL,
+            path TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL CHECK(status IN ('in_progress', 'done')),
+            owner TEXT,
+            locked_until REAL,
+            response_status INTEGER,
+            response_type TEXT,
+            response_body BLOB,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (key, path)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys(expires_at)")
+    
+    #Course registry and job leases, only kept in the main database
+    if path is None or path == DATABASE_PATH:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS job_leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS courses (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                db_file TEXT NOT NULL UNIQUE,
+                seed_users TEXT,
+                seed_categories TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        #Per-responder AI judge token buckets, shared by all workers (see judge_scheduler.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS judge_rate_buckets (
+                user_key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+    
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
     conn.close()
 
-def seed_data():
-    conn = get_connection()
+def seed_data(path: Optional[str] = None, users: Optional[list] = None,
+              categories: Optional[list] = None):
+    conn = open_connection(path or DATABASE_PATH)
     cursor = conn.cursor()
     
+    #Cheap read-only check first, so restarts don't queue for the write lock
+    cursor.execute("SELECT 1 FROM users LIMIT 1")
+    if cursor.fetchone():
+        conn.close()
+        return
+    
+    #Take the write lock before checking so only one worker seeds
+    cursor.execute("BEGIN IMMEDIATE")
+    
     #Check if data already exists
     cursor.execute("SELECT COUNT(*) FROM users")
     if cursor.fetchone()[0] > 0:
@@ -95,30 +530,12 @@ def seed_data():
         return
     
     #Seed Users
-    users = [
-        ("Riya", "instructor"),
-        ("Amit", "instructor"),
-        ("Pooja", "student"),
-        ("Rahul", "student"),
-        ("Sneha", "student"),
-        ("Vikram", "student"),
-        ("Priya", "student"),
-        ("Arjun", "student"),
-    ]
-    cursor.executemany("INSERT INTO users (name, role) VALUES (?, ?)", users)
+    users = users or DEFAULT_USERS
+    cursor.executemany("INSERT INTO users (name, role) VALUES (?, ?)", [tuple(u) for u in users])
     
     #Seed Categories
-    categories = [
-        ("Variables",),
-        ("Loops",),
-        ("Functions",),
-        ("Data Structures",),
-        ("Conditionals",),
-        ("File Handling",),
-        ("Error Handling",),
-        ("Object-Oriented Programming",),
-    ]
-    cursor.executemany("INSERT INTO categories (name) VALUES (?)", categories)
+    categories = categories or DEFAULT_CATEGORIES
+    cursor.executemany("INSERT INTO categories (name) VALUES (?)", [(c,) for c in categories])
     
     conn.commit()
     conn.close()
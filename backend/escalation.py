@@ -0,0 +1,141 @@
+"""Automatic escalation of open questions that nobody has helped with.
+
+When a question is created it gets an `escalate_at` deadline (its category's
+`auto_escalate_hours`, or AUTO_ESCALATE_HOURS). The first helpful response
+clears the deadline. The partial index on `escalate_at` works as a durable
+min-heap: the scheduler thread only ever asks for the earliest deadline and
+the rows that are already due, sleeps until the next deadline, and picks up
+where it left off after a restart.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+import jobs
+import rollups
+import triage
+from database import get_connection, list_course_ids
+
+AUTO_ESCALATE_HOURS = float(os.getenv("AUTO_ESCALATE_HOURS", "24"))
+
+#Upper bound on how long the scheduler sleeps, so deadlines set by other worker processes are noticed
+MAX_SLEEP_SECONDS = float(os.getenv("AUTO_ESCALATE_POLL_SECONDS", "60"))
+BATCH_SIZE = 100
+
+
+def _deadline_hours(conn, category_id: int) -> Optional[float]:
+    row = conn.execute("SELECT auto_escalate_hours FROM categories WHERE id = ?", (category_id,)).fetchone()
+    hours = row["auto_escalate_hours"] if row and row["auto_escalate_hours"] is not None else AUTO_ESCALATE_HOURS
+    #A zero or negative deadline turns auto-escalation off for the category
+    return hours if hours > 0 else None
+
+
+def schedule(conn, question_id: int, from_now: bool = False) -> Optional[str]:
+    """Set the question's deadline from its creation time (or from now) and return it.
+
+    The caller commits, then passes the deadline to `scheduler.notify`.
+    """
+    question = conn.execute("SELECT category_id FROM questions WHERE id = ?", (question_id,)).fetchone()
+    if not question:
+        return None
+    hours = _deadline_hours(conn, question["category_id"])
+    if hours is None:
+        cancel(conn, question_id)
+        return None
+    base = "CURRENT_TIMESTAMP" if from_now else "created_at"
+    conn.execute(
+        f"UPDATE questions SET escalate_at = datetime({base}, ?) WHERE id = ?",
+        (f"+{hours * 3600:.0f} seconds", question_id)
+    )
+    return conn.execute("SELECT escalate_at FROM questions WHERE id = ?", (question_id,)).fetchone()[0]
+
+
+def cancel(conn, question_id: int):
+    conn.execute("UPDATE questions SET escalate_at = NULL WHERE id = ?", (question_id,))
+
+
+def escalate_due(course_id: Optional[str] = None) -> int:
+    #Escalate every question whose deadline has passed; returns how many were escalated
+    escalated = 0
+    conn = get_connection(course_id)
+    try:
+        while True:
+            now = datetime.utcnow().strftime(rollups.TIMESTAMP_FORMAT)
+            conn.execute("BEGIN IMMEDIATE")
+            due = conn.execute("""
+                SELECT id, category_id, status FROM questions
+                WHERE escalate_at IS NOT NULL AND escalate_at <= ?
+                ORDER BY escalate_at
+                LIMIT ?
+            """, (now, BATCH_SIZE)).fetchall()
+            for question in due:
+                cancel(conn, question["id"])
+                if question["status"] != "open":
+                    continue
+                conn.execute("UPDATE questions SET status = 'escalated' WHERE id = ?", (question["id"],))
+                rollups.question_escalated(conn, question["category_id"], now)
+                triage.enqueue(conn, question["id"])
+                escalated += 1
+            conn.commit()
+            if len(due) < BATCH_SIZE:
+                return escalated
+    finally:
+        conn.close()
+
+
+def next_deadline(course_id: Optional[str] = None) -> Optional[str]:
+    conn = get_connection(course_id)
+    row = conn.execute("SELECT MIN(escalate_at) FROM questions WHERE escalate_at IS NOT NULL").fetchone()
+    conn.close()
+    return row[0]
+
+
+class EscalationScheduler:
+    """Sleeps until the earliest `escalate_at` across all courses, then escalates what's due."""
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.next_due = None
+
+    def start(self):
+        if self._thread or not jobs.BACKGROUND_JOBS_ENABLED:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="auto-escalation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread = None
+
+    def notify(self, escalate_at: Optional[str]):
+        #Wake early if a new deadline comes before the one we're sleeping towards
+        if escalate_at and (self.next_due is None or escalate_at < self.next_due):
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            sleep = MAX_SLEEP_SECONDS
+            try:
+                if jobs.try_acquire_lease("auto-escalation", MAX_SLEEP_SECONDS * 3):
+                    deadlines = []
+                    for course_id in list_course_ids():
+                        escalate_due(course_id)
+                        deadline = next_deadline(course_id)
+                        if deadline:
+                            deadlines.append(deadline)
+                    self.next_due = min(deadlines) if deadlines else None
+                    if self.next_due:
+                        wait = datetime.fromisoformat(self.next_due) - datetime.utcnow()
+                        sleep = min(max(wait / timedelta(seconds=1), 0.5), MAX_SLEEP_SECONDS)
+            except Exception as e:
+                print(f"Auto-escalation failed: {e}")
+            self._wake.wait(sleep)
+            self._wake.clear()
+
+
+scheduler = EscalationScheduler()
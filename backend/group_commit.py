@@ -0,0 +1,145 @@
+"""Optional group commit for write-heavy request handlers.
+
+With GROUP_COMMIT=1, handlers hand their write section to a single writer
+thread per shard instead of committing on their own. The writer gathers
+whatever arrives within GROUP_COMMIT_WINDOW_MS (up to GROUP_COMMIT_MAX_BATCH
+operations), runs each one inside its own SAVEPOINT and commits them all
+together, so a burst of submissions costs one fsync per batch rather than
+one per request. A failing operation is rolled back to its savepoint without
+affecting the rest of the batch.
+
+Callers get the operation's return value (e.g. the new row id) only after
+the batch has committed, so a response is never reported before it is
+durable. With the flag off, `run` executes the operation inline and commits
+right away, so handlers use one code path either way.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from database import get_connection, get_course_path, get_current_course, open_connection
+
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT", "0") == "1"
+WINDOW_SECONDS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "2")) / 1000
+MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "256"))
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class GroupCommitWriter:
+    """Single writer thread that commits queued operations in batches."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"group-commit-{os.path.basename(path)}", daemon=True)
+        self.batches = 0
+        self.operations = 0
+        self._thread.start()
+
+    def submit(self, op: Callable) -> Future:
+        future = Future()
+        self._pending.put((op, future))
+        return future
+
+    def stop(self):
+        self._pending.put(None)
+
+    def _collect(self) -> Optional[list]:
+        #Block for the first operation, then take whatever else arrives within the window
+        first = self._pending.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + WINDOW_SECONDS
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._pending.get(timeout=remaining) if remaining > 0 else self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = open_connection(self.path, check_same_thread=False)
+        try:
+            while True:
+                batch = self._collect()
+                if batch is None:
+                    return
+                self._commit_batch(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, batch: list):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((future, op(conn), None))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            #The whole batch failed to commit (e.g. lock timeout): fail every caller
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"Group commit of {len(batch)} operations failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def get_writer(course_id: Optional[str] = None) -> GroupCommitWriter:
+    path = get_course_path(course_id or get_current_course())
+    writer = _writers.get(path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(path)
+            if writer is None:
+                writer = _writers[path] = GroupCommitWriter(path)
+    return writer
+
+
+def run(op: Callable, course_id: Optional[str] = None):
+    """Run `op(conn)` in a committed write transaction and return its result.
+
+    `op` must only use the connection it is given: with group commit on it
+    runs on the writer thread, alongside other requests' operations.
+    """
+    if GROUP_COMMIT_ENABLED:
+        return get_writer(course_id).submit(op).result()
+    conn = get_connection(course_id)
+    try:
+        result = op(conn)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+
+def stop_all():
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.stop()
+        _writers.clear()
@@ -0,0 +1,16 @@
+#Gunicorn settings for running the API across all cores:
+#    gunicorn -c gunicorn.conf.py main:app
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def on_starting(server):
+    #Runs once in the master before any worker is forked
+    from database import init_database, seed_data
+    init_database()
+    seed_data()
+    os.environ["FORUM_DB_INITIALIZED"] = "1"
@@ -0,0 +1,263 @@
+"""Idempotency-Key support for write endpoints.
+
+A POST to one of IDEMPOTENT_PATHS with an `Idempotency-Key` header runs at
+most once per key. The first request claims the key in `idempotency_keys`
+and, once it has finished, stores the status and body it returned. A retry
+with the same key gets that stored response back (marked with an
+`Idempotent-Replayed: true` header) instead of running the handler, and
+with it the AI evaluation and karma change, again.
+
+A duplicate that arrives while the first request is still running waits
+for it and gets the same response: through an in-process event when both
+are in the same worker, or by polling the row when they are not. If the
+worker running the first request dies, its claim lapses after
+LOCK_SECONDS and the next retry runs the request.
+
+Keys are scoped per course and endpoint. Reusing a key with a different
+request body is rejected with 422. Server errors and 429 (rate limited)
+are not stored, so they can be retried. Stored results expire after IDEMPOTENCY_TTL_SECONDS and are
+swept by a background job.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from database import get_connection, get_current_course, list_course_ids
+from jobs import OWNER
+
+IDEMPOTENT_PATHS = {"/api/responses", "/api/questions", "/api/instructor-answers"}
+KEY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+#How long a claimed key stays locked; must outlast the slowest request (the Gemini call)
+LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))
+POLL_SECONDS = 0.1
+SWEEP_INTERVAL_SECONDS = 3600
+
+#Requests this worker is running right now, so in-process duplicates can wait on them
+_in_flight = {}
+
+
+def _fingerprint(scope, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(scope["method"].encode())
+    digest.update(scope["path"].encode())
+    digest.update(scope.get("query_string", b""))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def claim(course_id: str, key: str, path: str, fingerprint: str):
+    """Claim `key` or look up what happened to it.
+
+    Returns ("run", None), ("replay", row), ("in_flight", None) or ("mismatch", None).
+    """
+    now = time.time()
+    conn = get_connection(course_id)
+    try:
+        #Plain read first: waiters poll this, and only a missing, expired or abandoned key needs the write lock
+        row = conn.execute(
+            "SELECT * FROM idempotency_keys WHERE key = ? AND path = ?", (key, path)
+        ).fetchone()
+        if row and row["expires_at"] >= now:
+            if row["fingerprint"] != fingerprint:
+                return "mismatch", None
+            if row["status"] == "done":
+                return "replay", row
+            if row["locked_until"] >= now:
+                return "in_flight", None
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT * FROM idempotency_keys WHERE key = ? AND path = ?", (key, path)
+        ).fetchone()
+        if row and row["expires_at"] < now:
+            conn.execute("DELETE FROM idempotency_keys WHERE key = ? AND path = ?", (key, path))
+            row = None
+        if row is None:
+            conn.execute("""
+                INSERT INTO idempotency_keys
+                (key, path, fingerprint, status, owner, locked_until, created_at, expires_at)
+                VALUES (?, ?, ?, 'in_progress', ?, ?, ?, ?)
+            """, (key, path, fingerprint, OWNER, now + LOCK_SECONDS, now, now + IDEMPOTENCY_TTL_SECONDS))
+            conn.commit()
+            return "run", None
+        if row["fingerprint"] != fingerprint:
+            conn.rollback()
+            return "mismatch", None
+        if row["status"] == "done":
+            conn.rollback()
+            return "replay", row
+        if row["locked_until"] < now:
+            #Whoever claimed it died mid-request, take it over
+            conn.execute("""
+                UPDATE idempotency_keys SET owner = ?, locked_until = ?
+                WHERE key = ? AND path = ?
+            """, (OWNER, now + LOCK_SECONDS, key, path))
+            conn.commit()
+            return "run", None
+        conn.rollback()
+        return "in_flight", None
+    finally:
+        conn.close()
+
+
+def finish(course_id: str, key: str, path: str, status: int, content_type: Optional[str], body: bytes):
+    now = time.time()
+    conn = get_connection(course_id)
+    conn.execute("""
+        UPDATE idempotency_keys SET
+            status = 'done', locked_until = NULL, response_status = ?, response_type = ?,
+            response_body = ?, expires_at = ?
+        WHERE key = ? AND path = ?
+    """, (status, content_type, body, now + IDEMPOTENCY_TTL_SECONDS, key, path))
+    conn.commit()
+    conn.close()
+
+
+def release(course_id: str, key: str, path: str):
+    #The request failed on the server side: forget the key so a retry runs it again
+    conn = get_connection(course_id)
+    conn.execute(
+        "DELETE FROM idempotency_keys WHERE key = ? AND path = ? AND status = 'in_progress'", (key, path)
+    )
+    conn.commit()
+    conn.close()
+
+
+def sweep(course_id: Optional[str] = None) -> int:
+    conn = get_connection(course_id)
+    cursor = conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (time.time(),))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+
+def sweep_all_courses():
+    for course_id in list_course_ids():
+        sweep(course_id)
+
+
+async def _send_json(send, status: int, body: dict):
+    payload = json.dumps(body).encode("utf-8")
+    await _send_body(send, status, "application/json", payload)
+
+
+async def _send_body(send, status: int, content_type: Optional[str], body: bytes, replayed: bool = False):
+    headers = [(b"content-length", str(len(body)).encode())]
+    if content_type:
+        headers.append((b"content-type", content_type.encode("latin-1")))
+    if replayed:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware that makes keyed POSTs to IDEMPOTENT_PATHS run at most once.
+
+    Must run inside CourseRoutingMiddleware, so the path is already rewritten
+    and the course is known.
+    """
+
+    def __init__(self, app, paths=IDEMPOTENT_PATHS):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        key = None
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            for name, value in scope.get("headers", []):
+                if name == KEY_HEADER:
+                    key = value.decode("latin-1").strip()
+                    break
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"})
+            return
+
+        body = await _read_body(receive)
+        path = scope["path"]
+        course_id = get_current_course()
+        fingerprint = _fingerprint(scope, body)
+        local_key = (course_id, path, key)
+        deadline = time.monotonic() + LOCK_SECONDS
+
+        while True:
+            outcome, row = await run_in_threadpool(claim, course_id, key, path, fingerprint)
+            if outcome == "run":
+                break
+            if outcome == "replay":
+                await _send_body(send, row["response_status"], row["response_type"], row["response_body"], replayed=True)
+                return
+            if outcome == "mismatch":
+                await _send_json(send, 422, {"detail": "Idempotency-Key was already used for a different request"})
+                return
+            #Someone else is running it: wait for them to finish, then replay their result
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is still in progress"})
+                return
+            event = _in_flight.get(local_key)
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(POLL_SECONDS)
+
+        event = _in_flight[local_key] = asyncio.Event()
+        response = {"status": 500, "type": None, "body": []}
+
+        async def replay_receive():
+            nonlocal body
+            if body is not None:
+                message = {"type": "http.request", "body": body, "more_body": False}
+                body = None
+                return message
+            return await receive()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name == b"content-type":
+                        response["type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        #Local waiters are woken only once the outcome is stored, so their next claim sees it
+        try:
+            try:
+                await self.app(scope, replay_receive, capture_send)
+            except Exception:
+                await run_in_threadpool(release, course_id, key, path)
+                raise
+            if response["status"] >= 500 or response["status"] == 429:
+                #Nothing happened, so a retry after Retry-After should run the request for real
+                await run_in_threadpool(release, course_id, key, path)
+            else:
+                await run_in_threadpool(
+                    finish, course_id, key, path, response["status"], response["type"], b"".join(response["body"])
+                )
+        finally:
+            _in_flight.pop(local_key, None)
+            event.set()
@@ -0,0 +1,74 @@
+"""Background jobs that run inside the API process.
+
+Every worker process starts the same jobs, so each run first takes a
+short-lived lease row in the main database: only the worker holding the
+lease does the work, and another one takes over if it dies.
+"""
+import os
+import socket
+import threading
+import time
+from typing import Callable
+
+from database import DEFAULT_COURSE, get_connection
+
+#Set BACKGROUND_JOBS=0 to run the API without any background work (tests, benchmarks, CLI)
+BACKGROUND_JOBS_ENABLED = os.getenv("BACKGROUND_JOBS", "1") != "0"
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_jobs = []
+
+
+def try_acquire_lease(name: str, ttl_seconds: float) -> bool:
+    #Take or renew the lease on `name`; False if another live worker holds it
+    now = time.time()
+    conn = get_connection(DEFAULT_COURSE)
+    cursor = conn.execute("""
+        INSERT INTO job_leases (name, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+        WHERE job_leases.owner = excluded.owner OR job_leases.expires_at < ?
+    """, (name, OWNER, now + ttl_seconds, now))
+    acquired = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return acquired
+
+
+class PeriodicJob:
+    def __init__(self, name: str, interval_seconds: float, fn: Callable[[], None]):
+        self.name = name
+        self.interval = interval_seconds
+        self.fn = fn
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if try_acquire_lease(self.name, self.interval * 3):
+                    self.fn()
+            except Exception as e:
+                print(f"Background job {self.name} failed: {e}")
+            self._stop.wait(self.interval)
+
+
+def start_job(name: str, interval_seconds: float, fn: Callable[[], None]):
+    if not BACKGROUND_JOBS_ENABLED:
+        return None
+    job = PeriodicJob(name, interval_seconds, fn)
+    _jobs.append(job)
+    job.start()
+    return job
+
+
+def stop_all():
+    for job in _jobs:
+        job.stop()
+    _jobs.clear()
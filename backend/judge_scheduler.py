@@ -0,0 +1,347 @@
+"""Admission control and fair queuing for AI judge calls.
+
+Every judge call takes a slot from a JudgeScheduler first:
+
+- At most JUDGE_MAX_CONCURRENCY calls run at once per process.
+- Interactive calls to the Gemini judge (a student submitting a response)
+  are limited per responder by a token bucket of JUDGE_USER_BURST calls,
+  refilled at JUDGE_USER_RATE_PER_MINUTE. Going over is rejected with 429 up
+  front instead of queuing behind everyone else. The buckets live in the
+  main database, so the limit holds across all workers. The mock judge costs
+  nothing and is not limited; a rate of 0 turns the limit off.
+- Waiting calls are served by priority class: interactive first, then
+  re-evaluation, then bulk work. Within a class, weighted fair queuing
+  interleaves responders and questions, so one busy responder (or one
+  popular question) can't push everyone else to the back.
+- Interactive calls give up with 503 after JUDGE_MAX_WAIT_SECONDS, and each
+  class's queue is capped at JUDGE_MAX_QUEUE, which bounds their latency.
+  A call turned away with 503 gets its rate-limit token back.
+
+Background work in other processes (python reevaluate.py) yields too: while
+an API worker has interactive calls waiting, it publishes that in
+shared_config, and lower-priority calls anywhere hold off for
+JUDGE_YIELD_SECONDS.
+"""
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Hashable, Optional
+
+from database import DEFAULT_COURSE, get_connection
+
+INTERACTIVE = "interactive"
+REEVALUATION = "reevaluation"
+BULK = "bulk"
+#Highest priority first
+PRIORITIES = (INTERACTIVE, REEVALUATION, BULK)
+
+JUDGE_MAX_CONCURRENCY = int(os.getenv("JUDGE_MAX_CONCURRENCY", "4"))
+JUDGE_USER_RATE_PER_MINUTE = float(os.getenv("JUDGE_USER_RATE_PER_MINUTE", "10"))
+JUDGE_USER_BURST = float(os.getenv("JUDGE_USER_BURST", "5"))
+JUDGE_MAX_QUEUE = int(os.getenv("JUDGE_MAX_QUEUE", "64"))
+JUDGE_MAX_WAIT_SECONDS = float(os.getenv("JUDGE_MAX_WAIT_SECONDS", "20"))
+#How long lower-priority work holds off after interactive calls were last seen waiting
+JUDGE_YIELD_SECONDS = float(os.getenv("JUDGE_YIELD_SECONDS", "5"))
+
+PRESSURE_KEY = "judge_interactive_waiting_at"
+#How often waiters re-check (deadlines, pressure from other processes) and pressure is published
+CHECK_INTERVAL_SECONDS = 0.5
+#How often fully refilled rate buckets are deleted
+SWEEP_INTERVAL_SECONDS = 3600
+#Recent queue waits kept per class for the percentiles in stats()
+WAIT_SAMPLES = 1000
+
+
+class JudgeRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("event", "granted", "cancelled")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class _Queue:
+    #One priority class: a heap of (finish tag, seq, ticket) plus its fair-queuing state
+    def __init__(self):
+        self.heap = []
+        #Tickets in the heap that are still waiting; cancelled ones stay in the heap until popped
+        self.waiting = 0
+        self.virtual_time = 0.0
+        self.finish = {}
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.counts = Counter()
+
+    def tag(self, flows: list) -> float:
+        #A call finishes one unit after the later of "now" and its flows' previous calls
+        tag = max([self.virtual_time] + [self.finish.get(flow, 0.0) for flow in flows]) + 1.0
+        for flow in flows:
+            self.finish[flow] = tag
+        if len(self.finish) > 10000:
+            self.finish = {flow: t for flow, t in self.finish.items() if t > self.virtual_time}
+        return tag
+
+
+class JudgeScheduler:
+    """Judge slots for one process.
+
+    `clock` (wall-clock seconds, shared with other processes through the
+    database) and `connect` (a connection to the main database) can be
+    replaced in tests.
+    """
+
+    def __init__(self, max_concurrency: int = JUDGE_MAX_CONCURRENCY,
+                 user_rate_per_minute: float = JUDGE_USER_RATE_PER_MINUTE,
+                 user_burst: float = JUDGE_USER_BURST, max_queue: int = JUDGE_MAX_QUEUE,
+                 max_wait_seconds: float = JUDGE_MAX_WAIT_SECONDS,
+                 clock: Callable[[], float] = time.time,
+                 connect: Callable[[], sqlite3.Connection] = lambda: get_connection(DEFAULT_COURSE)):
+        self.max_concurrency = max_concurrency
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait_seconds
+        self._clock = clock
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queues = {priority: _Queue() for priority in PRIORITIES}
+        self._seq = itertools.count()
+        self._pressure_at = 0.0
+        self._published_at = 0.0
+        self._remote_pressure_at = 0.0
+        self._remote_checked_at = 0.0
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE, user: Optional[Hashable] = None,
+             question: Optional[Hashable] = None, limit_rate: bool = True):
+        """Hold a judge slot for the duration of the block; raises JudgeRejected."""
+        self.acquire(priority, user, question, limit_rate)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, priority: str = INTERACTIVE, user: Optional[Hashable] = None,
+                question: Optional[Hashable] = None, limit_rate: bool = True):
+        queue = self._queues[priority]
+        start = self._clock()
+        #Only a call that actually gets queued costs a token: check capacity first, refund on any 503 after
+        self._check_capacity(queue)
+        token_user = str(user) if priority == INTERACTIVE and user is not None and limit_rate and self.user_rate > 0 else None
+        if token_user is not None:
+            retry_after = self._take_token(token_user)
+            if retry_after:
+                with self._lock:
+                    queue.counts["rejected_rate_limited"] += 1
+                raise JudgeRejected(429, "Too many submissions, please wait before trying again", retry_after)
+        if priority != INTERACTIVE:
+            self._refresh_remote_pressure()
+        with self._lock:
+            if queue.waiting >= self.max_queue:
+                queue.counts["rejected_queue_full"] += 1
+                ticket = None
+            else:
+                flows = [("user", user)] if user is not None else []
+                if question is not None:
+                    flows.append(("question", question))
+                ticket = _Ticket()
+                heapq.heappush(queue.heap, (queue.tag(flows), next(self._seq), ticket))
+                queue.waiting += 1
+                self._dispatch()
+                if not ticket.granted and priority == INTERACTIVE:
+                    self._pressure_at = self._clock()
+        if ticket is None:
+            self._refund_token(token_user)
+            raise JudgeRejected(503, "The AI judge is busy, please try again shortly", self.max_wait)
+
+        deadline = start + self.max_wait if priority == INTERACTIVE else None
+        while not ticket.event.wait(CHECK_INTERVAL_SECONDS):
+            #Database work happens here, outside the lock, so a slow read never stalls other callers
+            self._publish_pressure()
+            self._refresh_remote_pressure()
+            with self._lock:
+                if ticket.granted:
+                    break
+                timed_out = deadline is not None and self._clock() >= deadline
+                if timed_out:
+                    ticket.cancelled = True
+                    queue.waiting -= 1
+                    queue.counts["timed_out"] += 1
+                else:
+                    if priority == INTERACTIVE:
+                        self._pressure_at = self._clock()
+                    self._dispatch()
+            if timed_out:
+                self._refund_token(token_user)
+                raise JudgeRejected(503, "The AI judge is busy, please try again shortly", self.max_wait)
+        with self._lock:
+            queue.waits.append(self._clock() - start)
+            queue.counts["admitted"] += 1
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    def _check_capacity(self, queue: _Queue):
+        with self._lock:
+            if queue.waiting >= self.max_queue:
+                queue.counts["rejected_queue_full"] += 1
+                raise JudgeRejected(503, "The AI judge is busy, please try again shortly", self.max_wait)
+
+    def _take_token(self, user: str) -> float:
+        #Take one token from the user's shared bucket; returns 0 on success, else seconds until one is available
+        now = self._clock()
+        conn = self._connect()
+        try:
+            #Refill and take in one statement, so workers racing for the last token can't both get it
+            cursor = conn.execute("""
+                INSERT INTO judge_rate_buckets (user_key, tokens, updated_at) VALUES (?, ? - 1, ?)
+                ON CONFLICT(user_key) DO UPDATE SET
+                    tokens = MIN(?, tokens + (excluded.updated_at - updated_at) * ?) - 1,
+                    updated_at = excluded.updated_at
+                WHERE MIN(?, tokens + (excluded.updated_at - updated_at) * ?) >= 1
+            """, (user, self.user_burst, now, self.user_burst, self.user_rate, self.user_burst, self.user_rate))
+            conn.commit()
+            if cursor.rowcount:
+                return 0.0
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM judge_rate_buckets WHERE user_key = ?", (user,)
+            ).fetchone()
+        except Exception as e:
+            #Don't turn a database hiccup into rejected submissions
+            print(f"Could not check judge rate limit: {e}")
+            return 0.0
+        finally:
+            conn.close()
+        tokens = min(self.user_burst, row["tokens"] + (now - row["updated_at"]) * self.user_rate)
+        return max((1 - tokens) / self.user_rate, 0.001)
+
+    def _refund_token(self, user: Optional[str]):
+        #Give back the token of a call that was turned away with 503
+        if user is None:
+            return
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE judge_rate_buckets SET tokens = MIN(?, tokens + 1) WHERE user_key = ?",
+                (self.user_burst, user)
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Could not refund judge rate limit token: {e}")
+        finally:
+            conn.close()
+
+    def _dispatch(self):
+        #Hand free slots to the best waiting tickets; the caller holds the lock, so no database work here
+        while self._running < self.max_concurrency:
+            for priority in PRIORITIES:
+                queue = self._queues[priority]
+                while queue.heap and queue.heap[0][2].cancelled:
+                    heapq.heappop(queue.heap)
+                if queue.heap:
+                    break
+            else:
+                return
+            if priority != INTERACTIVE and self._interactive_waiting():
+                return
+            tag, _, ticket = heapq.heappop(queue.heap)
+            queue.virtual_time = tag
+            queue.waiting -= 1
+            self._running += 1
+            ticket.granted = True
+            ticket.event.set()
+
+    def _interactive_waiting(self) -> bool:
+        #Interactive calls waiting here or, recently, in any other process (as last read by _refresh_remote_pressure)
+        now = self._clock()
+        if self._queues[INTERACTIVE].waiting or now - self._pressure_at < JUDGE_YIELD_SECONDS:
+            return True
+        return now - self._remote_pressure_at < JUDGE_YIELD_SECONDS
+
+    def _refresh_remote_pressure(self):
+        #Read other processes' interactive pressure, at most once per check interval; called without the lock
+        now = self._clock()
+        if now - self._remote_checked_at < CHECK_INTERVAL_SECONDS:
+            return
+        self._remote_checked_at = now
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM shared_config WHERE key = ?", (PRESSURE_KEY,)).fetchone()
+            self._remote_pressure_at = float(row[0]) if row else 0.0
+        except Exception as e:
+            print(f"Could not read judge pressure: {e}")
+        finally:
+            conn.close()
+
+    def _publish_pressure(self):
+        #Tell other processes that interactive calls are waiting, at most once per check interval
+        pressure_at = self._pressure_at
+        if pressure_at <= self._published_at or self._clock() - self._published_at < CHECK_INTERVAL_SECONDS:
+            return
+        self._published_at = pressure_at
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO shared_config (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (PRESSURE_KEY, str(pressure_at))
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Could not publish judge pressure: {e}")
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {}
+            for priority, queue in self._queues.items():
+                waits = sorted(queue.waits)
+                classes[priority] = dict(
+                    queued=queue.waiting,
+                    admitted=queue.counts["admitted"],
+                    rejected_rate_limited=queue.counts["rejected_rate_limited"],
+                    rejected_queue_full=queue.counts["rejected_queue_full"],
+                    timed_out=queue.counts["timed_out"],
+                    wait_ms={
+                        label: round(waits[min(len(waits) - 1, int(len(waits) * q))] * 1000, 2) if waits else None
+                        for label, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+                    },
+                )
+            return {
+                "running": self._running,
+                "max_concurrency": self.max_concurrency,
+                "classes": classes,
+            }
+
+
+def sweep_buckets() -> int:
+    #Full buckets behave exactly like missing ones, so drop them
+    if JUDGE_USER_RATE_PER_MINUTE <= 0:
+        return 0
+    conn = get_connection(DEFAULT_COURSE)
+    cursor = conn.execute(
+        "DELETE FROM judge_rate_buckets WHERE updated_at < ?",
+        (time.time() - JUDGE_USER_BURST * 60 / JUDGE_USER_RATE_PER_MINUTE,)
+    )
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+
+scheduler = JudgeScheduler()
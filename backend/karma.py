@@ -0,0 +1,135 @@
+"""Append-only karma ledger with periodic snapshots.
+
+Every karma change is a row in `karma_events`, written in the same
+transaction as the response that caused it. `users.karma` is no longer
+updated per response; it is a snapshot folded up to `users.karma_event_id`
+by a periodic job, which also records a history row in `karma_snapshots`.
+
+    current karma = users.karma + events after users.karma_event_id
+    karma at T    = latest snapshot taken at or before T + events after it up to T
+
+Both only touch events since one snapshot, so they stay cheap as the ledger
+grows. A changed rating is recorded as a compensating event, so nothing has
+to be replayed; `rebuild_snapshots` recomputes everything from the ledger.
+"""
+import argparse
+import os
+from datetime import datetime
+from typing import Optional
+
+from database import get_connection, list_course_ids
+
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("KARMA_SNAPSHOT_SECONDS", "300"))
+
+#Use as a column in queries over `users u`
+CURRENT_KARMA_SQL = """(u.karma + COALESCE((
+    SELECT SUM(e.delta) FROM karma_events e
+    WHERE e.user_id = u.id AND e.id > u.karma_event_id
+), 0))"""
+
+USER_COLUMNS_SQL = f"u.id, u.name, u.role, u.created_at, {CURRENT_KARMA_SQL} as karma"
+
+
+def record_event(conn, user_id: int, delta: int, reason: str, response_id: Optional[int] = None):
+    #Append to the ledger on the caller's connection; the caller commits
+    if delta:
+        conn.execute(
+            "INSERT INTO karma_events (user_id, response_id, delta, reason) VALUES (?, ?, ?, ?)",
+            (user_id, response_id, delta, reason)
+        )
+
+
+def record_rating_change(conn, response_id: int, user_id: int, old_karma: int, new_karma: int):
+    #A re-evaluated response only needs the difference appended
+    record_event(conn, user_id, new_karma - old_karma, "re-evaluation", response_id)
+
+
+def current_karma(conn, user_id: int) -> int:
+    row = conn.execute(f"SELECT {CURRENT_KARMA_SQL} FROM users u WHERE u.id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def windowed_karma_sql(param: str = ":since") -> str:
+    """Karma earned since `param` by user `u`, as a SQL expression."""
+    snapshot = f"""(
+        SELECT s.{{column}} FROM karma_snapshots s
+        WHERE s.user_id = u.id AND s.taken_at <= {param}
+        ORDER BY s.taken_at DESC LIMIT 1
+    )"""
+    karma_at_since = f"""(
+        COALESCE({snapshot.format(column='karma')}, 0)
+        + COALESCE((
+            SELECT SUM(e.delta) FROM karma_events e
+            WHERE e.user_id = u.id
+            AND e.id > COALESCE({snapshot.format(column='last_event_id')}, 0)
+            AND e.created_at <= {param}
+        ), 0)
+    )"""
+    return f"({CURRENT_KARMA_SQL} - {karma_at_since})"
+
+
+def take_snapshot(course_id: Optional[str] = None) -> int:
+    """Fold new ledger events into users.karma; returns how many users changed."""
+    conn = get_connection(course_id)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM karma_events").fetchone()[0]
+        changed = conn.execute("""
+            SELECT e.user_id, SUM(e.delta) as delta
+            FROM karma_events e
+            JOIN users u ON u.id = e.user_id
+            WHERE e.id > u.karma_event_id AND e.id <= ?
+            GROUP BY e.user_id
+        """, (last_id,)).fetchall()
+        taken_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        for row in changed:
+            conn.execute(
+                "UPDATE users SET karma = karma + ?, karma_event_id = ? WHERE id = ?",
+                (row["delta"], last_id, row["user_id"])
+            )
+        conn.executemany("""
+            INSERT INTO karma_snapshots (user_id, last_event_id, karma, taken_at)
+            SELECT id, karma_event_id, karma, ? FROM users WHERE id = ?
+        """, [(taken_at, row["user_id"]) for row in changed])
+        conn.commit()
+        return len(changed)
+    finally:
+        conn.close()
+
+
+def snapshot_all_courses():
+    for course_id in list_course_ids():
+        take_snapshot(course_id)
+
+
+def rebuild_snapshots(course_id: Optional[str] = None):
+    #Recompute every user's karma from the full ledger
+    conn = get_connection(course_id)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM karma_events").fetchone()[0]
+        conn.execute("""
+            UPDATE users SET
+                karma = COALESCE((SELECT SUM(e.delta) FROM karma_events e WHERE e.user_id = users.id AND e.id <= ?), 0),
+                karma_event_id = ?
+        """, (last_id, last_id))
+        conn.execute("DELETE FROM karma_snapshots")
+        conn.execute("""
+            INSERT INTO karma_snapshots (user_id, last_event_id, karma, taken_at)
+            SELECT id, karma_event_id, karma, CURRENT_TIMESTAMP FROM users
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold karma ledger events into snapshots.")
+    parser.add_argument("--course", default=None, help="Course ID (default course if omitted)")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute all karma from the full ledger")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild_snapshots(args.course)
+        print("Rebuilt karma snapshots")
+    else:
+        print(f"Snapshotted karma for {take_snapshot(args.course)} users")
@@ -1,20 +1,45 @@
 from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from typing import List, Optional
 from datetime import datetime
+import math
 import os
+import re
 
-from database import get_connection, init_database, seed_data
+from database import (
+    DEFAULT_COURSE, get_connection, init_database, seed_data,
+    get_course, get_current_course, list_course_ids, register_course
+)
 from models import (
     User, UserCreate, UserLogin, UserRole,
     Category,
+    Course, CourseCreate, CourseStats, CourseQuestion, TriageItem,
     Question, QuestionCreate, QuestionUpdate, QuestionStatus,
     Response, ResponseCreate,
     InstructorAnswer, InstructorAnswerCreate,
+    QuestionBundle, UserDashboard,
     KarmaLeaderboard, AnalyticsDashboard, ResponseQualityStats,
-    CategoryStats, CommonMisconception
+    CategoryStats, CommonMisconception, AnalyticsTimeseries
 )
 from ai_judge import get_ai_judge, configure_ai_judge
+from serialization import json_rows, json_bundle
+from tenancy import CourseRoutingMiddleware, fan_out
+from compression import CompressionMiddleware
+from idempotency import IdempotencyMiddleware
+from archive import archive_closed_questions, restore_question, attach_archive
+import rollups
+import jobs
+import misconceptions
+import triage
+import escalation
+import karma
+import group_commit
+import projection
+import idempotency
+import backup
+import profiler
+import judge_scheduler
 
 #Initialize FastAPI app
 app = FastAPI(
@@ -23,6 +48,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+#Run keyed POSTs at most once; innermost so replays still get CORS headers
+app.add_middleware(IdempotencyMiddleware)
+
 #Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -32,11 +60,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+#Opt-in profiling of sampled and slow requests (PROFILE_SAMPLE_RATE / PROFILE_SLOW_MS)
+if profiler.PROFILE_ENABLED:
+    profiler.install()
+    app.add_middleware(profiler.ProfilingMiddleware)
+
+#Route each request to its course's database shard
+app.add_middleware(CourseRoutingMiddleware)
+
+#Compress large responses (brotli or gzip, whichever the client accepts)
+app.add_middleware(CompressionMiddleware)
+
 #Initialize database
 @app.on_event("startup")
 def startup_event():
-    init_database()
-    seed_data()
+    #In multi-worker mode the parent process already did this before forking workers
+    if os.getenv("FORUM_DB_INITIALIZED") != "1":
+        init_database()
+        seed_data()
+    triage.backfill_all_courses()
+    jobs.start_job("misconceptions", misconceptions.INTERVAL_SECONDS, misconceptions.run_all_courses)
+    jobs.start_job("karma-snapshots", karma.SNAPSHOT_INTERVAL_SECONDS, karma.snapshot_all_courses)
+    if backup.BACKUP_INTERVAL_SECONDS > 0:
+        jobs.start_job("backups", backup.CHECK_INTERVAL_SECONDS, backup.snapshot_due_courses)
+    jobs.start_job("idempotency-sweep", idempotency.SWEEP_INTERVAL_SECONDS, idempotency.sweep_all_courses)
+    jobs.start_job("judge-rate-sweep", judge_scheduler.SWEEP_INTERVAL_SECONDS, judge_scheduler.sweep_buckets)
+    escalation.scheduler.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    jobs.stop_all()
+    escalation.scheduler.stop()
+    group_commit.stop_all()
 
 # ============== USER ENDPOINTS ==============
 
@@ -45,17 +100,17 @@ def get_all_users():
     """Get all users (for login dropdown)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users ORDER BY role, name")
+    cursor.execute(f"SELECT {karma.USER_COLUMNS_SQL} FROM users u ORDER BY u.role, u.name")
     users = cursor.fetchall()
     conn.close()
-    return [dict(u) for u in users]
+    return json_rows(users, User)
 
 @app.get("/api/users/{user_id}", response_model=User)
 def get_user(user_id: int):
     """Get a specific user by ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    cursor.execute(f"SELECT {karma.USER_COLUMNS_SQL} FROM users u WHERE u.id = ?", (user_id,))
     user = cursor.fetchone()
     conn.close()
     if not user:
@@ -74,7 +129,7 @@ def create_user(user: UserCreate):
         )
         conn.commit()
         user_id = cursor.lastrowid
-        cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        cursor.execute(f"SELECT {karma.USER_COLUMNS_SQL} FROM users u WHERE u.id = ?", (user_id,))
         new_user = cursor.fetchone()
         conn.close()
         return dict(new_user)
@@ -92,29 +147,108 @@ def get_all_categories():
     cursor.execute("SELECT * FROM categories ORDER BY name")
     categories = cursor.fetchall()
     conn.close()
-    return [dict(c) for c in categories]
+    return json_rows(categories, Category)
+
+@app.patch("/api/categories/{category_id}/auto-escalate", response_model=Category)
+def update_category_auto_escalate(category_id: int, hours: Optional[float] = None):
+    """Set how many hours an unanswered question waits before auto-escalation.
+
+    Omit `hours` to use the server default, or pass 0 to turn it off. Applies
+    to questions created from now on.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE categories SET auto_escalate_hours = ? WHERE id = ?", (hours, category_id))
+    conn.commit()
+    cursor.execute("SELECT * FROM categories WHERE id = ?", (category_id,))
+    category = cursor.fetchone()
+    conn.close()
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return dict(category)
+
+# ============== COURSE ENDPOINTS ==============
+
+@app.get("/api/courses", response_model=List[Course])
+def get_all_courses():
+    """Get all courses, including the default one."""
+    courses = [{"id": DEFAULT_COURSE, "name": "Default course"}]
+    for course_id in list_course_ids()[1:]:
+        courses.append(get_course(course_id))
+    return courses
+
+@app.post("/api/courses", response_model=Course)
+def create_course(course: CourseCreate):
+    """Register a course and create its database shard."""
+    users = [(u.name, u.role.value) for u in course.users] if course.users else None
+    try:
+        return register_course(course.id, course.name, users=users, categories=course.categories)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/courses/stats", response_model=List[CourseStats])
+def get_course_stats():
+    """Get per-course activity counts, queried across all shards in parallel."""
+    def stats(conn):
+        return dict(conn.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM users) as user_count,
+                (SELECT COUNT(*) FROM questions) as question_count,
+                (SELECT COUNT(*) FROM questions WHERE status = 'open') as open_count,
+                (SELECT COUNT(*) FROM questions WHERE status = 'escalated') as escalated_count,
+                (SELECT COUNT(*) FROM questions WHERE status = 'closed') as closed_count,
+                (SELECT COUNT(*) FROM responses) as response_count
+        """).fetchone())
+    return [dict(s, course_id=course_id) for course_id, s in fan_out(stats).items()]
+
+@app.get("/api/admin/courses/escalated", response_model=List[CourseQuestion])
+def get_escalated_across_courses():
+    """Get escalated questions from every course, oldest first."""
+    def escalated(conn):
+        return conn.execute("""
+            SELECT q.*, u.name as student_name, c.name as category_name,
+            (SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id AND r.is_visible = 1) as response_count
+            FROM questions q
+            JOIN users u ON q.student_id = u.id
+            JOIN categories c ON q.category_id = c.id
+            WHERE q.status = 'escalated'
+        """).fetchall()
+    questions = []
+    for course_id, rows in fan_out(escalated).items():
+        questions.extend(dict(r, course_id=course_id) for r in rows)
+    questions.sort(key=lambda q: q["created_at"])
+    return questions
 
 # ============== QUESTION ENDPOINTS ==============
 
+QUESTION_LIST_COLUMNS = """
+    q.*, u.name as student_name, c.name as category_name,
+    (SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id AND r.is_visible = 1) as response_count
+"""
+QUESTION_LIST_FROM = """
+    FROM questions q
+    JOIN users u ON q.student_id = u.id
+    JOIN categories c ON q.category_id = c.id
+    WHERE 1=1
+"""
+QUESTION_LIST_SQL = f"SELECT {QUESTION_LIST_COLUMNS} {QUESTION_LIST_FROM}"
+
 @app.get("/api/questions", response_model=List[Question])
 def get_questions(
     status: Optional[QuestionStatus] = None,
     category_id: Optional[int] = None,
     student_id: Optional[int] = None,
-    exclude_student_id: Optional[int] = None
+    exclude_student_id: Optional[int] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,title,status"),
+    view: Optional[str] = Query(None, description="'summary' for list pages: no code, short description"),
+    search: Optional[str] = Query(None, description="Case-insensitive match on title, full description or author")
 ):
     """Get questions with optional filters."""
+    columns = projection.select_columns(projection.QUESTION_COLUMNS, projection.QUESTION_VIEWS, fields, view)
     conn = get_connection()
     cursor = conn.cursor()
     
-    query = """
-        SELECT q.*, u.name as student_name, c.name as category_name,
-        (SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id AND r.is_visible = 1) as response_count
-        FROM questions q
-        JOIN users u ON q.student_id = u.id
-        JOIN categories c ON q.category_id = c.id
-        WHERE 1=1
-    """
+    query = f"SELECT {columns or QUESTION_LIST_COLUMNS} {QUESTION_LIST_FROM}"
     params = []
     
     if status:
@@ -129,33 +263,90 @@ def get_questions(
     if exclude_student_id:
         query += " AND q.student_id != ?"
         params.append(exclude_student_id)
+    if search and search.strip():
+        #Matched against the full columns, so it works with view=summary's shortened description
+        pattern = "%" + re.sub(r"([\\%_])", r"\\\1", search.strip()) + "%"
+        query += " AND (q.title LIKE ? ESCAPE '\\' OR q.description LIKE ? ESCAPE '\\' OR u.name LIKE ? ESCAPE '\\')"
+        params.extend([pattern] * 3)
     
     query += " ORDER BY q.created_at DESC"
     
     cursor.execute(query, params)
     questions = cursor.fetchall()
     conn.close()
-    return [dict(q) for q in questions]
+    return json_rows(questions, Question, partial=columns is not None)
 
-@app.get("/api/questions/{question_id}", response_model=Question)
-def get_question(question_id: int):
-    #Get a specific question by ID
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
+def _select_question(conn, question_id: int, schema: str = "main"):
+    #`schema` is "main" for live rows or "archive" once the archive is attached
+    return conn.execute(f"""
         SELECT q.*, u.name as student_name, c.name as category_name,
-        (SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id AND r.is_visible = 1) as response_count
-        FROM questions q
+        (SELECT COUNT(*) FROM {schema}.responses r WHERE r.question_id = q.id AND r.is_visible = 1) as response_count
+        FROM {schema}.questions q
         JOIN users u ON q.student_id = u.id
         JOIN categories c ON q.category_id = c.id
         WHERE q.id = ?
-    """, (question_id,))
-    question = cursor.fetchone()
+    """, (question_id,)).fetchone()
+
+def _select_responses(conn, question_id: int, include_hidden: bool, schema: str = "main"):
+    query = f"""
+        SELECT r.*, u.name as responder_name
+        FROM {schema}.responses r
+        JOIN users u ON r.responder_id = u.id
+        WHERE r.question_id = ?
+    """
+    if not include_hidden:
+        query += " AND r.is_visible = 1"
+    query += " ORDER BY r.created_at ASC"
+    return conn.execute(query, (question_id,)).fetchall()
+
+def _select_instructor_answer(conn, question_id: int, schema: str = "main"):
+    return conn.execute(f"""
+        SELECT ia.*, u.name as instructor_name
+        FROM {schema}.instructor_answers ia
+        JOIN users u ON ia.instructor_id = u.id
+        WHERE ia.question_id = ?
+    """, (question_id,)).fetchone()
+
+@app.get("/api/questions/{question_id}", response_model=Question)
+def get_question(question_id: int):
+    #Get a specific question by ID
+    conn = get_connection()
+    question = _select_question(conn, question_id)
+    if not question and attach_archive(conn, create=False):
+        #Fall back to cold storage for archived questions
+        question = _select_question(conn, question_id, "archive")
     conn.close()
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     return dict(question)
 
+@app.get("/api/questions/{question_id}/full", response_model=QuestionBundle)
+def get_question_bundle(question_id: int, include_hidden: bool = False):
+    """Question, responses and instructor answer for the question page, in one request.
+
+    Everything is read in one transaction, so the parts are from the same
+    snapshot (e.g. response_count matches the responses returned).
+    """
+    conn = get_connection()
+    try:
+        conn.execute("BEGIN")
+        schema = "main"
+        question = _select_question(conn, question_id)
+        if not question:
+            #Archived questions no longer change, and ATTACH can't run inside a transaction
+            conn.rollback()
+            if not attach_archive(conn, create=False):
+                raise HTTPException(status_code=404, detail="Question not found")
+            schema = "archive"
+            question = _select_question(conn, question_id, schema)
+            if not question:
+                raise HTTPException(status_code=404, detail="Question not found")
+        responses = _select_responses(conn, question_id, include_hidden, schema)
+        answer = _select_instructor_answer(conn, question_id, schema)
+    finally:
+        conn.close()
+    return json_bundle(QuestionBundle, question=question, responses=responses, instructor_answer=answer)
+
 @app.post("/api/questions", response_model=Question)
 def create_question(question: QuestionCreate, student_id: int = Query(...)):
     #Create a new question
@@ -173,8 +364,8 @@ def create_question(question: QuestionCreate, student_id: int = Query(...)):
         INSERT INTO questions (student_id, category_id, title, code_snippet, description)
         VALUES (?, ?, ?, ?, ?)
     """, (student_id, question.category_id, question.title, question.code_snippet, question.description))
-    conn.commit()
     question_id = cursor.lastrowid
+    escalate_at = escalation.schedule(conn, question_id)
     
     #Fetch the created question
     cursor.execute("""
@@ -185,7 +376,11 @@ def create_question(question: QuestionCreate, student_id: int = Query(...)):
         WHERE q.id = ?
     """, (question_id,))
     new_question = cursor.fetchone()
+    rollups.question_created(conn, new_question['category_id'], new_question['created_at'])
+    conn.commit()
     conn.close()
+    #Only once committed, or the scheduler could wake up and not see the deadline yet
+    escalation.scheduler.notify(escalate_at)
     return dict(new_question)
 
 @app.patch("/api/questions/{question_id}/status")
@@ -193,10 +388,29 @@ def update_question_status(question_id: int, status: QuestionStatus):
     #Update question status(escalate or close)
     conn = get_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT status, category_id FROM questions WHERE id = ?", (question_id,))
+    previous = cursor.fetchone()
+    escalate_at = None
     cursor.execute("UPDATE questions SET status = ? WHERE id = ?", (status.value, question_id))
-    conn.commit()
     affected = cursor.rowcount
+    if affected and status == QuestionStatus.escalated and previous['status'] != 'escalated':
+        rollups.question_escalated(conn, previous['category_id'], datetime.utcnow())
+    if affected and status == QuestionStatus.escalated:
+        triage.enqueue(conn, question_id)
+    elif affected:
+        triage.remove(conn, question_id)
+    if affected and status == QuestionStatus.open:
+        #Reopened: give peers another round before auto-escalating, unless someone already helped
+        cursor.execute(
+            "SELECT 1 FROM responses WHERE question_id = ? AND ai_rating = 'helpful' LIMIT 1", (question_id,)
+        )
+        if not cursor.fetchone():
+            escalate_at = escalation.schedule(conn, question_id, from_now=True)
+    elif affected:
+        escalation.cancel(conn, question_id)
+    conn.commit()
     conn.close()
+    escalation.scheduler.notify(escalate_at)
     if affected == 0:
         raise HTTPException(status_code=404, detail="Question not found")
     return {"message": f"Question status updated to {status.value}"}
@@ -206,9 +420,16 @@ def escalate_question(question_id: int):
     #Escalate a question to instructors(student clicks 'I still need help')
     conn = get_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT status, category_id FROM questions WHERE id = ?", (question_id,))
+    previous = cursor.fetchone()
     cursor.execute("UPDATE questions SET status = 'escalated' WHERE id = ?", (question_id,))
-    conn.commit()
     affected = cursor.rowcount
+    if affected and previous['status'] != 'escalated':
+        rollups.question_escalated(conn, previous['category_id'], datetime.utcnow())
+    if affected:
+        triage.enqueue(conn, question_id)
+        escalation.cancel(conn, question_id)
+    conn.commit()
     conn.close()
     if affected == 0:
         raise HTTPException(status_code=404, detail="Question not found")
@@ -220,22 +441,13 @@ def escalate_question(question_id: int):
 def get_responses(question_id: int, include_hidden: bool = False):
     #Get all responses for a question
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    query = """
-        SELECT r.*, u.name as responder_name
-        FROM responses r
-        JOIN users u ON r.responder_id = u.id
-        WHERE r.question_id = ?
-    """
-    if not include_hidden:
-        query += " AND r.is_visible = 1"
-    query += " ORDER BY r.created_at ASC"
-    
-    cursor.execute(query, (question_id,))
-    responses = cursor.fetchall()
+    responses = _select_responses(conn, question_id, include_hidden)
+    if not responses:
+        exists = conn.execute("SELECT 1 FROM questions WHERE id = ?", (question_id,)).fetchone()
+        if not exists and attach_archive(conn, create=False):
+            responses = _select_responses(conn, question_id, include_hidden, "archive")
     conn.close()
-    return [dict(r) for r in responses]
+    return json_rows(responses, Response)
 
 @app.post("/api/responses", response_model=Response)
 def create_response(response: ResponseCreate, responder_id: int = Query(...)):
@@ -269,36 +481,70 @@ def create_response(response: ResponseCreate, responder_id: int = Query(...)):
     
     # Evaluate response using AI judge
     ai_judge = get_ai_judge()
-    evaluation = ai_judge.evaluate_response(
-        question_title=question['title'],
-        question_description=question['description'],
-        code_snippet=question['code_snippet'] or "",
-        concept_involved=response.concept_involved,
-        hint_guidance=response.hint_guidance,
-        what_to_try_next=response.what_to_try_next or ""
-    )
+    course_id = get_current_course()
+    try:
+        with judge_scheduler.scheduler.slot(
+            judge_scheduler.INTERACTIVE,
+            user=f"{course_id}:{responder_id}",
+            question=(course_id, response.question_id),
+            #The mock judge is free, so only Gemini calls count against the per-responder limit
+            limit_rate=ai_judge.client is not None
+        ), profiler.span("judge"):
+            evaluation = ai_judge.evaluate_response(
+                question_title=question['title'],
+                question_description=question['description'],
+                code_snippet=question['code_snippet'] or "",
+                concept_involved=response.concept_involved,
+                hint_guidance=response.hint_guidance,
+                what_to_try_next=response.what_to_try_next or ""
+            )
+    except judge_scheduler.JudgeRejected as e:
+        conn.close()
+        raise HTTPException(
+            status_code=e.status_code, detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
     
     # Insert response
     is_visible = 1 if evaluation.rating.value == "helpful" else 0
-    cursor.execute("""
-        INSERT INTO responses 
-        (question_id, responder_id, concept_involved, hint_guidance, what_to_try_next,
-         ai_rating, ai_reason, is_visible, karma_awarded)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        response.question_id, responder_id,
-        response.concept_involved, response.hint_guidance, response.what_to_try_next,
-        evaluation.rating.value, evaluation.reason, is_visible, evaluation.karma_change
-    ))
-    conn.commit()
-    response_id = cursor.lastrowid
     
-    # Update responder's karma
-    cursor.execute(
-        "UPDATE users SET karma = karma + ? WHERE id = ?",
-        (evaluation.karma_change, responder_id)
-    )
-    conn.commit()
+    def insert_response(write_conn):
+        cursor = write_conn.execute("""
+            INSERT INTO responses 
+            (question_id, responder_id, concept_involved, hint_guidance, what_to_try_next,
+             ai_rating, ai_reason, is_visible, karma_awarded)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            response.question_id, responder_id,
+            response.concept_involved, response.hint_guidance, response.what_to_try_next,
+            evaluation.rating.value, evaluation.reason, is_visible, evaluation.karma_change
+        ))
+        response_id = cursor.lastrowid
+        
+        # Update analytics rollups
+        cursor.execute("SELECT created_at FROM responses WHERE id = ?", (response_id,))
+        responded_at = cursor.fetchone()['created_at']
+        first_helpful_after = None
+        if is_visible:
+            cursor.execute(
+                "SELECT 1 FROM responses WHERE question_id = ? AND ai_rating = 'helpful' AND id != ? LIMIT 1",
+                (response.question_id, response_id)
+            )
+            if not cursor.fetchone():
+                first_helpful_after = rollups.hours_between(question['created_at'], responded_at)
+        rollups.response_created(
+            write_conn, question['category_id'], responded_at, bool(is_visible), first_helpful_after
+        )
+        if is_visible:
+            escalation.cancel(write_conn, response.question_id)
+        else:
+            triage.rescore_if_queued(write_conn, response.question_id)
+        #Responder's karma goes into the ledger in the same transaction
+        karma.record_event(write_conn, responder_id, evaluation.karma_change, "response rated", response_id)
+        return response_id
+
+    #Committed on its own or batched with other submissions (see group_commit.py)
+    response_id = group_commit.run(insert_response)
     
     # Fetch the created response
     cursor.execute("""
@@ -312,21 +558,42 @@ def create_response(response: ResponseCreate, responder_id: int = Query(...)):
     
     return dict(new_response)
 
-@app.get("/api/users/{user_id}/responses", response_model=List[Response])
-def get_user_responses(user_id: int):
-    #Get all responses made by a user
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
+def _select_user_responses(conn, user_id: int):
+    return conn.execute("""
         SELECT r.*, u.name as responder_name
         FROM responses r
         JOIN users u ON r.responder_id = u.id
         WHERE r.responder_id = ?
         ORDER BY r.created_at DESC
-    """, (user_id,))
-    responses = cursor.fetchall()
+    """, (user_id,)).fetchall()
+
+@app.get("/api/users/{user_id}/responses", response_model=List[Response])
+def get_user_responses(user_id: int):
+    #Get all responses made by a user
+    conn = get_connection()
+    responses = _select_user_responses(conn, user_id)
     conn.close()
-    return [dict(r) for r in responses]
+    return json_rows(responses, Response)
+
+@app.get("/api/users/{user_id}/dashboard", response_model=UserDashboard)
+def get_user_dashboard(user_id: int):
+    """User, their questions and their responses for the student dashboard, in one request.
+
+    Read in one transaction, so karma and the responses come from the same snapshot.
+    """
+    conn = get_connection()
+    try:
+        conn.execute("BEGIN")
+        user = conn.execute(f"SELECT {karma.USER_COLUMNS_SQL} FROM users u WHERE u.id = ?", (user_id,)).fetchone()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        questions = conn.execute(
+            QUESTION_LIST_SQL + " AND q.student_id = ? ORDER BY q.created_at DESC", (user_id,)
+        ).fetchall()
+        responses = _select_user_responses(conn, user_id)
+    finally:
+        conn.close()
+    return json_bundle(UserDashboard, user=user, questions=questions, responses=responses)
 
 # ============== INSTRUCTOR ANSWER ENDPOINTS ==============
 
@@ -334,14 +601,9 @@ def get_user_responses(user_id: int):
 def get_instructor_answer(question_id: int):
     #Get instructor answer for a question
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT ia.*, u.name as instructor_name
-        FROM instructor_answers ia
-        JOIN users u ON ia.instructor_id = u.id
-        WHERE ia.question_id = ?
-    """, (question_id,))
-    answer = cursor.fetchone()
+    answer = _select_instructor_answer(conn, question_id)
+    if not answer and attach_archive(conn, create=False):
+        answer = _select_instructor_answer(conn, question_id, "archive")
     conn.close()
     if not answer:
         return None
@@ -365,11 +627,24 @@ def create_instructor_answer(answer: InstructorAnswerCreate, instructor_id: int
         INSERT INTO instructor_answers (question_id, instructor_id, content)
         VALUES (?, ?, ?)
     """, (answer.question_id, instructor_id, answer.content))
-    conn.commit()
     answer_id = cursor.lastrowid
     
+    # Update analytics rollups
+    cursor.execute("""
+        SELECT q.category_id, q.created_at as asked_at, ia.created_at
+        FROM instructor_answers ia
+        JOIN questions q ON ia.question_id = q.id
+        WHERE ia.id = ?
+    """, (answer_id,))
+    answered = cursor.fetchone()
+    if answered:
+        rollups.instructor_answered(conn, answered['category_id'], answered['asked_at'], answered['created_at'])
+    conn.commit()
+    
     # Close the question
     cursor.execute("UPDATE questions SET status = 'closed' WHERE id = ?", (answer.question_id,))
+    triage.remove(conn, answer.question_id)
+    escalation.cancel(conn, answer.question_id)
     conn.commit()
     
     # Fetch the created answer
@@ -384,27 +659,67 @@ def create_instructor_answer(answer: InstructorAnswerCreate, instructor_id: int
     
     return dict(new_answer)
 
+# ============== TRIAGE ENDPOINTS ==============
+
+@app.get("/api/triage", response_model=List[TriageItem])
+def get_triage_queue(limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    #Escalated questions in priority order, with who currently holds each one
+    return triage.list_queue(limit=limit, offset=offset)
+
+@app.get("/api/triage/next", response_model=Optional[TriageItem])
+def claim_next_triage(instructor_id: int = Query(...), lease_seconds: int = Query(triage.DEFAULT_LEASE_SECONDS, ge=30, le=3600)):
+    #Claim the most urgent unclaimed question for this instructor
+    _require_instructor(instructor_id)
+    return triage.claim_next(instructor_id, lease_seconds=lease_seconds)
+
+@app.post("/api/triage/{question_id}/claim", response_model=TriageItem)
+def claim_triage_question(question_id: int, instructor_id: int = Query(...), lease_seconds: int = Query(triage.DEFAULT_LEASE_SECONDS, ge=30, le=3600)):
+    #Claim (or renew the claim on) a specific escalated question
+    _require_instructor(instructor_id)
+    item = triage.claim(question_id, instructor_id, lease_seconds=lease_seconds)
+    if not item:
+        raise HTTPException(status_code=409, detail="Question is not queued or is claimed by another instructor")
+    return item
+
+@app.post("/api/triage/{question_id}/release")
+def release_triage_question(question_id: int, instructor_id: int = Query(...)):
+    #Give a claimed question back to the queue
+    if not triage.release(question_id, instructor_id):
+        raise HTTPException(status_code=404, detail="No claim held on this question")
+    return {"message": "Question released"}
+
+def _require_instructor(instructor_id: int):
+    conn = get_connection()
+    user = conn.execute("SELECT role FROM users WHERE id = ?", (instructor_id,)).fetchone()
+    conn.close()
+    if not user or user['role'] != 'instructor':
+        raise HTTPException(status_code=400, detail="Invalid instructor ID")
+
 # ============== ANALYTICS ENDPOINTS ==============
 
 @app.get("/api/analytics/karma-leaderboard", response_model=List[KarmaLeaderboard])
-def get_karma_leaderboard():
-    #Get karma leaderboard for all students
+def get_karma_leaderboard(since: Optional[datetime] = None):
+    #Get karma leaderboard for all students, optionally only karma earned since a point in time
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("""
+    karma_sql = karma.windowed_karma_sql(":since") if since else karma.CURRENT_KARMA_SQL
+    cursor.execute(f"""
         SELECT 
             u.id as user_id,
             u.name,
-            u.karma,
-            (SELECT COUNT(*) FROM responses r WHERE r.responder_id = u.id AND r.ai_rating = 'helpful') as helpful_responses,
-            (SELECT COUNT(*) FROM responses r WHERE r.responder_id = u.id AND r.ai_rating = 'unhelpful') as unhelpful_responses
+            {karma_sql} as karma,
+            (SELECT COUNT(*) FROM responses r WHERE r.responder_id = u.id AND r.ai_rating = 'helpful')
+                + COALESCE(a.helpful_responses, 0) as helpful_responses,
+            (SELECT COUNT(*) FROM responses r WHERE r.responder_id = u.id AND r.ai_rating = 'unhelpful')
+                + COALESCE(a.unhelpful_responses, 0) as unhelpful_responses
         FROM users u
+        LEFT JOIN archive_user_totals a ON a.user_id = u.id
         WHERE u.role = 'student'
-        ORDER BY u.karma DESC
-    """)
+        ORDER BY karma DESC
+    """, {"since": rollups.to_utc_naive(since).strftime(rollups.TIMESTAMP_FORMAT) if since else None})
     leaderboard = cursor.fetchall()
     conn.close()
-    return [dict(l) for l in leaderboard]
+    return json_rows(leaderboard, KarmaLeaderboard)
 
 @app.get("/api/analytics/dashboard", response_model=AnalyticsDashboard)
 def get_analytics_dashboard():
@@ -412,15 +727,27 @@ def get_analytics_dashboard():
     conn = get_connection()
     cursor = conn.cursor()
     
+    #Totals carried forward from archived questions
+    cursor.execute("""
+        SELECT
+            COALESCE(SUM(response_count), 0) as responses,
+            COALESCE(SUM(helpful_count), 0) as helpful,
+            COALESCE(SUM(unhelpful_count), 0) as unhelpful,
+            COALESCE(SUM(resolved_count), 0) as resolved,
+            COALESCE(SUM(resolution_hours_total), 0) as resolution_hours
+        FROM archive_totals
+    """)
+    archived = cursor.fetchone()
+    
     # Response quality stats
     cursor.execute("SELECT COUNT(*) as total FROM responses")
-    total_responses = cursor.fetchone()['total']
+    total_responses = cursor.fetchone()['total'] + archived['responses']
     
     cursor.execute("SELECT COUNT(*) as count FROM responses WHERE ai_rating = 'helpful'")
-    helpful_count = cursor.fetchone()['count']
+    helpful_count = cursor.fetchone()['count'] + archived['helpful']
     
     cursor.execute("SELECT COUNT(*) as count FROM responses WHERE ai_rating = 'unhelpful'")
-    unhelpful_count = cursor.fetchone()['count']
+    unhelpful_count = cursor.fetchone()['count'] + archived['unhelpful']
     
     helpful_percentage = (helpful_count / total_responses * 100) if total_responses > 0 else 0
     
@@ -433,48 +760,49 @@ def get_analytics_dashboard():
     
     #Average resolution time (for closed questions)
     cursor.execute("""
-        SELECT AVG(
-            (julianday(ia.created_at) - julianday(q.created_at)) * 24
-        ) as avg_hours
+        SELECT
+            SUM((julianday(ia.created_at) - julianday(q.created_at)) * 24) as total_hours,
+            COUNT(*) as resolved
         FROM questions q
         JOIN instructor_answers ia ON q.id = ia.question_id
         WHERE q.status = 'closed'
     """)
-    avg_resolution = cursor.fetchone()['avg_hours']
+    resolution = cursor.fetchone()
+    resolved = resolution['resolved'] + archived['resolved']
+    avg_resolution = (
+        ((resolution['total_hours'] or 0) + archived['resolution_hours']) / resolved
+        if resolved else None
+    )
     
     # Category stats
     cursor.execute("""
         SELECT 
             c.id as category_id,
             c.name as category_name,
-            COUNT(q.id) as question_count,
-            COALESCE(AVG(
-                (SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id)
-            ), 0) as avg_responses_per_question
+            live.question_count + COALESCE(a.question_count, 0) as question_count,
+            COALESCE(
+                (live.response_count + COALESCE(a.response_count, 0)) * 1.0
+                / NULLIF(live.question_count + COALESCE(a.question_count, 0), 0),
+            0) as avg_responses_per_question
         FROM categories c
-        LEFT JOIN questions q ON c.id = q.category_id
-        GROUP BY c.id, c.name
+        JOIN (
+            SELECT c.id as category_id, COUNT(q.id) as question_count,
+            COALESCE(SUM((SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id)), 0) as response_count
+            FROM categories c
+            LEFT JOIN questions q ON c.id = q.category_id
+            GROUP BY c.id
+        ) live ON live.category_id = c.id
+        LEFT JOIN archive_totals a ON a.category_id = c.id
         ORDER BY question_count DESC
     """)
     category_stats = [dict(c) for c in cursor.fetchall()]
+    resolution_by_category = rollups.category_resolution_hours(conn)
+    for stats in category_stats:
+        hours = resolution_by_category.get(stats['category_id'])
+        stats['avg_resolution_time_hours'] = round(hours, 1) if hours is not None else None
     
-    #Common misconceptions (based on unhelpful response patterns by category)
-    
-    cursor.execute("""
-        SELECT 
-            c.name as category_name,
-            r.ai_reason as misconception,
-            COUNT(*) as occurrence_count
-        FROM responses r
-        JOIN questions q ON r.question_id = q.id
-        JOIN categories c ON q.category_id = c.id
-        WHERE r.ai_rating = 'unhelpful'
-        GROUP BY c.name, r.ai_reason
-        HAVING COUNT(*) > 0
-        ORDER BY occurrence_count DESC
-        LIMIT 10
-    """)
-    misconceptions = [dict(m) for m in cursor.fetchall()]
+    #Common misconceptions (clusters of unhelpful response reasons, precomputed by misconceptions.py)
+    common_misconceptions = misconceptions.top_misconceptions(conn, limit=10)
     
     conn.close()
     
@@ -482,7 +810,7 @@ def get_analytics_dashboard():
         response_quality=response_quality,
         avg_resolution_time_hours=round(avg_resolution, 1) if avg_resolution else None,
         category_stats=category_stats,
-        common_misconceptions=misconceptions
+        common_misconceptions=common_misconceptions
     )
 
 @app.get("/api/analytics/all-responses", response_model=List[Response])
@@ -503,10 +831,108 @@ def get_all_responses(include_hidden: bool = True):
     cursor.execute(query)
     responses = cursor.fetchall()
     conn.close()
-    return [dict(r) for r in responses]
+    return json_rows(responses, Response)
+
+@app.get("/api/analytics/timeseries", response_model=AnalyticsTimeseries)
+def get_analytics_timeseries(
+    start: datetime,
+    end: datetime,
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    category_id: Optional[int] = None
+):
+    #Activity and resolution-time percentiles for a date range, merged from rollup buckets
+    start, end = rollups.to_utc_naive(start), rollups.to_utc_naive(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    conn = get_connection()
+    summary = rollups.summarize_range(conn, start, end, category_id)
+    points = rollups.timeseries(conn, start, end, granularity, category_id)
+    conn.close()
+    return {
+        "start": start,
+        "end": end,
+        "granularity": granularity,
+        "category_id": category_id,
+        "summary": summary,
+        "points": points
+    }
+
+# ============== ARCHIVE ENDPOINTS ==============
+
+@app.post("/api/admin/archive")
+def archive_questions(before: datetime, chunk_size: int = 500):
+    #Move questions closed before `before` into cold storage
+    totals = archive_closed_questions(before, chunk_size=chunk_size)
+    return {"message": f"Archived {totals['questions']} questions", "archived": totals}
+
+@app.post("/api/admin/archive/{question_id}/restore")
+def restore_archived_question(question_id: int):
+    #Move an archived question back into the live tables
+    if not restore_question(question_id):
+        raise HTTPException(status_code=404, detail="Archived question not found")
+    return {"message": f"Question {question_id} restored"}
+
+# ============== BACKUP ENDPOINTS ==============
+
+@app.get("/api/admin/backups")
+def list_backups():
+    #Snapshots of the current course, newest first
+    return backup.list_snapshots()
+
+@app.post("/api/admin/backups")
+def create_backup(compress: Optional[bool] = None):
+    #Take a snapshot now; the manifest includes how long the copy held database locks
+    try:
+        return backup.take_snapshot(compress=compress)
+    except backup.BackupError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/backups/{name}/restore")
+def restore_backup(name: str):
+    #Replace the current course's data with a snapshot (the current data is snapshotted first)
+    try:
+        result = backup.restore(name)
+    except backup.BackupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    escalation.scheduler.notify(escalation.next_deadline())
+    return result
+
+# ============== PROFILING ENDPOINTS ==============
+
+@app.get("/api/admin/profiles")
+def list_profiles():
+    #Recent slow or sampled requests of this worker, newest first
+    return profiler.list_reports()
+
+@app.get("/api/admin/profiles/flamegraph", response_class=PlainTextResponse)
+def download_flamegraph():
+    #Sampled stacks of all buffered requests in folded format (flamegraph.pl, speedscope)
+    return profiler.folded_stacks(profiler.all_reports())
+
+@app.get("/api/admin/profiles/{report_id}")
+def get_profile(report_id: int):
+    #Full report: SQL timings and query plans, spans and sampled stacks
+    report = profiler.get_report(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found (reports are kept per worker)")
+    return report
+
+@app.get("/api/admin/profiles/{report_id}/flamegraph", response_class=PlainTextResponse)
+def download_profile_flamegraph(report_id: int):
+    report = profiler.get_report(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found (reports are kept per worker)")
+    return profiler.folded_stacks([report])
 
 # ============== AI CONFIGURATION ENDPOINT ==============
 
+@app.get("/api/admin/judge-scheduler")
+def judge_scheduler_stats():
+    #Judge slots in use, queue lengths, queue wait percentiles and rejections of this worker
+    return judge_scheduler.scheduler.stats()
+
 @app.post("/api/config/ai")
 def configure_ai(api_key: str, provider: str = "gemini"):
     #Configure the AI judge (gemini or claude)
@@ -524,4 +950,12 @@ def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        #Set up the schema once here; workers inherit the flag and skip it
+        init_database()
+        seed_data()
+        os.environ["FORUM_DB_INITIALIZED"] = "1"
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
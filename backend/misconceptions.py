@@ -0,0 +1,269 @@
+"""Offline clustering of unhelpful-response reasons into common misconceptions.
+
+Real judge output gives every unhelpful response a unique `ai_reason`, so
+grouping by the exact string finds nothing. Instead this job turns
+`ai_reason` + `concept_involved` into hashed TF-IDF vectors and clusters
+them incrementally per category: each new response joins the closest
+cluster (cosine similarity above SIMILARITY_THRESHOLD) or starts a new one.
+Clusters, their labels, representative examples and counts are stored in
+`misconception_clusters`, so the dashboard reads them in O(clusters).
+
+Archived responses are read from the course's archive, so a rebuild keeps
+their share of the clusters.
+
+Runs as a background job in the API, or by hand:
+    python misconceptions.py [--course cs101] [--rebuild]
+"""
+import argparse
+import json
+import os
+import re
+import zlib
+from typing import Optional
+
+from archive import ARCHIVE_ALIAS, attach_archive
+from database import get_connection, list_course_ids
+
+FEATURE_DIM = 2048
+SIMILARITY_THRESHOLD = float(os.getenv("MISCONCEPTION_SIMILARITY", "0.35"))
+BATCH_SIZE = 500
+MAX_EXAMPLES = 3
+LABEL_TERMS = 3
+TRACKED_TERMS = 20
+INTERVAL_SECONDS = float(os.getenv("MISCONCEPTION_INTERVAL_SECONDS", "60"))
+
+#numpy, imported by _load_numpy() on first use: the API imports this module at startup, where ~100 ms of numpy
+#would dominate a worker's cold start, but only the background job and the CLI cluster anything
+np = None
+
+_TOKEN = re.compile(r"[a-z][a-z0-9_]+")
+STOP_WORDS = {
+    "the", "and", "for", "that", "this", "with", "instead", "response", "responses",
+    "are", "was", "not", "but", "its", "it's", "of", "to", "is", "in", "on", "too",
+    "be", "by", "an", "as", "or", "at", "from", "than", "does", "doesn", "has", "have",
+}
+
+
+def tokenize(text: str) -> list:
+    words = [w for w in _TOKEN.findall((text or "").lower()) if w not in STOP_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _feature(term: str) -> int:
+    #crc32 rather than hash(): must be stable across processes and restarts
+    return zlib.crc32(term.encode("utf-8")) % FEATURE_DIM
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+def term_counts(terms: list) -> "np.ndarray":
+    counts = np.zeros(FEATURE_DIM, dtype=np.float32)
+    for term in terms:
+        counts[_feature(term)] += 1
+    return counts
+
+
+def _load_state(conn):
+    row = conn.execute("SELECT * FROM misconception_state WHERE id = 1").fetchone()
+    if not row:
+        return 0, 0, np.zeros(FEATURE_DIM, dtype=np.float32)
+    return row["last_response_id"], row["doc_count"], np.frombuffer(row["doc_freq"], dtype=np.float32).copy()
+
+
+def _save_state(conn, last_response_id: int, doc_count: int, doc_freq: "np.ndarray"):
+    conn.execute("""
+        INSERT INTO misconception_state (id, last_response_id, doc_count, doc_freq)
+        VALUES (1, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            last_response_id = excluded.last_response_id,
+            doc_count = excluded.doc_count,
+            doc_freq = excluded.doc_freq
+    """, (last_response_id, doc_count, doc_freq.astype(np.float32).tobytes()))
+
+
+def _load_clusters(conn) -> dict:
+    clusters = {}
+    for row in conn.execute("SELECT * FROM misconception_clusters"):
+        clusters.setdefault(row["category_id"], []).append({
+            "id": row["id"],
+            "centroid": np.frombuffer(row["centroid"], dtype=np.float32).copy(),
+            "count": row["occurrence_count"],
+            "examples": json.loads(row["examples"]),
+            "terms": json.loads(row["top_terms"]),
+            "dirty": False,
+        })
+    return clusters
+
+
+def _label(terms: dict) -> str:
+    ranked = sorted(terms.items(), key=lambda item: (-item[1], item[0]))
+    return ", ".join(term for term, _ in ranked[:LABEL_TERMS])
+
+
+def _assign(category_clusters: list, vector: "np.ndarray", terms: list, reason: str):
+    best, best_similarity = None, -1.0
+    if category_clusters:
+        centroids = np.stack([c["centroid"] for c in category_clusters])
+        similarities = centroids @ vector
+        index = int(np.argmax(similarities))
+        best, best_similarity = category_clusters[index], float(similarities[index])
+
+    if best is None or best_similarity < SIMILARITY_THRESHOLD:
+        best = {"id": None, "centroid": vector.copy(), "count": 0, "examples": [], "terms": {}}
+        category_clusters.append(best)
+        best_similarity = 1.0
+    else:
+        #Move the centroid toward the new member, weighted by cluster size, and re-normalize for cosine
+        #lookups. The stored centroid is already normalized, so this is not the exact mean of the members,
+        #but it stays close to their mean direction
+        centroid = best["centroid"] * best["count"] + vector
+        best["centroid"] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+    best["count"] += 1
+    best["dirty"] = True
+    for term in set(terms):
+        best["terms"][term] = best["terms"].get(term, 0) + 1
+    if len(best["terms"]) > TRACKED_TERMS * 2:
+        best["terms"] = dict(sorted(best["terms"].items(), key=lambda item: -item[1])[:TRACKED_TERMS])
+
+    #Keep the examples closest to the cluster centre as representatives
+    examples = best["examples"]
+    if reason and all(e["text"] != reason for e in examples):
+        examples.append({"text": reason, "similarity": round(best_similarity, 4)})
+        examples.sort(key=lambda e: -e["similarity"])
+        del examples[MAX_EXAMPLES:]
+
+
+def _save_clusters(conn, clusters: dict):
+    for category_id, category_clusters in clusters.items():
+        for cluster in category_clusters:
+            if not cluster.get("dirty", True):
+                continue
+            values = (
+                _label(cluster["terms"]),
+                cluster["centroid"].astype(np.float32).tobytes(),
+                cluster["count"],
+                json.dumps(cluster["examples"]),
+                json.dumps(cluster["terms"]),
+            )
+            if cluster["id"] is None:
+                conn.execute("""
+                    INSERT INTO misconception_clusters
+                    (category_id, label, centroid, occurrence_count, examples, top_terms)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (category_id,) + values)
+            else:
+                conn.execute("""
+                    UPDATE misconception_clusters
+                    SET label = ?, centroid = ?, occurrence_count = ?, examples = ?, top_terms = ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, values + (cluster["id"],))
+
+
+def cluster_new_responses(course_id: Optional[str] = None, batch_size: int = BATCH_SIZE) -> int:
+    """Cluster unhelpful responses added since the last run; returns how many were processed.
+
+    IDF weights come from every reason seen so far, so older centroids were
+    built with slightly different weights. That drift is small once a course
+    has a few hundred responses; --rebuild reclusters from scratch.
+    """
+    _load_numpy()
+    conn = get_connection(course_id)
+    processed = 0
+    schemas = ["main", ARCHIVE_ALIAS] if attach_archive(conn, create=False) else ["main"]
+    #Responses keep their ids when archived or restored, so one id cursor covers both databases
+    query = " UNION ALL ".join(f"""
+        SELECT r.id, r.ai_reason, r.concept_involved, q.category_id
+        FROM {schema}.responses r
+        JOIN {schema}.questions q ON r.question_id = q.id
+        WHERE r.id > :last_id AND r.ai_rating = 'unhelpful'
+    """ for schema in schemas)
+    try:
+        clusters = _load_clusters(conn)
+        while True:
+            last_id, doc_count, doc_freq = _load_state(conn)
+            rows = conn.execute(
+                f"SELECT * FROM ({query}) ORDER BY id LIMIT :limit",
+                {"last_id": last_id, "limit": batch_size}
+            ).fetchall()
+            if not rows:
+                break
+
+            documents = [tokenize(f"{r['ai_reason']} {r['concept_involved']}") for r in rows]
+            counts = [term_counts(terms) for terms in documents]
+            for vector in counts:
+                doc_freq += vector > 0
+            doc_count += len(rows)
+            idf = np.log((1 + doc_count) / (1 + doc_freq)) + 1
+
+            for row, terms, vector in zip(rows, documents, counts):
+                weighted = vector * idf
+                norm = np.linalg.norm(weighted)
+                if not norm:
+                    continue
+                _assign(clusters.setdefault(row["category_id"], []), weighted / norm, terms, row["ai_reason"])
+
+            conn.execute("BEGIN IMMEDIATE")
+            if _load_state(conn)[0] != last_id:
+                #Another run (the background job or the CLI) clustered this batch first; start over from its state
+                conn.rollback()
+                clusters = _load_clusters(conn)
+                continue
+            _save_clusters(conn, clusters)
+            _save_state(conn, rows[-1]["id"], doc_count, doc_freq)
+            conn.commit()
+            clusters = _load_clusters(conn)
+            processed += len(rows)
+    finally:
+        conn.close()
+    return processed
+
+
+def rebuild(course_id: Optional[str] = None) -> int:
+    conn = get_connection(course_id)
+    conn.execute("DELETE FROM misconception_clusters")
+    conn.execute("DELETE FROM misconception_state")
+    conn.commit()
+    conn.close()
+    return cluster_new_responses(course_id)
+
+
+def run_all_courses():
+    for course_id in list_course_ids():
+        cluster_new_responses(course_id)
+
+
+def top_misconceptions(conn, limit: int = 10) -> list:
+    rows = conn.execute("""
+        SELECT c.name as category_name, mc.label, mc.examples, mc.occurrence_count
+        FROM misconception_clusters mc
+        JOIN categories c ON mc.category_id = c.id
+        ORDER BY mc.occurrence_count DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+    misconceptions = []
+    for row in rows:
+        examples = [e["text"] for e in json.loads(row["examples"])]
+        misconceptions.append({
+            "category_name": row["category_name"],
+            "misconception": examples[0] if examples else row["label"],
+            "label": row["label"],
+            "examples": examples,
+            "occurrence_count": row["occurrence_count"],
+        })
+    return misconceptions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster unhelpful-response reasons into misconceptions.")
+    parser.add_argument("--course", default=None, help="Course ID (default course if omitted)")
+    parser.add_argument("--rebuild", action="store_true", help="Drop existing clusters and start over")
+    args = parser.parse_args()
+    count = rebuild(args.course) if args.rebuild else cluster_new_responses(args.course)
+    print(f"Clustered {count} responses")
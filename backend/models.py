@@ -40,10 +40,32 @@ class UserLogin(BaseModel):
 class Category(BaseModel):
     id: int
     name: str
+    auto_escalate_hours: Optional[float] = None
     
     class Config:
         from_attributes = True
 
+# Course Models
+class CourseCreate(BaseModel):
+    id: str
+    name: str
+    categories: Optional[List[str]] = None
+    users: Optional[List[UserCreate]] = None
+
+class Course(BaseModel):
+    id: str
+    name: str
+    created_at: Optional[datetime] = None
+
+class CourseStats(BaseModel):
+    course_id: str
+    user_count: int
+    question_count: int
+    open_count: int
+    escalated_count: int
+    closed_count: int
+    response_count: int
+
 # Question Models
 class QuestionCreate(BaseModel):
     category_id: int
@@ -65,11 +87,22 @@ class Question(BaseModel):
     description: str
     status: QuestionStatus
     created_at: datetime
+    escalate_at: Optional[datetime] = None
     response_count: Optional[int] = 0
     
     class Config:
         from_attributes = True
 
+class CourseQuestion(Question):
+    course_id: str
+
+class TriageItem(Question):
+    priority_score: float
+    unhelpful_attempts: int
+    category_backlog: int
+    claimed_by: Optional[int] = None
+    lease_expires_at: Optional[datetime] = None
+
 # Response Models (Peer Responses)
 class ResponseCreate(BaseModel):
     question_id: int
@@ -110,6 +143,17 @@ class InstructorAnswer(BaseModel):
     class Config:
         from_attributes = True
 
+# View Bundles (everything one page needs, in a single request)
+class QuestionBundle(BaseModel):
+    question: Question
+    responses: List[Response]
+    instructor_answer: Optional[InstructorAnswer] = None
+
+class UserDashboard(BaseModel):
+    user: User
+    questions: List[Question]
+    responses: List[Response]
+
 # AI Evaluation Models
 class AIEvaluation(BaseModel):
     rating: AIRating
@@ -141,9 +185,38 @@ class CommonMisconception(BaseModel):
     category_name: str
     misconception: str
     occurrence_count: int
+    label: Optional[str] = None
+    examples: List[str] = []
 
 class AnalyticsDashboard(BaseModel):
     response_quality: ResponseQualityStats
     avg_resolution_time_hours: Optional[float]
     category_stats: List[CategoryStats]
     common_misconceptions: List[CommonMisconception]
+
+class DurationPercentiles(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+
+class RollupStats(BaseModel):
+    questions_created: int
+    questions_escalated: int
+    questions_answered: int
+    responses_created: int
+    helpful_responses: int
+    time_to_first_helpful_hours: DurationPercentiles
+    time_to_instructor_answer_hours: DurationPercentiles
+
+class TimeseriesPoint(RollupStats):
+    bucket_start: datetime
+
+class AnalyticsTimeseries(BaseModel):
+    start: datetime
+    end: datetime
+    granularity: str
+    category_id: Optional[int] = None
+    summary: RollupStats
+    points: List[TimeseriesPoint]
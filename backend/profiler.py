@@ -0,0 +1,319 @@
+"""Opt-in request profiler for slow-request reports.
+
+Enabled by PROFILE_SAMPLE_RATE (fraction of requests to profile) and/or
+PROFILE_SLOW_MS (profile every request and keep those slower than this).
+With both unset the middleware passes requests straight through and
+connections are the plain pooled ones, so there is no overhead at all.
+
+A profiled request records:
+- every SQL statement it runs, with its count and time to first row,
+  plus `EXPLAIN QUERY PLAN` for the slowest ones (run only for kept reports)
+- named spans such as the AI judge call (see `span`)
+- call stacks, sampled every PROFILE_INTERVAL_MS by a single background
+  thread from the threads working on the request, instead of tracing
+  every call
+
+Kept reports go into a ring buffer of the last PROFILE_BUFFER_SIZE reports.
+The buffer belongs to the worker process, so with several workers each one
+has its own. Stacks can be downloaded in the folded format that
+flamegraph.pl and speedscope read.
+"""
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+import database
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "100"))
+PROFILE_ENABLED = PROFILE_SAMPLE_RATE > 0 or PROFILE_SLOW_MS > 0
+
+#Statements that get an EXPLAIN QUERY PLAN in a report, slowest first
+EXPLAIN_LIMIT = 20
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+#The profile of the request being handled; copied into threadpool threads with the rest of the context
+_current = ContextVar("current_profile", default=None)
+#Thread id -> profile it last did work for, which the sampler attributes that thread's stack to
+_thread_profiles = {}
+_reports = deque(maxlen=PROFILE_BUFFER_SIZE)
+_report_ids = itertools.count(1)
+
+
+class Profile:
+    def __init__(self, method: str, path: str, query: str, course_id: str):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.course_id = course_id
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        #sql -> [count, total seconds, max seconds, first parameters]
+        self.statements = {}
+        self.spans = []
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+
+    def attach_thread(self):
+        _thread_profiles[threading.get_ident()] = self
+
+    def detach_threads(self):
+        for thread_id, profile in list(_thread_profiles.items()):
+            if profile is self:
+                _thread_profiles.pop(thread_id, None)
+
+    def record_sql(self, sql: str, parameters, seconds: float):
+        self.attach_thread()
+        with self._lock:
+            entry = self.statements.get(sql)
+            if entry is None:
+                self.statements[sql] = [1, seconds, seconds, parameters]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+
+    def record_span(self, name: str, start: float, seconds: float):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "offset_ms": round((start - self.start) * 1000, 2),
+                "duration_ms": round(seconds * 1000, 2),
+            })
+
+    def report(self, status: int, duration_ms: float, reason: str) -> dict:
+        statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        sql = []
+        for n, (text, (count, total, longest, parameters)) in enumerate(statements):
+            entry = {
+                "sql": " ".join(text.split()),
+                "count": count,
+                "total_ms": round(total * 1000, 2),
+                "max_ms": round(longest * 1000, 2),
+            }
+            if n < EXPLAIN_LIMIT:
+                entry["plan"] = _explain(self.course_id, text, parameters)
+            sql.append(entry)
+        return {
+            "id": next(_report_ids),
+            "reason": reason,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "course_id": self.course_id,
+            "status": status,
+            "started_at": self.started_at,
+            "duration_ms": round(duration_ms, 2),
+            "sql_count": sum(s["count"] for s in sql),
+            "sql_ms": round(sum(s["total_ms"] for s in sql), 2),
+            "sql": sql,
+            "spans": self.spans,
+            "samples": sum(self.stacks.values()),
+            "stacks": dict(self.stacks.most_common()),
+        }
+
+
+def _explain(course_id: str, sql: str, parameters) -> Optional[list]:
+    #Plan tree as indented lines, or None for statements that have none
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    conn = database.get_connection(course_id)
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except (sqlite3.Error, ValueError) as e:
+        return [f"EXPLAIN failed: {e}"]
+    finally:
+        conn.close()
+    depth = {0: -1}
+    plan = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node_id] + detail)
+    return plan
+
+
+@contextmanager
+def span(name: str):
+    """Time a block as a named span of the current request's profile (no-op when not profiling)."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile.attach_thread()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.record_span(name, start, time.perf_counter() - start)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's time to the current request's profile."""
+
+    def execute(self, sql, parameters=()):
+        profile = _current.get()
+        if profile is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            profile.record_sql(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        profile = _current.get()
+        if profile is None:
+            return super().executemany(sql, seq_of_parameters)
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            profile.record_sql(sql, seq_of_parameters[0] if seq_of_parameters else (), time.perf_counter() - start)
+
+
+class ProfiledConnection(database.PooledConnection):
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class _Sampler:
+    """One thread that periodically records the stacks of threads serving profiled requests."""
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not _thread_profiles:
+                continue
+            frames = sys._current_frames()
+            for thread_id, profile in list(_thread_profiles.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.stacks[_fold(frame)] += 1
+
+
+sampler = _Sampler(PROFILE_INTERVAL_MS / 1000)
+
+
+def install():
+    #Pooled connections opened from now on time their statements
+    database.ShardPool.connection_factory = ProfiledConnection
+
+
+def list_reports() -> list:
+    return [
+        {key: report[key] for key in (
+            "id", "reason", "method", "path", "course_id", "status", "started_at",
+            "duration_ms", "sql_count", "sql_ms", "samples", "spans"
+        )}
+        for report in reversed(_reports)
+    ]
+
+
+def get_report(report_id: int) -> Optional[dict]:
+    for report in _reports:
+        if report["id"] == report_id:
+            return report
+    return None
+
+
+def folded_stacks(reports: list) -> str:
+    #One "frame;frame;frame count" line per stack, each rooted at its endpoint
+    lines = Counter()
+    for report in reports:
+        root = f"{report['method']} {report['path']}"
+        for stack, count in report["stacks"].items():
+            lines[f"{root};{stack}"] += count
+    return "".join(f"{stack} {count}\n" for stack, count in lines.items())
+
+
+def all_reports() -> list:
+    return list(_reports)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles sampled requests and keeps reports of sampled or slow ones.
+
+    Must run inside CourseRoutingMiddleware so the course is known.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, slow_ms: float = PROFILE_SLOW_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not (self.sample_rate > 0 or self.slow_ms > 0)
+                or scope["path"].startswith("/api/admin/profiles")):
+            await self.app(scope, receive, send)
+            return
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_ms <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        sampler.ensure_started()
+        profile = Profile(
+            scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"),
+            database.get_current_course()
+        )
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            profile.detach_threads()
+            duration_ms = (time.perf_counter() - profile.start) * 1000
+            slow = self.slow_ms > 0 and duration_ms >= self.slow_ms
+            if sampled or slow:
+                report = await run_in_threadpool(profile.report, status, duration_ms, "slow" if slow else "sampled")
+                _reports.append(report)
@@ -0,0 +1,62 @@
+"""Column projection for list endpoints.
+
+`?fields=id,title,status` or `?view=summary` narrows the SELECT itself, so
+large columns (descriptions, code pastes) are never read from the database,
+let alone serialized. Without either, endpoints return their full rows.
+"""
+from typing import Optional
+
+from fastapi import HTTPException
+
+#Output field -> SQL expression over `questions q JOIN users u JOIN categories c`
+QUESTION_COLUMNS = {
+    "id": "q.id",
+    "student_id": "q.student_id",
+    "student_name": "u.name",
+    "category_id": "q.category_id",
+    "category_name": "c.name",
+    "title": "q.title",
+    "code_snippet": "q.code_snippet",
+    "description": "q.description",
+    "status": "q.status",
+    "created_at": "q.created_at",
+    "escalate_at": "q.escalate_at",
+    "response_count": "(SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id AND r.is_visible = 1)",
+}
+
+#Enough of the description for a two-line preview and client-side search in list pages
+SUMMARY_DESCRIPTION_CHARS = 200
+
+QUESTION_VIEWS = {
+    "summary": dict(
+        {name: QUESTION_COLUMNS[name] for name in (
+            "id", "student_id", "student_name", "category_id", "category_name",
+            "title", "status", "created_at", "response_count"
+        )},
+        description=f"substr(q.description, 1, {SUMMARY_DESCRIPTION_CHARS})",
+    ),
+}
+
+
+def select_columns(columns: dict, views: dict, fields: Optional[str] = None,
+                   view: Optional[str] = None) -> Optional[str]:
+    """SQL select list for `fields` (comma-separated) or a named `view`.
+
+    Returns None when neither is given, meaning the endpoint's full columns.
+    """
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in columns]
+        if unknown or not names:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(columns)}"
+            )
+        selected = {name: columns[name] for name in names}
+    elif view:
+        if view not in views:
+            raise HTTPException(status_code=400, detail=f"Unknown view '{view}'. Available: {', '.join(views)}")
+        selected = views[view]
+    else:
+        return None
+    return ", ".join(f"{expression} as {name}" for name, expression in selected.items())
@@ -0,0 +1,318 @@
+"""Re-judge historical responses after the evaluation prompt or model changes.
+
+Streams live responses in id order, one batch at a time. Each batch is
+evaluated concurrently (a process pool for the heuristic judge, bounded
+async requests for Gemini) and the changed verdicts are written back in a
+single transaction together with the run's checkpoint, so an interrupted
+run resumes after the last committed batch without re-judging or
+double-counting anything.
+
+A changed verdict updates the response's rating, visibility and
+karma_awarded, appends a compensating karma event, moves the response
+between the helpful/unhelpful rollup counters and re-checks the question's
+escalation deadline and triage priority. Every changed rating is written to
+a CSV diff report. Archived questions are not re-judged.
+
+Usage:
+    python reevaluate.py --name prompt-v2 [--course cs101] [--workers 8] [--batch-size 200]
+                         [--rpm 60] [--report changes.csv] [--dry-run] [--restart]
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import escalation
+import judge_scheduler
+import karma
+import misconceptions
+import rollups
+import triage
+from ai_judge import GeminiJudge, get_ai_judge
+from database import get_connection
+
+DEFAULT_BATCH_SIZE = 200
+#Default concurrency: one process per core for the heuristic judge, in-flight requests for Gemini
+DEFAULT_PROCESS_WORKERS = os.cpu_count() or 4
+DEFAULT_REQUEST_WORKERS = 8
+#Requests per minute to stay under; halved whenever the API answers with a rate-limit error
+DEFAULT_RPM = float(os.getenv("REEVALUATE_RPM", "60"))
+MAX_ATTEMPTS = 5
+
+REPORT_COLUMNS = [
+    "response_id", "question_id", "responder_id",
+    "old_rating", "new_rating", "old_karma", "new_karma", "new_reason"
+]
+
+
+def _judge_args(row) -> tuple:
+    return (
+        row["question_title"], row["question_description"], row["code_snippet"] or "",
+        row["concept_involved"], row["hint_guidance"], row["what_to_try_next"] or ""
+    )
+
+
+def _verdict(evaluation) -> tuple:
+    return evaluation.rating.value, evaluation.reason, evaluation.karma_change
+
+
+def _heuristic_verdict(args: tuple) -> tuple:
+    #Runs in a worker process
+    return _verdict(GeminiJudge._mock_evaluate(*args))
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    message = str(error)
+    return getattr(error, "code", None) == 429 or "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+class RateLimiter:
+    """Spaces out request starts to stay under `rpm`.
+
+    A rate-limit error halves the rate (at most once per cooldown, since
+    requests already in flight tend to fail together); each success creeps
+    it back up towards the configured limit.
+    """
+
+    def __init__(self, rpm: float, cooldown_seconds: float = 5.0):
+        self.max_rpm = self.rpm = rpm
+        self.cooldown = cooldown_seconds
+        self._next_start = 0.0
+        self._last_throttle = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + 60 / self.rpm
+        await asyncio.sleep(start - now)
+
+    def throttled(self):
+        now = time.monotonic()
+        if now - self._last_throttle < self.cooldown:
+            return
+        self._last_throttle = now
+        self.rpm = max(self.rpm / 2, 1)
+        print(f"Rate limited, slowing down to {self.rpm:.0f} requests/minute")
+
+    def succeeded(self):
+        self.rpm = min(self.rpm + 1, self.max_rpm)
+
+
+class Evaluator:
+    """Evaluates a batch of responses with bounded concurrency."""
+
+    def __init__(self, judge: GeminiJudge, workers: Optional[int], rpm: float):
+        self.judge = judge
+        self.uses_llm = judge.client is not None
+        if self.uses_llm:
+            self.workers = workers or DEFAULT_REQUEST_WORKERS
+            self._loop = asyncio.new_event_loop()
+            self._limiter = RateLimiter(rpm)
+            self._scheduler = judge_scheduler.JudgeScheduler(max_concurrency=self.workers)
+        else:
+            self.workers = workers or DEFAULT_PROCESS_WORKERS
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def evaluate(self, rows: list) -> list:
+        #One verdict tuple per row, or the exception that made it fail
+        args = [_judge_args(row) for row in rows]
+        if self.uses_llm:
+            return self._loop.run_until_complete(self._evaluate_async(args))
+        chunksize = max(1, len(args) // (self.workers * 4))
+        return list(self._pool.map(_heuristic_verdict, args, chunksize=chunksize))
+
+    async def _evaluate_async(self, args: list) -> list:
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def evaluate_one(judge_args):
+            async with semaphore:
+                for attempt in range(MAX_ATTEMPTS):
+                    #Waits while students' submissions are queuing for the judge in the API
+                    await asyncio.to_thread(self._scheduler.acquire, judge_scheduler.REEVALUATION)
+                    try:
+                        await self._limiter.wait()
+                        verdict = _verdict(await self.judge.evaluate_response_async(*judge_args))
+                        self._limiter.succeeded()
+                        return verdict
+                    except Exception as e:
+                        if attempt == MAX_ATTEMPTS - 1:
+                            return e
+                        if _is_rate_limited(e):
+                            self._limiter.throttled()
+                    finally:
+                        self._scheduler.release()
+                    await asyncio.sleep(min(2 ** attempt, 30) + random.random())
+
+        return await asyncio.gather(*(evaluate_one(a) for a in args))
+
+    def close(self):
+        if self.uses_llm:
+            self._loop.close()
+        else:
+            self._pool.shutdown()
+
+
+def load_checkpoint(conn, name: str) -> Optional[dict]:
+    row = conn.execute("SELECT * FROM reevaluation_runs WHERE name = ?", (name,)).fetchone()
+    return dict(row) if row else None
+
+
+def _fetch_batch(conn, after_id: int, batch_size: int) -> list:
+    return conn.execute("""
+        SELECT r.id, r.question_id, r.responder_id, r.concept_involved, r.hint_guidance,
+               r.what_to_try_next, r.ai_rating, r.karma_awarded, r.created_at,
+               q.title as question_title, q.description as question_description,
+               q.code_snippet, q.category_id
+        FROM responses r
+        JOIN questions q ON r.question_id = q.id
+        WHERE r.id > ?
+        ORDER BY r.id
+        LIMIT ?
+    """, (after_id, batch_size)).fetchall()
+
+
+def _reconcile_question(conn, question_id: int):
+    #A question that gained its first helpful response stops its escalation clock, one that lost it restarts it
+    question = conn.execute("SELECT status, escalate_at FROM questions WHERE id = ?", (question_id,)).fetchone()
+    helpful = conn.execute(
+        "SELECT 1 FROM responses WHERE question_id = ? AND is_visible = 1 LIMIT 1", (question_id,)
+    ).fetchone()
+    if helpful:
+        escalation.cancel(conn, question_id)
+    elif question["status"] == "open" and question["escalate_at"] is None:
+        #Its original deadline may be long gone, so give it a full window from now
+        escalation.schedule(conn, question_id, from_now=True)
+    triage.rescore_if_queued(conn, question_id)
+
+
+def write_back(conn, name: str, rows: list, changes: list, failed: int):
+    """Apply one batch's changed verdicts and advance the checkpoint in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    questions = set()
+    for row, (rating, reason, karma_change) in changes:
+        conn.execute("""
+            UPDATE responses SET ai_rating = ?, ai_reason = ?, is_visible = ?, karma_awarded = ?
+            WHERE id = ?
+        """, (rating, reason, 1 if rating == "helpful" else 0, karma_change, row["id"]))
+        karma.record_rating_change(conn, row["id"], row["responder_id"], row["karma_awarded"], karma_change)
+        if rating != row["ai_rating"]:
+            rollups.response_rerated(conn, row["category_id"], row["created_at"], rating == "helpful")
+            questions.add(row["question_id"])
+    for question_id in questions:
+        _reconcile_question(conn, question_id)
+    conn.execute("""
+        UPDATE reevaluation_runs SET
+            last_response_id = ?, processed = processed + ?, changed = changed + ?,
+            failed = failed + ?, updated_at = CURRENT_TIMESTAMP
+        WHERE name = ?
+    """, (rows[-1]["id"], len(rows), len(changes), failed, name))
+    conn.commit()
+
+
+def _open_report(path: str, append: bool = True):
+    #Real runs append, so a resumed run keeps the rows of its earlier batches
+    new_file = not append or not os.path.exists(path)
+    f = open(path, "a" if append else "w", newline="", encoding="utf-8")
+    writer = csv.writer(f)
+    if new_file:
+        writer.writerow(REPORT_COLUMNS)
+    return f, writer
+
+
+def run(name: str, course_id: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: Optional[int] = None, rpm: float = DEFAULT_RPM, report_path: Optional[str] = None,
+        dry_run: bool = False, restart: bool = False) -> dict:
+    """Re-judge every live response, resuming run `name` if it was interrupted."""
+    conn = get_connection(course_id)
+    if restart:
+        conn.execute("DELETE FROM reevaluation_runs WHERE name = ?", (name,))
+        conn.commit()
+    checkpoint = load_checkpoint(conn, name)
+    if checkpoint and checkpoint["finished_at"] and not dry_run:
+        conn.close()
+        print(f"Run '{name}' already finished at {checkpoint['finished_at']}; use --restart to run it again")
+        return checkpoint
+    if not checkpoint and not dry_run:
+        conn.execute("INSERT INTO reevaluation_runs (name) VALUES (?)", (name,))
+        conn.commit()
+    after_id = checkpoint["last_response_id"] if checkpoint and not dry_run else 0
+
+    evaluator = Evaluator(get_ai_judge(), workers, rpm)
+    #Dry runs get a fresh report of their own, so they never mix with a real run's changes
+    default_report = f"reevaluation_{name}_dry_run.csv" if dry_run else f"reevaluation_{name}.csv"
+    report_file, report = _open_report(report_path or default_report, append=not dry_run)
+    summary = {"processed": 0, "changed": 0, "failed": 0, "to_helpful": 0, "to_unhelpful": 0, "karma_delta": 0}
+    print(f"Re-evaluating responses after id {after_id} with "
+          f"{'Gemini' if evaluator.uses_llm else 'the heuristic judge'} ({evaluator.workers} workers)")
+    try:
+        while True:
+            rows = _fetch_batch(conn, after_id, batch_size)
+            if not rows:
+                break
+            changes = []
+            failed = 0
+            for row, verdict in zip(rows, evaluator.evaluate(rows)):
+                if isinstance(verdict, Exception):
+                    #Keeps its old verdict; a later --restart run picks it up again
+                    failed += 1
+                    print(f"Response {row['id']} could not be evaluated: {verdict}")
+                    continue
+                rating, reason, karma_change = verdict
+                if rating == row["ai_rating"] and karma_change == row["karma_awarded"]:
+                    continue
+                changes.append((row, verdict))
+                report.writerow([
+                    row["id"], row["question_id"], row["responder_id"],
+                    row["ai_rating"], rating, row["karma_awarded"], karma_change, reason
+                ])
+                if rating != row["ai_rating"]:
+                    summary["to_helpful" if rating == "helpful" else "to_unhelpful"] += 1
+                summary["karma_delta"] += karma_change - row["karma_awarded"]
+            if not dry_run:
+                write_back(conn, name, rows, changes, failed)
+            report_file.flush()
+            after_id = rows[-1]["id"]
+            summary["processed"] += len(rows)
+            summary["changed"] += len(changes)
+            summary["failed"] += failed
+            print(f"{summary['processed']} responses, {summary['changed']} changed, "
+                  f"{summary['failed']} failed (last id {after_id})")
+
+        if not dry_run:
+            conn.execute(
+                "UPDATE reevaluation_runs SET finished_at = CURRENT_TIMESTAMP WHERE name = ?", (name,)
+            )
+            conn.commit()
+    finally:
+        report_file.close()
+        evaluator.close()
+        conn.close()
+
+    if summary["changed"] and not dry_run:
+        #Clusters are built incrementally from unhelpful responses, so recluster with the new verdicts
+        misconceptions.rebuild(course_id)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-judge historical responses and reconcile karma.")
+    parser.add_argument("--name", required=True, help="Run name; rerunning the same name resumes it")
+    parser.add_argument("--course", default=None, help="Course ID (default course if omitted)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes or concurrent requests")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM, help="Gemini requests per minute")
+    parser.add_argument("--report", default=None, help="CSV diff report (default reevaluation_<name>.csv, or reevaluation_<name>_dry_run.csv with --dry-run)")
+    parser.add_argument("--dry-run", action="store_true", help="Only write the report, change nothing")
+    parser.add_argument("--restart", action="store_true", help="Forget the checkpoint and start over")
+    args = parser.parse_args()
+    summary = run(
+        args.name, args.course, args.batch_size, args.workers, args.rpm,
+        args.report, args.dry_run, args.restart
+    )
+    print(summary)
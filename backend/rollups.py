@@ -0,0 +1,271 @@
+"""Hourly/daily analytics rollups per category.
+
+Every question, escalation, response and instructor answer updates one row
+per granularity (hour, day and an all-time "total") in `analytics_rollups`,
+inside the same transaction as the write itself. Resolution times are kept
+as mergeable quantile sketches (see sketches.py), so any date range is
+answered by merging a handful of day buckets plus the hour buckets at its
+edges instead of scanning raw rows.
+
+Usage:
+    python rollups.py --rebuild [--course cs101]
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from database import get_connection
+from sketches import QuantileSketch
+
+GRANULARITIES = ("hour", "day", "total")
+COUNTERS = (
+    "questions_created",
+    "questions_escalated",
+    "questions_answered",
+    "responses_created",
+    "helpful_responses",
+)
+SKETCHES = {
+    "first_helpful_sketch": "time_to_first_helpful_hours",
+    "instructor_answer_sketch": "time_to_instructor_answer_hours",
+}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    #Stored timestamps are naive UTC; convert an aware value first so its offset isn't just dropped
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def hours_between(start, end) -> float:
+    return (parse_timestamp(end) - parse_timestamp(start)).total_seconds() / 3600
+
+
+def _floor(at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _bucket_start(at: datetime, granularity: str) -> str:
+    if granularity == "total":
+        return ""
+    return _floor(at, granularity).strftime(TIMESTAMP_FORMAT)
+
+
+def record(conn, category_id: int, at, counters: Optional[dict] = None, durations: Optional[dict] = None):
+    """Add counts and durations (in hours) to every bucket containing `at`.
+
+    Runs on the caller's connection; the caller commits.
+    """
+    at = parse_timestamp(at)
+    for granularity in GRANULARITIES:
+        key = (granularity, _bucket_start(at, granularity), category_id)
+        #The insert takes the write lock, so the sketch read-modify-write below can't race
+        conn.execute("""
+            INSERT INTO analytics_rollups (granularity, bucket_start, category_id)
+            VALUES (?, ?, ?)
+            ON CONFLICT DO NOTHING
+        """, key)
+        if counters:
+            assignments = ", ".join(f"{name} = {name} + ?" for name in counters)
+            conn.execute(
+                f"UPDATE analytics_rollups SET {assignments} "
+                "WHERE granularity = ? AND bucket_start = ? AND category_id = ?",
+                list(counters.values()) + list(key)
+            )
+        if durations:
+            columns = ", ".join(durations)
+            row = conn.execute(
+                f"SELECT {columns} FROM analytics_rollups "
+                "WHERE granularity = ? AND bucket_start = ? AND category_id = ?",
+                key
+            ).fetchone()
+            updated = []
+            for column, hours in durations.items():
+                sketch = QuantileSketch.from_json(row[column])
+                sketch.add(max(hours, 0.0))
+                updated.append(sketch.to_json())
+            assignments = ", ".join(f"{column} = ?" for column in durations)
+            conn.execute(
+                f"UPDATE analytics_rollups SET {assignments} "
+                "WHERE granularity = ? AND bucket_start = ? AND category_id = ?",
+                updated + list(key)
+            )
+
+
+def question_created(conn, category_id: int, at):
+    record(conn, category_id, at, counters={"questions_created": 1})
+
+
+def question_escalated(conn, category_id: int, at):
+    record(conn, category_id, at, counters={"questions_escalated": 1})
+
+
+def response_created(conn, category_id: int, at, helpful: bool, first_helpful_after: Optional[float] = None):
+    #`first_helpful_after` is set (in hours) when this is the question's first helpful response
+    counters = {"responses_created": 1, "helpful_responses": 1 if helpful else 0}
+    durations = {"first_helpful_sketch": first_helpful_after} if first_helpful_after is not None else None
+    record(conn, category_id, at, counters=counters, durations=durations)
+
+
+def response_rerated(conn, category_id: int, at, helpful: bool):
+    #A re-evaluated response moves between helpful and unhelpful in the bucket it was created in
+    record(conn, category_id, at, counters={"helpful_responses": 1 if helpful else -1})
+
+
+def instructor_answered(conn, category_id: int, asked_at, at):
+    record(
+        conn, category_id, at,
+        counters={"questions_answered": 1},
+        durations={"instructor_answer_sketch": hours_between(asked_at, at)}
+    )
+
+
+def _empty_summary() -> dict:
+    summary = {name: 0 for name in COUNTERS}
+    summary.update({column: QuantileSketch() for column in SKETCHES})
+    return summary
+
+
+def _add_row(summary: dict, row):
+    for name in COUNTERS:
+        summary[name] += row[name]
+    for column in SKETCHES:
+        if row[column]:
+            summary[column].merge(QuantileSketch.from_json(row[column]))
+
+
+def _finish(summary: dict) -> dict:
+    result = {name: summary[name] for name in COUNTERS}
+    for column, name in SKETCHES.items():
+        sketch = summary[column]
+        result[name] = {
+            "count": sketch.count,
+            "mean": sketch.mean(),
+            "p50": sketch.quantile(0.5),
+            "p90": sketch.quantile(0.9),
+            "p99": sketch.quantile(0.99),
+        }
+    return result
+
+
+def _rows(conn, granularity: str, start: datetime, end: datetime, category_id: Optional[int]):
+    query = """
+        SELECT * FROM analytics_rollups
+        WHERE granularity = ? AND bucket_start >= ? AND bucket_start < ?
+    """
+    params = [granularity, start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)]
+    if category_id:
+        query += " AND category_id = ?"
+        params.append(category_id)
+    return conn.execute(query + " ORDER BY bucket_start", params).fetchall()
+
+
+def summarize_range(conn, start: datetime, end: datetime, category_id: Optional[int] = None) -> dict:
+    """Merge the fewest buckets covering [start, end): whole days, plus hours at the edges.
+
+    Hourly resolution: an hour bucket counts if it starts inside the range.
+    """
+    first_day = _floor(start, "day")
+    if first_day < start:
+        first_day += timedelta(days=1)
+    last_day = _floor(end, "day")
+
+    summary = _empty_summary()
+    if first_day < last_day:
+        ranges = [("hour", start, first_day), ("day", first_day, last_day), ("hour", last_day, end)]
+    else:
+        ranges = [("hour", start, end)]
+    for granularity, range_start, range_end in ranges:
+        if range_start < range_end:
+            for row in _rows(conn, granularity, range_start, range_end, category_id):
+                _add_row(summary, row)
+    return _finish(summary)
+
+
+def timeseries(conn, start: datetime, end: datetime, granularity: str = "day",
+               category_id: Optional[int] = None) -> list:
+    #One point per non-empty bucket, merged across categories unless one is given
+    points = {}
+    for row in _rows(conn, granularity, start, end, category_id):
+        _add_row(points.setdefault(row["bucket_start"], _empty_summary()), row)
+    return [dict(_finish(summary), bucket_start=bucket) for bucket, summary in sorted(points.items())]
+
+
+def category_resolution_hours(conn) -> dict:
+    #Mean time to instructor answer per category, from the all-time buckets
+    rows = conn.execute("""
+        SELECT category_id, instructor_answer_sketch FROM analytics_rollups
+        WHERE granularity = 'total' AND bucket_start = ''
+    """).fetchall()
+    return {row["category_id"]: QuantileSketch.from_json(row["instructor_answer_sketch"]).mean() for row in rows}
+
+
+def rebuild(course_id: Optional[str] = None):
+    """Recompute all rollups from the live tables.
+
+    Escalation times are not stored anywhere else, so questions_escalated is
+    only kept from the existing rollups, not rebuilt.
+    """
+    conn = get_connection(course_id)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        escalations = conn.execute("""
+            SELECT granularity, bucket_start, category_id, questions_escalated
+            FROM analytics_rollups WHERE questions_escalated > 0
+        """).fetchall()
+        conn.execute("DELETE FROM analytics_rollups")
+
+        for q in conn.execute("SELECT category_id, created_at FROM questions").fetchall():
+            question_created(conn, q["category_id"], q["created_at"])
+
+        first_helpful = {}
+        for r in conn.execute("""
+            SELECT r.id, r.question_id, r.ai_rating, r.created_at, q.category_id, q.created_at as asked_at
+            FROM responses r JOIN questions q ON r.question_id = q.id
+            ORDER BY r.id
+        """).fetchall():
+            helpful = r["ai_rating"] == "helpful"
+            after = None
+            if helpful and r["question_id"] not in first_helpful:
+                first_helpful[r["question_id"]] = r["id"]
+                after = hours_between(r["asked_at"], r["created_at"])
+            response_created(conn, r["category_id"], r["created_at"], helpful, after)
+
+        for a in conn.execute("""
+            SELECT ia.created_at, q.category_id, q.created_at as asked_at
+            FROM instructor_answers ia JOIN questions q ON ia.question_id = q.id
+        """).fetchall():
+            instructor_answered(conn, a["category_id"], a["asked_at"], a["created_at"])
+
+        for e in escalations:
+            conn.execute("""
+                INSERT INTO analytics_rollups (granularity, bucket_start, category_id, questions_escalated)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(granularity, category_id, bucket_start)
+                DO UPDATE SET questions_escalated = excluded.questions_escalated
+            """, tuple(e))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the analytics rollup tables.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute rollups from the live tables")
+    parser.add_argument("--course", default=None, help="Course ID (default course if omitted)")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild(course_id=args.course)
+        print("Rollups rebuilt")
+    else:
+        parser.print_help()
@@ -0,0 +1,125 @@
+"""Fast JSON encoding for rows read from trusted DB queries.
+
+List endpoints keep their `response_model` so the OpenAPI schema still comes
+from models.py, but instead of letting FastAPI re-validate every row dict
+against the model we encode the rows straight to JSON bytes here. The output
+matches what Pydantic would produce for the same rows.
+"""
+import json
+import os
+import types
+from datetime import datetime
+from typing import Union, get_args, get_origin
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "1") != "0"
+
+#types.UnionType (X | None) only exists on Python 3.10+
+_UNION_TYPES = (Union, getattr(types, "UnionType", Union))
+
+
+def _unwrap_optional(annotation):
+    if get_origin(annotation) in _UNION_TYPES:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _to_bool(value):
+    return None if value is None else bool(value)
+
+
+def _to_iso(value):
+    #SQLite CURRENT_TIMESTAMP gives 'YYYY-MM-DD HH:MM:SS', Pydantic emits 'T'
+    if isinstance(value, str) and len(value) > 10 and value[10] == " ":
+        return value[:10] + "T" + value[11:]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class RowEncoder:
+    """Converts DB rows to JSON-ready dicts for one Pydantic model."""
+
+    def __init__(self, model):
+        self.model = model
+        self.converters = {}
+        for name, field in model.model_fields.items():
+            annotation = _unwrap_optional(field.annotation)
+            if annotation is bool:
+                self.converters[name] = _to_bool
+            elif annotation is datetime:
+                self.converters[name] = _to_iso
+            else:
+                self.converters[name] = None
+
+    def convert(self, row) -> dict:
+        converters = self.converters
+        item = {}
+        for key in row.keys():
+            if key not in converters:
+                continue
+            convert = converters[key]
+            value = row[key]
+            item[key] = convert(value) if convert else value
+        return item
+
+
+_encoders = {}
+
+
+def get_encoder(model) -> RowEncoder:
+    encoder = _encoders.get(model)
+    if encoder is None:
+        encoder = _encoders[model] = RowEncoder(model)
+    return encoder
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_rows(rows, model, partial: bool = False):
+    """Return `rows` as a JSON response shaped like `List[model]`.
+
+    With FAST_SERIALIZATION=0 this falls back to plain dicts so FastAPI
+    validates them against the endpoint's response_model as before. Rows
+    narrowed to a few fields (`partial`) can't pass that validation, so
+    they are always encoded directly.
+    """
+    if not FAST_SERIALIZATION and not partial:
+        return [dict(row) for row in rows]
+    convert = get_encoder(model).convert
+    return Response(content=dumps([convert(row) for row in rows]), media_type="application/json")
+
+
+def json_bundle(model, **parts):
+    """Return a JSON response shaped like `model`, a bundle of rows and row lists.
+
+    Each keyword is one of the model's fields: a row, a list of rows or None.
+    Falls back to plain dicts with FAST_SERIALIZATION=0, as json_rows does.
+    """
+    bundle = {}
+    for name, part in parts.items():
+        annotation = _unwrap_optional(model.model_fields[name].annotation)
+        is_list = get_origin(annotation) is list
+        if not FAST_SERIALIZATION:
+            convert = dict
+        else:
+            convert = get_encoder(get_args(annotation)[0] if is_list else annotation).convert
+        if part is None:
+            bundle[name] = None
+        else:
+            bundle[name] = [convert(row) for row in part] if is_list else convert(part)
+    if not FAST_SERIALIZATION:
+        return bundle
+    return Response(content=dumps(bundle), media_type="application/json")
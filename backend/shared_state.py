@@ -0,0 +1,83 @@
+"""State shared between worker processes, coordinated through SQLite.
+
+Each worker keeps its own in-memory copies (the AI judge, caches), and the
+`state_versions` table acts as a change-notification log: whoever changes
+shared state bumps a version counter, and other workers notice the new
+number on their next check and reload. Settings here are global, so they are
+always read from the main database rather than the current course's shard.
+"""
+import threading
+import time
+from typing import Optional
+
+from database import DEFAULT_COURSE, get_connection
+
+#How often a worker re-reads a version counter, so hot paths don't query it every call
+VERSION_CHECK_INTERVAL_SECONDS = 1.0
+
+
+def get_config(key: str, default: Optional[str] = None) -> Optional[str]:
+    conn = get_connection(DEFAULT_COURSE)
+    row = conn.execute("SELECT value FROM shared_config WHERE key = ?", (key,)).fetchone()
+    conn.close()
+    return row["value"] if row else default
+
+
+def set_config(values: dict, version_name: Optional[str] = None) -> Optional[int]:
+    #Store settings and bump `version_name` in the same transaction
+    conn = get_connection(DEFAULT_COURSE)
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO shared_config (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        list(values.items())
+    )
+    version = _bump(cursor, version_name) if version_name else None
+    conn.commit()
+    conn.close()
+    return version
+
+
+def get_version(name: str) -> int:
+    conn = get_connection(DEFAULT_COURSE)
+    row = conn.execute("SELECT version FROM state_versions WHERE name = ?", (name,)).fetchone()
+    conn.close()
+    return row["version"] if row else 0
+
+
+def _bump(cursor, name: str) -> int:
+    cursor.execute("""
+        INSERT INTO state_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, (name,))
+    cursor.execute("SELECT version FROM state_versions WHERE name = ?", (name,))
+    return cursor.fetchone()[0]
+
+
+class VersionWatch:
+    """Tracks one version counter and reports when another process changed it."""
+
+    def __init__(self, name: str, interval: float = VERSION_CHECK_INTERVAL_SECONDS):
+        self.name = name
+        self.interval = interval
+        self.seen = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def changed(self) -> bool:
+        now = time.monotonic()
+        if self.seen is not None and now - self._checked_at < self.interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            current = get_version(self.name)
+            if current == self.seen:
+                return False
+            self.seen = current
+            return True
+
+    def mark(self, version: int):
+        #Record a version this process produced itself
+        with self._lock:
+            self.seen = version
+            self._checked_at = time.monotonic()
@@ -0,0 +1,79 @@
+"""Mergeable quantile sketch for durations.
+
+A small DDSketch-style histogram: values are counted in logarithmically sized
+bins, so any quantile comes back within RELATIVE_ACCURACY of the true value,
+and two sketches merge by adding their bin counts. That is what lets the
+analytics rollups answer percentiles for any date range by merging buckets.
+"""
+import json
+import math
+from typing import Optional
+
+RELATIVE_ACCURACY = 0.02
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+#Values at or below this (in hours, about 4 seconds) all land in the zero bin
+MIN_VALUE = 0.001
+
+
+class QuantileSketch:
+    def __init__(self, bins: Optional[dict] = None, zero_count: int = 0, count: int = 0, total: float = 0.0):
+        self.bins = bins or {}
+        self.zero_count = zero_count
+        self.count = count
+        self.total = total
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value <= MIN_VALUE:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / _LOG_GAMMA)
+        self.bins[index] = self.bins.get(index, 0) + 1
+
+    def merge(self, other: "QuantileSketch"):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                #Midpoint of the bin (gamma^(i-1), gamma^i] in relative terms
+                return 2 * _GAMMA ** index / (_GAMMA + 1)
+        return 2 * _GAMMA ** max(self.bins) / (_GAMMA + 1)
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "bins": {str(k): v for k, v in self.bins.items()},
+            "zero": self.zero_count,
+            "count": self.count,
+            "sum": self.total,
+        }, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> "QuantileSketch":
+        if not data:
+            return cls()
+        raw = json.loads(data)
+        return cls(
+            bins={int(k): v for k, v in raw["bins"].items()},
+            zero_count=raw["zero"],
+            count=raw["count"],
+            total=raw["sum"],
+        )
@@ -0,0 +1,90 @@
+"""Per-course request routing and cross-course queries.
+
+Each course has its own SQLite shard (see database.get_connection). A request
+picks its course either with an `X-Course-Id` header or by prefixing the
+usual API path, e.g. `/api/courses/cs101/questions` is served by the
+`/api/questions` endpoint against the cs101 shard. Requests without either
+use the default course in forum.db.
+"""
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from database import (
+    DEFAULT_COURSE, CourseNotFoundError,
+    get_connection, get_course_path, list_course_ids,
+    set_current_course, reset_current_course
+)
+
+COURSE_HEADER = b"x-course-id"
+_COURSE_PATH = re.compile(r"^/api/courses/([^/]+)(/.+)$")
+
+#Upper bound on shards queried at once by admin fan-out queries
+FAN_OUT_WORKERS = int(os.getenv("FAN_OUT_WORKERS", "8"))
+
+
+class CourseRoutingMiddleware:
+    """ASGI middleware that binds each request to its course shard."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        course_id = None
+        match = _COURSE_PATH.match(scope["path"])
+        if match:
+            course_id = match.group(1)
+            scope = dict(scope, path="/api" + match.group(2))
+            scope["raw_path"] = scope["path"].encode()
+        else:
+            for name, value in scope.get("headers", []):
+                if name == COURSE_HEADER:
+                    course_id = value.decode("latin-1").strip() or None
+                    break
+
+        course_id = course_id or DEFAULT_COURSE
+        try:
+            get_course_path(course_id)
+        except CourseNotFoundError:
+            await _send_json(send, 404, {"detail": f"Course '{course_id}' not found"})
+            return
+
+        token = set_current_course(course_id)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            reset_current_course(token)
+
+
+async def _send_json(send, status: int, body: dict):
+    payload = json.dumps(body).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+def fan_out(query: Callable, course_ids: Optional[List[str]] = None) -> dict:
+    """Run `query(conn)` against every course shard in parallel.
+
+    Returns a dict of course_id -> result.
+    """
+    course_ids = course_ids or list_course_ids()
+
+    def run(course_id):
+        conn = get_connection(course_id)
+        try:
+            return query(conn)
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(FAN_OUT_WORKERS, len(course_ids)))) as executor:
+        return dict(zip(course_ids, executor.map(run, course_ids)))
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import judge_scheduler
+from judge_scheduler import BULK, INTERACTIVE, REEVALUATION, JudgeRejected, JudgeScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def connect(tmp_path):
+    path = str(tmp_path / "judge.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE shared_config (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE judge_rate_buckets (user_key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+
+    def _connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return _connect
+
+
+def _queued(scheduler, priority=INTERACTIVE):
+    return scheduler.stats()["classes"][priority]["queued"]
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.01)
+
+
+def _start_waiter(scheduler, order, priority=INTERACTIVE, user=None, results=None):
+    #Acquire in a thread, record the grant, release straight away
+    def run():
+        try:
+            with scheduler.slot(priority, user=user):
+                order.append(user or priority)
+        except JudgeRejected as e:
+            if results is not None:
+                results.append(e.status_code)
+    queued = _queued(scheduler, priority)
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_until(lambda: _queued(scheduler, priority) == queued + 1 or results)
+    return thread
+
+
+def test_waiting_calls_are_interleaved_across_responders(connect):
+    scheduler = JudgeScheduler(max_concurrency=1, user_rate_per_minute=0, clock=FakeClock(), connect=connect)
+    scheduler.acquire(INTERACTIVE)
+    order = []
+    threads = [_start_waiter(scheduler, order, user="spam") for _ in range(4)]
+    threads += [_start_waiter(scheduler, order, user="a") for _ in range(2)]
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["spam", "a", "spam", "a", "spam", "spam"]
+
+
+def test_interactive_calls_go_before_lower_priorities(connect):
+    clock = FakeClock()
+    scheduler = JudgeScheduler(max_concurrency=1, user_rate_per_minute=0, clock=clock, connect=connect)
+    scheduler.acquire(INTERACTIVE)
+    order = []
+    threads = [_start_waiter(scheduler, order, priority) for priority in (BULK, REEVALUATION, INTERACTIVE)]
+    scheduler.release()
+    _wait_until(lambda: order == [INTERACTIVE])
+    #Lower priorities keep holding off for a while after interactive calls were waiting
+    time.sleep(judge_scheduler.CHECK_INTERVAL_SECONDS * 1.5)
+    assert order == [INTERACTIVE]
+    clock.advance(judge_scheduler.JUDGE_YIELD_SECONDS + 1)
+    for thread in threads:
+        thread.join()
+    assert order == [INTERACTIVE, REEVALUATION, BULK]
+
+
+def test_rate_limit_refills_over_time_and_is_shared(connect):
+    clock = FakeClock()
+    scheduler = JudgeScheduler(user_rate_per_minute=60, user_burst=2, clock=clock, connect=connect)
+    other_worker = JudgeScheduler(user_rate_per_minute=60, user_burst=2, clock=clock, connect=connect)
+    for _ in range(2):
+        with scheduler.slot(INTERACTIVE, user="c:1"):
+            pass
+    with pytest.raises(JudgeRejected) as rejected:
+        scheduler.acquire(INTERACTIVE, user="c:1")
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after == pytest.approx(1.0)
+    with pytest.raises(JudgeRejected):
+        other_worker.acquire(INTERACTIVE, user="c:1")
+
+    clock.advance(1.0)
+    with other_worker.slot(INTERACTIVE, user="c:1"):
+        pass
+    #Not limited when the caller opts out (the mock judge)
+    with scheduler.slot(INTERACTIVE, user="c:1", limit_rate=False):
+        pass
+
+
+def test_queue_full_rejection_keeps_the_token(connect):
+    scheduler = JudgeScheduler(max_concurrency=1, max_queue=1, user_rate_per_minute=60, user_burst=1,
+                               clock=FakeClock(), connect=connect)
+    scheduler.acquire(INTERACTIVE)
+    order = []
+    waiter = _start_waiter(scheduler, order)
+    with pytest.raises(JudgeRejected) as rejected:
+        scheduler.acquire(INTERACTIVE, user="c:1")
+    assert rejected.value.status_code == 503
+    scheduler.release()
+    waiter.join()
+    with scheduler.slot(INTERACTIVE, user="c:1"):
+        pass
+
+
+def test_timed_out_call_gets_its_token_back(connect):
+    clock = FakeClock()
+    scheduler = JudgeScheduler(max_concurrency=1, user_rate_per_minute=60, user_burst=1, max_wait_seconds=5,
+                               clock=clock, connect=connect)
+    scheduler.acquire(INTERACTIVE)
+    order, results = [], []
+    waiter = _start_waiter(scheduler, order, user="c:1", results=results)
+    clock.advance(6)
+    waiter.join()
+    assert results == [503]
+    assert _queued(scheduler) == 0
+    assert scheduler.stats()["classes"][INTERACTIVE]["timed_out"] == 1
+    scheduler.release()
+    with scheduler.slot(INTERACTIVE, user="c:1"):
+        pass
+
+
+def test_lower_priority_yields_to_interactive_calls_in_other_processes(connect):
+    clock = FakeClock()
+    scheduler = JudgeScheduler(max_concurrency=1, clock=clock, connect=connect)
+    conn = connect()
+    conn.execute("INSERT INTO shared_config (key, value) VALUES (?, ?)", (judge_scheduler.PRESSURE_KEY, str(clock())))
+    conn.commit()
+    conn.close()
+
+    order = []
+    waiter = _start_waiter(scheduler, order, REEVALUATION)
+    time.sleep(judge_scheduler.CHECK_INTERVAL_SECONDS * 1.5)
+    assert order == []
+    clock.advance(judge_scheduler.JUDGE_YIELD_SECONDS + 1)
+    waiter.join(timeout=5)
+    assert order == [REEVALUATION]
@@ -0,0 +1,61 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive
+import database
+import misconceptions
+import reevaluate
+from ai_judge import GeminiJudge
+
+
+def _add_question(conn, student, category, title, status, created_at):
+    return conn.execute("""
+        INSERT INTO questions (student_id, category_id, title, description, status, created_at)
+        VALUES (?, ?, ?, 'My loop never stops running.', ?, ?)
+    """, (student, category, title, status, created_at)).lastrowid
+
+
+def _add_response(conn, question_id, responder, hint, rating=None):
+    evaluation = GeminiJudge._mock_evaluate("Loop", "My loop never stops running.", "", "Loops", hint, "")
+    rating = rating or evaluation.rating.value
+    conn.execute("""
+        INSERT INTO responses
+        (question_id, responder_id, concept_involved, hint_guidance, ai_rating, ai_reason, is_visible)
+        VALUES (?, ?, 'Loops', ?, ?, ?, ?)
+    """, (question_id, responder, hint, rating, evaluation.reason, 1 if rating == "helpful" else 0))
+
+
+def _total(conn):
+    return conn.execute("SELECT COALESCE(SUM(occurrence_count), 0) FROM misconception_clusters").fetchone()[0]
+
+
+def test_reevaluation_keeps_archived_responses_in_clusters(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "forum.db"))
+    monkeypatch.setattr(database, "COURSE_DATA_DIR", str(tmp_path / "courses"))
+    monkeypatch.chdir(tmp_path)
+    database.init_database()
+    database.seed_data()
+
+    conn = database.get_connection()
+    student, responder = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'student' LIMIT 2")]
+    category = conn.execute("SELECT id FROM categories LIMIT 1").fetchone()[0]
+    closed = _add_question(conn, student, category, "old", "closed", "2024-01-01 09:00:00")
+    _add_response(conn, closed, responder, "Just google it.")
+    _add_response(conn, closed, responder, "Google it, really.")
+    live = _add_question(conn, student, category, "new", "open", "2025-06-01 09:00:00")
+    #Stored as helpful, but the judge now rates it unhelpful, so the re-evaluation changes it
+    _add_response(conn, live, responder, "Just google it please.", rating="helpful")
+    conn.commit()
+    conn.close()
+
+    misconceptions.cluster_new_responses()
+    assert archive.archive_closed_questions("2025-01-01")["responses"] == 2
+
+    summary = reevaluate.run("test", workers=1)
+    assert summary["to_unhelpful"] == 1
+
+    conn = database.get_connection()
+    assert _total(conn) == 3
+    conn.close()
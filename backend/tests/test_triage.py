@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import triage
+
+
+def test_older_question_in_busy_category_is_claimed_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "forum.db"))
+    monkeypatch.setattr(database, "COURSE_DATA_DIR", str(tmp_path / "courses"))
+    database.init_database()
+    database.seed_data()
+
+    conn = database.get_connection()
+    student = conn.execute("SELECT id FROM users WHERE role = 'student' LIMIT 1").fetchone()[0]
+    instructor = conn.execute("SELECT id FROM users WHERE role = 'instructor' LIMIT 1").fetchone()[0]
+    category = conn.execute("SELECT id FROM categories LIMIT 1").fetchone()[0]
+    ids = []
+    for title, created_at in [("older", "2025-01-01 09:00:00"), ("newer", "2025-01-01 09:10:00")]:
+        cursor = conn.execute("""
+            INSERT INTO questions (student_id, category_id, title, description, status, created_at)
+            VALUES (?, ?, ?, 'My loop never stops running.', 'escalated', ?)
+        """, (student, category, title, created_at))
+        ids.append(cursor.lastrowid)
+    #Escalated in order, so the newer one is enqueued into an already busy category
+    for question_id in ids:
+        triage.enqueue(conn, question_id)
+    conn.commit()
+    backlogs = {row[0] for row in conn.execute("SELECT category_backlog FROM triage_queue")}
+    conn.close()
+
+    assert backlogs == {1}
+    assert triage.claim_next(instructor)["id"] == ids[0]
+
+    conn = database.get_connection()
+    triage.remove(conn, ids[0])
+    conn.commit()
+    assert conn.execute("SELECT category_backlog FROM triage_queue").fetchone()[0] == 0
+    conn.close()
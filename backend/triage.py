@@ -0,0 +1,228 @@
+"""Server-side triage queue for escalated questions.
+
+Each escalated question gets a row in `triage_queue`. Its priority grows
+with wait time and is boosted by failed peer attempts and by how backed up
+its category is (the same boost for every question in the category, so
+within a category the longest-waiting question still comes first):
+
+    priority = WAIT_WEIGHT * wait_hours + ATTEMPT_WEIGHT * attempts + BACKLOG_WEIGHT * backlog
+
+Since wait time grows at the same rate for every question, ordering by
+priority is the same as ordering by a fixed `rank_key`
+(asked_at_hours - boosts / WAIT_WEIGHT), which is indexed. Instructors
+claim the top unclaimed question with a short lease that expires on its own,
+so two instructors don't pick the same question.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from database import get_connection, list_course_ids
+
+WAIT_WEIGHT = float(os.getenv("TRIAGE_WAIT_WEIGHT", "1.0"))
+ATTEMPT_WEIGHT = float(os.getenv("TRIAGE_ATTEMPT_WEIGHT", "4.0"))
+BACKLOG_WEIGHT = float(os.getenv("TRIAGE_BACKLOG_WEIGHT", "0.5"))
+DEFAULT_LEASE_SECONDS = int(os.getenv("TRIAGE_LEASE_SECONDS", "600"))
+
+_QUEUE_COLUMNS = """
+    q.*, u.name as student_name, c.name as category_name,
+    (SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id AND r.is_visible = 1) as response_count,
+    t.rank_key, t.unhelpful_attempts, t.category_backlog, t.claimed_by, t.lease_expires_at
+"""
+
+
+def _epoch(timestamp) -> float:
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _rank_key(asked_at, attempts: int, backlog: int) -> float:
+    boost = ATTEMPT_WEIGHT * attempts + BACKLOG_WEIGHT * backlog
+    return _epoch(asked_at) / 3600 - boost / WAIT_WEIGHT
+
+
+def priority_score(rank_key: float, now: Optional[float] = None) -> float:
+    return WAIT_WEIGHT * ((now or time.time()) / 3600 - rank_key)
+
+
+def enqueue(conn, question_id: int):
+    """Add or re-score an escalated question; keeps any existing claim.
+
+    Runs on the caller's connection; the caller commits.
+    """
+    question = conn.execute("""
+        SELECT q.category_id, q.created_at,
+        (SELECT COUNT(*) FROM responses r WHERE r.question_id = q.id AND r.ai_rating = 'unhelpful') as attempts
+        FROM questions q WHERE q.id = ?
+    """, (question_id,)).fetchone()
+    if not question:
+        return
+    #The backlog term is the same for every question in the category; _rescore_backlog brings it up to date
+    backlog = conn.execute(
+        "SELECT category_backlog FROM triage_queue WHERE category_id = ? LIMIT 1",
+        (question["category_id"],)
+    ).fetchone()
+    backlog = backlog[0] if backlog else 0
+    conn.execute("""
+        INSERT INTO triage_queue (question_id, category_id, rank_key, unhelpful_attempts, category_backlog)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(question_id) DO UPDATE SET
+            rank_key = excluded.rank_key,
+            unhelpful_attempts = excluded.unhelpful_attempts,
+            category_backlog = excluded.category_backlog
+    """, (
+        question_id, question["category_id"],
+        _rank_key(question["created_at"], question["attempts"], backlog),
+        question["attempts"], backlog
+    ))
+    _rescore_backlog(conn, question["category_id"])
+
+
+def _rescore_backlog(conn, category_id: int):
+    #Give every queued question in the category the same, current backlog boost
+    backlog = conn.execute(
+        "SELECT COUNT(*) FROM triage_queue WHERE category_id = ?", (category_id,)
+    ).fetchone()[0] - 1
+    conn.execute("""
+        UPDATE triage_queue SET
+            rank_key = rank_key + ? * (category_backlog - ?),
+            category_backlog = ?
+        WHERE category_id = ? AND category_backlog != ?
+    """, (BACKLOG_WEIGHT / WAIT_WEIGHT, backlog, backlog, category_id, backlog))
+
+
+def rescore_if_queued(conn, question_id: int):
+    #A new unhelpful peer attempt raises the priority of a queued question
+    if conn.execute("SELECT 1 FROM triage_queue WHERE question_id = ?", (question_id,)).fetchone():
+        enqueue(conn, question_id)
+
+
+def remove(conn, question_id: int):
+    row = conn.execute("SELECT category_id FROM triage_queue WHERE question_id = ?", (question_id,)).fetchone()
+    if not row:
+        return
+    conn.execute("DELETE FROM triage_queue WHERE question_id = ?", (question_id,))
+    _rescore_backlog(conn, row["category_id"])
+
+
+def _item(row, now: float) -> dict:
+    item = dict(row)
+    item["priority_score"] = round(priority_score(item.pop("rank_key"), now), 2)
+    expires = item["lease_expires_at"]
+    if expires is None or expires < now:
+        item["claimed_by"] = None
+        item["lease_expires_at"] = None
+    else:
+        item["lease_expires_at"] = datetime.fromtimestamp(expires, timezone.utc).replace(tzinfo=None)
+    return item
+
+
+def claim_next(instructor_id: int, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[dict]:
+    """Claim the highest-priority question nobody else holds.
+
+    An instructor who already holds a live claim gets that question back
+    (with its lease renewed) rather than a second one.
+    """
+    now = time.time()
+    conn = get_connection()
+    try:
+        #Short write transaction: an index lookup plus a one-row update
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("""
+            SELECT question_id FROM triage_queue
+            WHERE claimed_by = ? AND lease_expires_at >= ?
+            LIMIT 1
+        """, (instructor_id, now)).fetchone()
+        if not row:
+            row = conn.execute("""
+                SELECT question_id FROM triage_queue
+                WHERE claimed_by IS NULL OR lease_expires_at < ?
+                ORDER BY rank_key
+                LIMIT 1
+            """, (now,)).fetchone()
+        if not row:
+            conn.rollback()
+            return None
+        conn.execute(
+            "UPDATE triage_queue SET claimed_by = ?, lease_expires_at = ? WHERE question_id = ?",
+            (instructor_id, now + lease_seconds, row["question_id"])
+        )
+        conn.commit()
+        return get_item(conn, row["question_id"], now)
+    finally:
+        conn.close()
+
+
+def claim(question_id: int, instructor_id: int, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[dict]:
+    #Claim a specific question; None if it isn't queued or someone else holds it
+    now = time.time()
+    conn = get_connection()
+    try:
+        cursor = conn.execute("""
+            UPDATE triage_queue SET claimed_by = ?, lease_expires_at = ?
+            WHERE question_id = ? AND (claimed_by IS NULL OR claimed_by = ? OR lease_expires_at < ?)
+        """, (instructor_id, now + lease_seconds, question_id, instructor_id, now))
+        conn.commit()
+        return get_item(conn, question_id, now) if cursor.rowcount else None
+    finally:
+        conn.close()
+
+
+def release(question_id: int, instructor_id: int) -> bool:
+    conn = get_connection()
+    cursor = conn.execute("""
+        UPDATE triage_queue SET claimed_by = NULL, lease_expires_at = NULL
+        WHERE question_id = ? AND claimed_by = ?
+    """, (question_id, instructor_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+
+def get_item(conn, question_id: int, now: Optional[float] = None) -> Optional[dict]:
+    row = conn.execute(f"""
+        SELECT {_QUEUE_COLUMNS}
+        FROM triage_queue t
+        JOIN questions q ON t.question_id = q.id
+        JOIN users u ON q.student_id = u.id
+        JOIN categories c ON q.category_id = c.id
+        WHERE t.question_id = ?
+    """, (question_id,)).fetchone()
+    return _item(row, now or time.time()) if row else None
+
+
+def list_queue(limit: int = 50, offset: int = 0) -> list:
+    now = time.time()
+    conn = get_connection()
+    rows = conn.execute(f"""
+        SELECT {_QUEUE_COLUMNS}
+        FROM triage_queue t
+        JOIN questions q ON t.question_id = q.id
+        JOIN users u ON q.student_id = u.id
+        JOIN categories c ON q.category_id = c.id
+        ORDER BY t.rank_key
+        LIMIT ? OFFSET ?
+    """, (limit, offset)).fetchall()
+    conn.close()
+    return [_item(row, now) for row in rows]
+
+
+def backfill(course_id: Optional[str] = None):
+    #Queue escalated questions that predate the triage queue
+    conn = get_connection(course_id)
+    missing = conn.execute("""
+        SELECT id FROM questions
+        WHERE status = 'escalated' AND id NOT IN (SELECT question_id FROM triage_queue)
+        ORDER BY created_at
+    """).fetchall()
+    for row in missing:
+        enqueue(conn, row["id"])
+    conn.commit()
+    conn.close()
+
+
+def backfill_all_courses():
+    for course_id in list_course_ids():
+        backfill(course_id)
@@ -1,18 +1,24 @@
 import React, { useState, useEffect } from 'react';
-import { Link } from 'react-router-dom';
-import { getQuestions } from '../services/api';
+import { Link, useNavigate } from 'react-router-dom';
+import { useAuth } from '../context/AuthContext';
+import { getTriageQueue, claimNextTriage } from '../services/api';
 import { 
   AlertTriangle, 
   MessageSquare,
   User,
   Clock,
   ChevronRight,
-  Inbox
+  Inbox,
+  Lock,
+  Zap
 } from 'lucide-react';
 
 const EscalatedQuestions = () => {
+  const navigate = useNavigate();
+  const { currentUser } = useAuth();
   const [questions, setQuestions] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [claiming, setClaiming] = useState(false);
 
   useEffect(() => {
     loadEscalatedQuestions();
@@ -20,7 +26,8 @@ const EscalatedQuestions = () => {
 
   const loadEscalatedQuestions = async () => {
     try {
-      const response = await getQuestions({ status: 'escalated' });
+      // Already sorted by priority on the server
+      const response = await getTriageQueue();
       setQuestions(response.data);
     } catch (error) {
       console.error('Failed to load escalated questions:', error);
@@ -29,6 +36,25 @@ const EscalatedQuestions = () => {
     }
   };
 
+  const handleClaimNext = async () => {
+    setClaiming(true);
+    try {
+      const response = await claimNextTriage(currentUser.id);
+      if (response.data) {
+        navigate(`/instructor/questions/${response.data.id}`);
+      } else {
+        loadEscalatedQuestions();
+      }
+    } catch (error) {
+      console.error('Failed to claim question:', error);
+    } finally {
+      setClaiming(false);
+    }
+  };
+
+  const isClaimedByOther = (question) => 
+    question.claimed_by && question.claimed_by !== currentUser?.id;
+
   const formatDate = (dateString) => {
     const date = new Date(dateString);
     const now = new Date();
@@ -62,14 +88,24 @@ const EscalatedQuestions = () => {
 
   return (
     <div className="max-w-4xl mx-auto">
-      <div className="mb-6">
-        <h1 className="text-2xl font-bold text-gray-900 flex items-center">
-          <AlertTriangle className="w-6 h-6 mr-2 text-yellow-500" />
-          Escalated Questions
-        </h1>
-        <p className="text-gray-500 mt-1">
-          Questions that need instructor attention
-        </p>
+      <div className="mb-6 flex items-start justify-between">
+        <div>
+          <h1 className="text-2xl font-bold text-gray-900 flex items-center">
+            <AlertTriangle className="w-6 h-6 mr-2 text-yellow-500" />
+            Escalated Questions
+          </h1>
+          <p className="text-gray-500 mt-1">
+            Questions that need instructor attention, most urgent first
+          </p>
+        </div>
+        <button
+          onClick={handleClaimNext}
+          disabled={claiming || questions.length === 0}
+          className="flex items-center px-4 py-2 bg-purple-600 text-white text-sm rounded-lg hover:bg-purple-700 transition-colors disabled:opacity-50"
+        >
+          <Zap className="w-4 h-4 mr-1.5" />
+          {claiming ? 'Claiming...' : 'Take next question'}
+        </button>
       </div>
 
       {/* Info Banner */}
@@ -127,6 +163,12 @@ const EscalatedQuestions = () => {
                       <AlertTriangle className="w-3 h-3 mr-1" />
                       Needs Response
                     </span>
+                    {isClaimedByOther(question) && (
+                      <span className="flex items-center text-xs text-gray-600 bg-gray-100 px-2 py-1 rounded-full">
+                        <Lock className="w-3 h-3 mr-1" />
+                        Being answered by another instructor
+                      </span>
+                    )}
                   </div>
                   <h3 className="font-semibold text-gray-900 mb-2">
                     {question.title}
@@ -22,17 +22,21 @@ const InstructorQuestions = () => {
   const [selectedStatus, setSelectedStatus] = useState('');
 
   useEffect(() => {
-    loadData();
+    getCategories()
+      .then(res => setCategories(res.data))
+      .catch(error => console.error('Failed to load categories:', error));
   }, []);
 
-  const loadData = async () => {
+  // Search runs on the server against full descriptions (the summary view only has the first 200 characters)
+  useEffect(() => {
+    const timer = setTimeout(() => loadQuestions(searchTerm.trim()), searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  const loadQuestions = async (search) => {
     try {
-      const [questionsRes, categoriesRes] = await Promise.all([
-        getQuestions(),
-        getCategories()
-      ]);
-      setQuestions(questionsRes.data);
-      setCategories(categoriesRes.data);
+      const res = await getQuestions({ ...{ view: 'summary' }, ...(search && { search }) });
+      setQuestions(res.data);
     } catch (error) {
       console.error('Failed to load questions:', error);
     } finally {
@@ -41,12 +45,9 @@ const InstructorQuestions = () => {
   };
 
   const filteredQuestions = questions.filter(q => {
-    const matchesSearch = q.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                          q.description.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                          q.student_name?.toLowerCase().includes(searchTerm.toLowerCase());
     const matchesCategory = !selectedCategory || q.category_id === parseInt(selectedCategory);
     const matchesStatus = !selectedStatus || q.status === selectedStatus;
-    return matchesSearch && matchesCategory && matchesStatus;
+    return matchesCategory && matchesStatus;
   });
 
   const getStatusIcon = (status) => {
@@ -1,7 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import { createQuestion, getCategories } from '../services/api';
+import { createQuestion, getCategories, newIdempotencyKey, isFinalResult } from '../services/api';
 import { HelpCircle, Code, FileText, Tag, Send, ArrowLeft } from 'lucide-react';
 
 const NewQuestion = () => {
@@ -16,6 +16,8 @@ const NewQuestion = () => {
     description: ''
   });
   const [errors, setErrors] = useState({});
+  // Reused when the user retries after a network error, so the question is only posted once
+  const idempotencyKey = useRef(newIdempotencyKey());
 
   useEffect(() => {
     loadCategories();
@@ -53,11 +55,12 @@ const NewQuestion = () => {
         category_id: parseInt(formData.category_id),
         code_snippet: formData.code_snippet.trim() || null,
         description: formData.description.trim()
-      }, currentUser.id);
+      }, currentUser.id, idempotencyKey.current);
       
       navigate(`/student/questions/${response.data.id}`);
     } catch (error) {
       console.error('Failed to create question:', error);
+      if (isFinalResult(error)) idempotencyKey.current = newIdempotencyKey();
       alert('Failed to post question. Please try again.');
     } finally {
       setLoading(false);
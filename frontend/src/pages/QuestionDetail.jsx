@@ -1,13 +1,13 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { 
-  getQuestion, 
-  getResponses, 
+  getQuestionBundle, 
   createResponse, 
   escalateQuestion,
-  getInstructorAnswer,
-  createInstructorAnswer
+  createInstructorAnswer,
+  newIdempotencyKey,
+  isFinalResult
 } from '../services/api';
 import { 
   ArrowLeft, 
@@ -41,6 +41,9 @@ const QuestionDetail = ({ isInstructor = false }) => {
   });
   const [instructorResponse, setInstructorResponse] = useState('');
   const [aiResult, setAiResult] = useState(null);
+  // Reused when the user retries after a network error, so nothing is posted (or rated) twice
+  const responseKey = useRef(newIdempotencyKey());
+  const answerKey = useRef(newIdempotencyKey());
 
   useEffect(() => {
     loadData();
@@ -48,14 +51,10 @@ const QuestionDetail = ({ isInstructor = false }) => {
 
   const loadData = async () => {
     try {
-      const [questionRes, responsesRes, instructorAnswerRes] = await Promise.all([
-        getQuestion(id),
-        getResponses(id, isInstructor),
-        getInstructorAnswer(id)
-      ]);
-      setQuestion(questionRes.data);
-      setResponses(responsesRes.data);
-      setInstructorAnswer(instructorAnswerRes.data);
+      const { data } = await getQuestionBundle(id, isInstructor);
+      setQuestion(data.question);
+      setResponses(data.responses);
+      setInstructorAnswer(data.instructor_answer);
     } catch (error) {
       console.error('Failed to load question:', error);
     } finally {
@@ -79,9 +78,10 @@ const QuestionDetail = ({ isInstructor = false }) => {
         concept_involved: responseForm.concept_involved.trim(),
         hint_guidance: responseForm.hint_guidance.trim(),
         what_to_try_next: responseForm.what_to_try_next.trim() || null
-      }, currentUser.id);
+      }, currentUser.id, responseKey.current);
 
       const newResponse = response.data;
+      responseKey.current = newIdempotencyKey();
       
       setAiResult({
         rating: newResponse.ai_rating,
@@ -107,7 +107,12 @@ const QuestionDetail = ({ isInstructor = false }) => {
       
     } catch (error) {
       console.error('Failed to submit response:', error);
-      alert('Failed to submit response. Please try again.');
+      if (isFinalResult(error)) responseKey.current = newIdempotencyKey();
+      if (error.response?.status === 429) {
+        alert(`You're submitting responses too quickly. Please wait ${error.response.headers['retry-after'] || 'a few'} seconds and try again.`);
+      } else {
+        alert('Failed to submit response. Please try again.');
+      }
     } finally {
       setSubmitting(false);
     }
@@ -133,13 +138,15 @@ const QuestionDetail = ({ isInstructor = false }) => {
       const response = await createInstructorAnswer({
         question_id: parseInt(id),
         content: instructorResponse.trim()
-      }, currentUser.id);
+      }, currentUser.id, answerKey.current);
       
+      answerKey.current = newIdempotencyKey();
       setInstructorAnswer(response.data);
       setQuestion(prev => ({ ...prev, status: 'closed' }));
       setInstructorResponse('');
     } catch (error) {
       console.error('Failed to submit instructor answer:', error);
+      if (isFinalResult(error)) answerKey.current = newIdempotencyKey();
     } finally {
       setSubmitting(false);
     }
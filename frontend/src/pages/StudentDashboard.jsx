@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import { getQuestions, getUserResponses, getUser } from '../services/api';
+import { getUserDashboard } from '../services/api';
 import { 
   HelpCircle, 
   MessageSquare, 
@@ -27,14 +27,10 @@ const StudentDashboard = () => {
 
   const loadData = async () => {
     try {
-      const [questionsRes, responsesRes, userRes] = await Promise.all([
-        getQuestions({ student_id: currentUser.id }),
-        getUserResponses(currentUser.id),
-        getUser(currentUser.id)
-      ]);
-      setMyQuestions(questionsRes.data);
-      setMyResponses(responsesRes.data);
-      setUserData(userRes.data);
+      const { data } = await getUserDashboard(currentUser.id);
+      setMyQuestions(data.questions);
+      setMyResponses(data.responses);
+      setUserData(data.user);
     } catch (error) {
       console.error('Failed to load dashboard data:', error);
     } finally {
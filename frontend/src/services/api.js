@@ -9,9 +9,29 @@ const api = axios.create({
   },
 });
 
+// Course selection: every following request is served from this course's database
+export const setCourse = (courseId) => {
+  if (courseId) {
+    api.defaults.headers.common['X-Course-Id'] = courseId;
+  } else {
+    delete api.defaults.headers.common['X-Course-Id'];
+  }
+};
+export const getCourses = () => api.get('/courses');
+
+// Retrying a create with the same key returns the first result instead of posting twice
+const idempotent = (idempotencyKey) =>
+  idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : {};
+export const newIdempotencyKey = () => crypto.randomUUID();
+// A request the server rejected (4xx) or completed needs a fresh key; a network, 429 or 5xx failure can reuse it
+export const isFinalResult = (error) =>
+  Boolean(error.response) && error.response.status < 500 && error.response.status !== 429;
+
 // User APIs
 export const getUsers = () => api.get('/users');
 export const getUser = (userId) => api.get(`/users/${userId}`);
+// User, their questions and their responses in one round-trip
+export const getUserDashboard = (userId) => api.get(`/users/${userId}/dashboard`);
 export const createUser = (userData) => api.post('/users', userData);
 
 // Category APIs
@@ -20,8 +40,11 @@ export const getCategories = () => api.get('/categories');
 // Question APIs
 export const getQuestions = (params = {}) => api.get('/questions', { params });
 export const getQuestion = (questionId) => api.get(`/questions/${questionId}`);
-export const createQuestion = (questionData, studentId) => 
-  api.post(`/questions?student_id=${studentId}`, questionData);
+// Question, responses and instructor answer in one round-trip
+export const getQuestionBundle = (questionId, includeHidden = false) => 
+  api.get(`/questions/${questionId}/full`, { params: { include_hidden: includeHidden } });
+export const createQuestion = (questionData, studentId, idempotencyKey) => 
+  api.post(`/questions?student_id=${studentId}`, questionData, idempotent(idempotencyKey));
 export const escalateQuestion = (questionId) => 
   api.post(`/questions/${questionId}/escalate`);
 export const updateQuestionStatus = (questionId, status) => 
@@ -30,15 +53,22 @@ export const updateQuestionStatus = (questionId, status) =>
 // Response APIs
 export const getResponses = (questionId, includeHidden = false) => 
   api.get(`/questions/${questionId}/responses`, { params: { include_hidden: includeHidden } });
-export const createResponse = (responseData, responderId) => 
-  api.post(`/responses?responder_id=${responderId}`, responseData);
+export const createResponse = (responseData, responderId, idempotencyKey) => 
+  api.post(`/responses?responder_id=${responderId}`, responseData, idempotent(idempotencyKey));
 export const getUserResponses = (userId) => api.get(`/users/${userId}/responses`);
 
 // Instructor Answer APIs
 export const getInstructorAnswer = (questionId) => 
   api.get(`/questions/${questionId}/instructor-answer`);
-export const createInstructorAnswer = (answerData, instructorId) => 
-  api.post(`/instructor-answers?instructor_id=${instructorId}`, answerData);
+export const createInstructorAnswer = (answerData, instructorId, idempotencyKey) => 
+  api.post(`/instructor-answers?instructor_id=${instructorId}`, answerData, idempotent(idempotencyKey));
+
+// Triage Queue APIs
+export const getTriageQueue = (params = {}) => api.get('/triage', { params });
+export const claimNextTriage = (instructorId) => 
+  api.get('/triage/next', { params: { instructor_id: instructorId } });
+export const releaseTriage = (questionId, instructorId) => 
+  api.post(`/triage/${questionId}/release?instructor_id=${instructorId}`);
 
 // Analytics APIs
 export const getKarmaLeaderboard = () => api.get('/analytics/karma-leaderboard');